@@ -0,0 +1,92 @@
+"""
+Split emails into chunks for embedding
+"""
+import re
+from typing import List
+
+# 'email' embeds the whole content as one chunk (the pre-chunking behaviour)
+CHUNK_STRATEGIES = ('email', 'paragraph', 'section')
+
+# MiniLM truncates at 256 word pieces; keep chunks comfortably below that
+MAX_CHUNK_WORDS = 150
+# Paragraphs shorter than this are merged into the next one
+MIN_CHUNK_WORDS = 20
+
+BLANK_LINE_PATTERN = re.compile(r'\n\s*\n')
+# "Contract Details:", "Additional Terms:" and similar heading lines
+SECTION_HEADING_PATTERN = re.compile(r'^[A-Z][^\n]{0,60}:$')
+
+
+def split_words(text: str, max_words: int) -> List[str]:
+    """Cut a block into pieces of at most max_words, keeping line breaks inside pieces"""
+    lines = text.split('\n')
+    pieces = []
+    current: List[str] = []
+    count = 0
+    for line in lines:
+        words = line.split()
+        # A single over-long line is cut on word boundaries
+        while len(words) > max_words:
+            if current:
+                pieces.append('\n'.join(current))
+                current, count = [], 0
+            pieces.append(' '.join(words[:max_words]))
+            words = words[max_words:]
+        if count + len(words) > max_words and current:
+            pieces.append('\n'.join(current))
+            current, count = [], 0
+        current.append(' '.join(words))
+        count += len(words)
+    if any(current):
+        pieces.append('\n'.join(current))
+    return pieces
+
+
+def paragraphs(body: str) -> List[str]:
+    """Blank-line separated blocks, with short ones merged forward"""
+    merged = []
+    pending = ''
+    for block in BLANK_LINE_PATTERN.split(body):
+        block = block.strip()
+        if not block:
+            continue
+        pending = f"{pending}\n{block}" if pending else block
+        if len(pending.split()) >= MIN_CHUNK_WORDS:
+            merged.append(pending)
+            pending = ''
+    if pending:
+        if merged and len(merged[-1].split()) + len(pending.split()) <= MAX_CHUNK_WORDS:
+            merged[-1] = f"{merged[-1]}\n{pending}"
+        else:
+            merged.append(pending)
+    return merged
+
+
+def sections(body: str) -> List[str]:
+    """Blocks that start at heading lines such as 'Contract Details:'"""
+    found = []
+    current: List[str] = []
+    for line in body.split('\n'):
+        if SECTION_HEADING_PATTERN.match(line.strip()) and any(part.strip() for part in current):
+            found.append('\n'.join(current).strip())
+            current = []
+        current.append(line)
+    if any(part.strip() for part in current):
+        found.append('\n'.join(current).strip())
+    return found
+
+
+def chunk_email(email, strategy: str = 'section', max_words: int = MAX_CHUNK_WORDS) -> List[str]:
+    """Texts to embed for one email, each prefixed with its subject for context"""
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Unknown chunk strategy: {strategy}")
+    if strategy == 'email':
+        return [email['content']]
+
+    blocks = paragraphs(email['body']) if strategy == 'paragraph' else sections(email['body'])
+    chunks = []
+    for block in blocks:
+        for piece in split_words(block, max_words):
+            chunks.append(f"{email['subject']}\n{piece}")
+    # Emails without a body still get one chunk, so every email stays searchable
+    return chunks or [email['content']]
@@ -0,0 +1,18 @@
+"""
+Shared test settings and fixtures for the sample mailbox that ships with the repo
+"""
+import os
+import shutil
+
+import pytest
+
+EMAILS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+CLUBS = ["Arsenal", "Chelsea", "Liverpool"]
+
+
+@pytest.fixture
+def mailbox(tmp_path):
+    """A writable copy of the sample club folders"""
+    for club in CLUBS:
+        shutil.copytree(os.path.join(EMAILS_DIRECTORY, club), tmp_path / club)
+    return str(tmp_path)
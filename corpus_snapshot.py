@@ -0,0 +1,146 @@
+"""
+Versioned binary snapshot of a parsed corpus, memory-mapped on startup
+
+A snapshot carries the corpus manifest, so an app restored from one only
+has to sync against the directory to pick up (and validate) any changes
+made since it was written.
+
+Snapshots hold pickled objects, so they live in an app-owned directory and
+never in the mailbox, where anything that delivers mail can write files.
+"""
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+from array import array
+from typing import Any, Dict, Optional, Sequence
+
+from email_corpus import EmailStore
+
+MAGIC = b'PLEMAIL\x00'
+SNAPSHOT_FORMAT = 3
+
+# Layout: MAGIC | header length (uint32) | JSON header | pickled payload | pad | float32 matrix
+HEADER_STRUCT = struct.Struct('<I')
+MATRIX_ALIGNMENT = 64
+
+# App-owned directory for snapshots and embedding caches; the environment variable overrides it
+SNAPSHOT_DIRECTORY_ENV = 'PL_EMAILS_SNAPSHOT_DIR'
+DEFAULT_SNAPSHOT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'premier_league_emails')
+
+
+class Snapshot:
+    """Parsed records, keyword index and optional embedding matrix restored from disk
+
+    ``embeddings`` is a zero-copy float32 view into the mapped file, with
+    ``embedding_ids[i]`` the document id of row ``i``. ``metadata`` holds
+    whatever settings the writer needs to check the rows are still usable.
+    """
+
+    def __init__(self, store: EmailStore, keyword_index: Any = None,
+                 embeddings=None, embedding_ids: Sequence[int] = (),
+                 metadata: Optional[Dict] = None):
+        self.store = store
+        self.keyword_index = keyword_index
+        self.embeddings = embeddings
+        self.embedding_ids = embedding_ids
+        self.metadata = metadata or {}
+
+
+def cache_directory() -> str:
+    """The app-owned directory for files derived from a mailbox, kept outside the mailbox itself"""
+    return os.environ.get(SNAPSHOT_DIRECTORY_ENV) or DEFAULT_SNAPSHOT_DIRECTORY
+
+
+def default_snapshot_path(emails_directory: str, app_name: str) -> str:
+    """The snapshot file of one app over one mailbox, in the app-owned cache directory"""
+    directory = cache_directory()
+    mailbox = hashlib.sha256(os.path.realpath(emails_directory).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, f"{app_name}-{mailbox}.snapshot")
+
+
+def save_snapshot(snapshot_path: str, store: EmailStore, keyword_index: Any = None,
+                  embeddings=None, embedding_ids: Sequence[int] = (), metadata: Optional[Dict] = None):
+    """Write the corpus to a single snapshot file, atomically
+
+    ``metadata`` must be JSON-serializable; it is stored in the header.
+    """
+    payload = pickle.dumps({
+        'store': store,
+        'keyword_index': keyword_index,
+        'embedding_ids': array('q', embedding_ids),
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    matrix_bytes = b''
+    matrix_shape = None
+    if embeddings is not None:
+        import numpy as np
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        matrix_bytes = matrix.tobytes()
+        matrix_shape = list(matrix.shape)
+
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'corpus_version': store.version,
+        'payload_length': len(payload),
+        'matrix_shape': matrix_shape,
+        'metadata': metadata or {},
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    payload_offset = len(MAGIC) + HEADER_STRUCT.size + len(header_bytes)
+    matrix_offset = payload_offset + len(payload)
+    padding = -matrix_offset % MATRIX_ALIGNMENT
+
+    directory = os.path.dirname(snapshot_path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    tmp_path = snapshot_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER_STRUCT.pack(len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+        f.write(b'\x00' * padding)
+        f.write(matrix_bytes)
+    os.replace(tmp_path, snapshot_path)
+
+
+def load_snapshot(snapshot_path: str) -> Optional[Snapshot]:
+    """Map a snapshot file, or return None if it is missing, damaged or unreadable by this code"""
+    try:
+        with open(snapshot_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        if mapped[:len(MAGIC)] != MAGIC:
+            return None
+        (header_length,) = HEADER_STRUCT.unpack_from(mapped, len(MAGIC))
+        header_offset = len(MAGIC) + HEADER_STRUCT.size
+        header = json.loads(mapped[header_offset:header_offset + header_length].decode('utf-8'))
+        if header.get('format') != SNAPSHOT_FORMAT:
+            return None
+
+        payload_offset = header_offset + header_length
+        payload_end = payload_offset + header['payload_length']
+        payload = pickle.loads(memoryview(mapped)[payload_offset:payload_end])
+
+        embeddings = None
+        if header['matrix_shape'] is not None:
+            import numpy as np
+            matrix_offset = payload_end + (-payload_end % MATRIX_ALIGNMENT)
+            rows, dimension = header['matrix_shape']
+            # The view keeps the map alive for as long as the matrix is referenced
+            embeddings = np.frombuffer(mapped, dtype=np.float32, count=rows * dimension,
+                                       offset=matrix_offset).reshape(rows, dimension)
+
+        return Snapshot(payload['store'], payload['keyword_index'], embeddings, payload['embedding_ids'],
+                        header.get('metadata'))
+    except Exception:
+        # Truncated files, short matrices and pickles of an older class layout
+        # (ImportError, TypeError, ...) all mean starting without a snapshot
+        return None
@@ -0,0 +1,448 @@
+"""
+Email corpus bookkeeping: directory manifest and incremental loading
+"""
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from fact_table import Fact, FactTable, extract_facts
+
+# Threads used to stat, read and hash files
+IO_WORKERS = 8
+
+# Emails per process-pool task; smaller loads are parsed in-process
+PARSE_CHUNK_SIZE = 256
+
+
+def content_hash(text: str) -> str:
+    """Stable key for a piece of text"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def find_email_files(emails_directory: str, clubs: Optional[Sequence[str]] = None) -> List[str]:
+    """List .msg files, either in the given club folders or anywhere below the directory"""
+    if clubs is None:
+        return sorted(glob.glob(os.path.join(emails_directory, "**/*.msg"), recursive=True))
+
+    email_files = []
+    for club in clubs:
+        club_dir = os.path.join(emails_directory, club)
+        if os.path.exists(club_dir):
+            email_files.extend(sorted(glob.glob(os.path.join(club_dir, "*.msg"))))
+    return email_files
+
+
+class EmailRecord:
+    """One parsed email, stored compactly
+
+    The full text is held once in ``content``; ``body`` is derived from an
+    offset into it. Club, filename and address strings are interned so
+    thousands of emails share a handful of string objects. Item access
+    (``record['from']``) mirrors the dicts the apps used to pass around.
+    """
+
+    __slots__ = ('file_path', 'club', 'filename', 'content', 'sender', 'to',
+                 'subject', 'date', 'body_offset')
+
+    FIELDS = ('file_path', 'club', 'filename', 'content', 'from', 'to',
+              'subject', 'date', 'body')
+
+    def __init__(self, file_path: str, content: str, sender: str = '', to: str = '',
+                 subject: str = '', date: str = '', body_offset: int = 0):
+        self.file_path = file_path
+        self.club = sys.intern(os.path.basename(os.path.dirname(file_path)))
+        self.filename = sys.intern(os.path.basename(file_path))
+        self.content = content
+        self.sender = sys.intern(sender)
+        self.to = sys.intern(to)
+        self.subject = subject
+        self.date = sys.intern(date)
+        self.body_offset = body_offset
+
+    @property
+    def body(self) -> str:
+        return self.content[self.body_offset:]
+
+    def __getitem__(self, key: str):
+        if key == 'from':
+            return self.sender
+        if key in self.FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict:
+        return {key: self[key] for key in self.FIELDS}
+
+    def __reduce__(self):
+        # Rebuild through __init__ so strings are re-interned after crossing processes
+        return (EmailRecord, (self.file_path, self.content, self.sender, self.to,
+                              self.subject, self.date, self.body_offset))
+
+
+class SearchResult:
+    """A ranked hit that references its EmailRecord instead of copying it"""
+
+    __slots__ = ('record', 'score', 'score_key', 'doc_id')
+
+    def __init__(self, record: EmailRecord, score: float, score_key: str = 'score',
+                 doc_id: Optional[int] = None):
+        self.record = record
+        self.score = score
+        self.score_key = score_key
+        self.doc_id = doc_id
+
+    def __getitem__(self, key: str):
+        if key == self.score_key:
+            return self.score
+        return self.record[key]
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def parse_email(content: str, file_path: str) -> EmailRecord:
+    """Parse email content and extract metadata"""
+    headers = {'From:': '', 'To:': '', 'Subject:': '', 'Date:': ''}
+
+    # Extract header information, tracking the character offset of each line
+    body_offset = 0
+    offset = 0
+    for i, line in enumerate(content.split('\n')):
+        for prefix in headers:
+            if line.startswith(prefix):
+                headers[prefix] = line[len(prefix):].strip()
+                break
+        else:
+            if line.strip() == '' and i > 3:  # Empty line after headers
+                body_offset = offset + len(line) + 1
+                break
+        offset += len(line) + 1
+
+    return EmailRecord(
+        file_path,
+        content,
+        sender=headers['From:'],
+        to=headers['To:'],
+        subject=headers['Subject:'],
+        date=headers['Date:'],
+        body_offset=body_offset,
+    )
+
+
+ParsedEmail = Tuple[Optional[EmailRecord], Optional[Fact], Optional[Exception]]
+
+
+def cumulative_stages(emails_directory: str, file_paths: Sequence[str]) -> List[Tuple[str, List[str]]]:
+    """(folder, files) stages that each add one top-level folder to the files before them
+
+    Syncing the stages in turn makes each club searchable as soon as its
+    own files are parsed; every stage lists all earlier files, so a sync
+    never drops what the previous stage added.
+    """
+    stages: List[Tuple[str, List[str]]] = []
+    folders: Dict[str, List[str]] = {}
+    for file_path in file_paths:
+        relative = os.path.relpath(file_path, emails_directory)
+        folder = relative.split(os.sep, 1)[0] if os.sep in relative else ''
+        folders.setdefault(folder, []).append(file_path)
+
+    files: List[str] = []
+    for folder, folder_files in folders.items():
+        files = files + folder_files
+        stages.append((folder, files))
+    return stages
+
+
+def _parse_batch(parse_fn: Callable[[str, str], EmailRecord],
+                 batch: List[Tuple[str, str]],
+                 extract_fn: Optional[Callable[[EmailRecord], Fact]] = None) -> List[ParsedEmail]:
+    """Parse (file_path, content) pairs, returning (email_data, facts, error) per item"""
+    parsed = []
+    for file_path, content in batch:
+        try:
+            email_data = parse_fn(content, file_path)
+            facts = extract_fn(email_data) if extract_fn else None
+            parsed.append((email_data, facts, None))
+        except Exception as e:
+            parsed.append((None, None, e))
+    return parsed
+
+
+def parse_emails(items: List[Tuple[str, str]],
+                 parse_fn: Callable[[str, str], EmailRecord] = parse_email,
+                 workers: Optional[int] = None,
+                 chunk_size: int = PARSE_CHUNK_SIZE,
+                 progress_fn: Optional[Callable[[int, int, str], None]] = None,
+                 extract_fn: Optional[Callable[[EmailRecord], Fact]] = None
+                 ) -> List[ParsedEmail]:
+    """Parse (file_path, content) pairs in chunks on a process pool, preserving order
+
+    parse_fn and extract_fn must be module-level functions so they can be
+    sent to worker processes; extract_fn runs on each parsed email in the
+    same worker. Loads of a single chunk are parsed in-process, where pool
+    start-up would cost more than it saves.
+    """
+    batches = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    total = len(items)
+    parsed = []
+
+    def record(batch, batch_results):
+        parsed.extend(batch_results)
+        if progress_fn and batch:
+            progress_fn(len(parsed) - 1, total, batch[-1][0])
+
+    if len(batches) <= 1 or workers == 1:
+        for batch in batches:
+            record(batch, _parse_batch(parse_fn, batch, extract_fn))
+        return parsed
+
+    # Spawned workers avoid forking a multi-threaded server process
+    context = multiprocessing.get_context('spawn')
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(_parse_batch, parse_fn, batch, extract_fn) for batch in batches]
+            for batch, future in zip(batches, futures):
+                record(batch, future.result())
+                done += 1
+    except (BrokenProcessPool, OSError):
+        # Workers could not start (e.g. no importable __main__); finish in-process
+        for batch in batches[done:]:
+            record(batch, _parse_batch(parse_fn, batch, extract_fn))
+    return parsed
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    content_hash: str
+
+
+class ManifestDiff:
+    """Files added, changed or removed relative to a manifest
+
+    ``added`` and ``changed`` map each path to the content read while
+    diffing, so callers never read a file twice.
+    """
+
+    def __init__(self):
+        self.added: Dict[str, str] = {}
+        self.changed: Dict[str, str] = {}
+        self.removed: List[str] = []
+        self.errors: Dict[str, Exception] = {}
+        self.entries: Dict[str, ManifestEntry] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+class CorpusManifest:
+    """Size, mtime and content hash of every indexed email file"""
+
+    def __init__(self, entries: Optional[Dict[str, ManifestEntry]] = None, version: int = 0):
+        self.entries: Dict[str, ManifestEntry] = dict(entries or {})
+        # Bumped whenever the indexed content changes
+        self.version = version
+
+    def diff(self, file_paths: Iterable[str], io_workers: int = IO_WORKERS) -> ManifestDiff:
+        """Compare files on disk with the manifest
+
+        Files whose size and mtime are unchanged are not opened. Files whose
+        stat changed are read and hashed (on a thread pool), and only count
+        as changed when the hash differs.
+        """
+        diff = ManifestDiff()
+        file_paths = list(file_paths)
+        seen = set(file_paths)
+
+        def inspect(file_path: str):
+            previous = self.entries.get(file_path)
+            stat = os.stat(file_path)
+            if previous and previous.size == stat.st_size and previous.mtime_ns == stat.st_mtime_ns:
+                return None, None
+
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            return ManifestEntry(stat.st_size, stat.st_mtime_ns, content_hash(content)), content
+
+        def inspect_safely(file_path: str):
+            try:
+                return inspect(file_path) + (None,)
+            except Exception as e:
+                return None, None, e
+
+        with ThreadPoolExecutor(max_workers=io_workers) as pool:
+            inspected = pool.map(inspect_safely, file_paths)
+            for file_path, (entry, content, error) in zip(file_paths, inspected):
+                if error is not None:
+                    diff.errors[file_path] = error
+                    continue
+                if entry is None:
+                    continue
+
+                previous = self.entries.get(file_path)
+                diff.entries[file_path] = entry
+                if previous is None:
+                    diff.added[file_path] = content
+                elif previous.content_hash != entry.content_hash:
+                    diff.changed[file_path] = content
+
+        diff.removed = [path for path in self.entries if path not in seen]
+        return diff
+
+    def apply(self, diff: ManifestDiff, skipped: Iterable[str] = ()):
+        """Record a diff once it has been indexed
+
+        Paths in ``skipped`` failed to index and are left out so the next
+        diff picks them up again.
+        """
+        skipped = set(skipped)
+        for path in diff.removed:
+            self.entries.pop(path, None)
+        for path, entry in diff.entries.items():
+            if path in skipped:
+                self.entries.pop(path, None)
+            else:
+                self.entries[path] = entry
+        if diff:
+            self.version += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': self.version,
+            'entries': {path: list(entry) for path, entry in self.entries.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CorpusManifest':
+        entries = {path: ManifestEntry(*entry) for path, entry in data['entries'].items()}
+        return cls(entries, data.get('version', 0))
+
+    def save(self, manifest_path: str):
+        """Write the manifest as JSON, atomically"""
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, manifest_path)
+
+    @classmethod
+    def load(cls, manifest_path: str) -> 'CorpusManifest':
+        """Read a saved manifest, or start empty if there is none"""
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+
+class SyncResult(NamedTuple):
+    added_ids: List[int]
+    removed_ids: List[int]
+    errors: Dict[str, Exception]
+
+
+class PreparedSync(NamedTuple):
+    diff: ManifestDiff
+    pending: List[Tuple[str, str]]  # (file_path, content) of added and changed files
+    parsed: List[ParsedEmail]
+
+
+class EmailStore:
+    """Parsed emails addressed by stable document ids
+
+    Document ids are positions in ``documents`` and never change; a removed
+    or replaced email leaves a ``None`` slot behind, so ids already handed to
+    keyword and vector indexes stay valid. ``emails_data`` is the list of
+    live emails and ``facts`` holds the figures extracted from each one.
+    """
+
+    def __init__(self, parse_fn: Callable[[str, str], EmailRecord] = parse_email,
+                 parse_workers: Optional[int] = None,
+                 extract_fn: Optional[Callable[[EmailRecord], Fact]] = extract_facts):
+        self.parse_fn = parse_fn
+        self.parse_workers = parse_workers
+        self.extract_fn = extract_fn
+        self.facts = FactTable()
+        self.manifest = CorpusManifest()
+        self.documents: List[Optional[EmailRecord]] = []
+        self.doc_ids: Dict[str, int] = {}
+        self.emails_data: List[EmailRecord] = []
+
+    @property
+    def version(self) -> int:
+        return self.manifest.version
+
+    def live_doc_ids(self) -> List[int]:
+        """Ids of documents that have not been removed, in id order"""
+        return [doc_id for doc_id, email in enumerate(self.documents) if email is not None]
+
+    def sync(self, file_paths: Iterable[str],
+             progress_fn: Optional[Callable[[int, int, str], None]] = None) -> SyncResult:
+        """Parse added and changed files and drop removed ones
+
+        Only files that differ from the manifest are read (on a thread pool)
+        and parsed (on a process pool for large loads). Changed files are
+        removed and re-added under a new document id.
+        """
+        return self.apply_sync(self.prepare_sync(file_paths, progress_fn))
+
+    def prepare_sync(self, file_paths: Iterable[str],
+                     progress_fn: Optional[Callable[[int, int, str], None]] = None) -> PreparedSync:
+        """Read and parse what changed without touching the store
+
+        Readers can keep searching while this runs; only apply_sync needs
+        exclusive access. At most one prepare/apply pair may be in flight:
+        callers sharing a store serialize them (SearchEngine.sync_lock).
+        """
+        diff = self.manifest.diff(file_paths)
+        pending = list(diff.added.items()) + list(diff.changed.items())
+        parsed = parse_emails(pending, self.parse_fn, workers=self.parse_workers,
+                              progress_fn=progress_fn, extract_fn=self.extract_fn)
+        return PreparedSync(diff, pending, parsed)
+
+    def apply_sync(self, prepared: PreparedSync) -> SyncResult:
+        """Swap a prepared sync into the store"""
+        diff, pending, parsed = prepared
+        errors = dict(diff.errors)
+
+        removed_ids = []
+        for file_path in diff.removed + list(diff.changed):
+            doc_id = self.doc_ids.pop(file_path, None)
+            if doc_id is not None:
+                self.documents[doc_id] = None
+                self.facts.remove(doc_id)
+                removed_ids.append(doc_id)
+
+        added_ids = []
+        for (file_path, _), (email_data, facts, error) in zip(pending, parsed):
+            if error is not None:
+                errors[file_path] = error
+                continue
+
+            doc_id = len(self.documents)
+            self.documents.append(email_data)
+            if facts is not None:
+                self.facts.append(doc_id, facts)
+            self.doc_ids[file_path] = doc_id
+            added_ids.append(doc_id)
+
+        self.manifest.apply(diff, skipped=errors)
+        if diff:
+            self.emails_data = [email for email in self.documents if email is not None]
+
+        return SyncResult(added_ids, removed_ids, errors)
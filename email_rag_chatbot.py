@@ -1,112 +1,454 @@
-import streamlit as st
 import os
-import glob
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
-import pandas as pd
-from typing import List, Dict, Tuple
-import re
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 
-class EmailRAGChatbot:
-    def __init__(self, emails_directory: str):
-        self.emails_directory = emails_directory
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.emails_data = []
+from chunking import chunk_email
+from corpus_snapshot import cache_directory, default_snapshot_path, save_snapshot
+from email_corpus import SearchResult, SyncResult
+from fact_table import Fact, format_money
+from query_cache import CachedResult, QueryCache
+from engine_runtime import BackgroundBuild, process_memory, show_build_status
+from search_engine import SearchEngine
+from search_index import reciprocal_rank_fusion
+
+# streamlit, numpy, faiss and sentence-transformers are imported where they are
+# first needed, so keyword search and tooling never pay for the ML stack
+if TYPE_CHECKING:
+    import numpy as np
+    from embedding_cache import EmbeddingCache
+    from fact_aggregates import FactAggregates
+    from query_encoder import BatchingQueryEncoder
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# Names this app's snapshot in the app-owned snapshot directory (corpus_snapshot)
+SNAPSHOT_NAME = "rag_chatbot"
+
+# 'hybrid' runs keyword and semantic search side by side and fuses their rankings
+RETRIEVAL_MODES = ('semantic', 'keyword', 'hybrid')
+RETRIEVAL_MODE_LABELS = {'semantic': 'セマンティック', 'keyword': 'キーワード (BM25)', 'hybrid': 'ハイブリッド (RRF)'}
+
+# Candidates each retriever contributes to the fused ranking
+HYBRID_CANDIDATES = 20
+
+# Chunks encoded per model call, and chunks fetched per requested email
+CHUNK_BATCH_SIZE = 64
+CHUNK_OVERFETCH = 8
+
+# Index settings, mirroring vector_index's defaults without importing faiss
+DEFAULT_NPROBE = 8
+DEFAULT_EF_SEARCH = 64
+DEFAULT_RERANK_FACTOR = 4
+
+# Queries used for the ANN recall-vs-latency report
+BENCHMARK_QUERIES = [
+    "Mohamed Salah Jr.の契約条件は？",
+    "Arsenalの選手の年俸はいくら？",
+    "Gabriel Fernandezの移籍金は？",
+    "怪我をしている選手は誰？",
+    "Chelsea academy出身の選手は？",
+]
+
+def create_shared_chatbot(emails_directory: str) -> 'EmailRAGChatbot':
+    """The chatbot main() shares across sessions through st.cache_resource"""
+    # Emails load club by club, then the model and the semantic index;
+    # keyword search covers each club as soon as it is loaded
+    return EmailRAGChatbot(emails_directory, warm_up=True)
+
+class EmailRAGChatbot(SearchEngine):
+    def __init__(self, emails_directory: str, cache_dir: str = None,
+                 index_backend: str = 'flat', nprobe: int = DEFAULT_NPROBE,
+                 ef_search: int = DEFAULT_EF_SEARCH, snapshot_path: str = None,
+                 retrieval_mode: str = 'semantic', chunk_strategy: str = 'section',
+                 rerank_factor: int = DEFAULT_RERANK_FACTOR, warm_up: bool = False):
+        # Embeddings are keyed by content hash, so every mailbox can share one cache
+        self.cache_dir = cache_dir or os.path.join(cache_directory(), "embeddings")
+        self._embedding_cache = None
+        self.index_backend = index_backend
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.rerank_factor = rerank_factor
+        self.retrieval_mode = retrieval_mode
+        self.chunk_strategy = chunk_strategy
+        # The semantic index is built on first use (or by the background build)
         self.index = None
-        self.load_emails()
-        self.create_index()
-    
-    def load_emails(self):
-        """Load all email files and extract content"""
-        email_files = glob.glob(os.path.join(self.emails_directory, "**/*.msg"), recursive=True)
+        self.index_ready = False
+        self.index_lock = threading.RLock()
+        # Written once the semantic index exists, so the snapshot carries embeddings
+        self.snapshot_pending = False
+        # The FAISS index holds chunk vectors: chunk id -> owning document id, and back
+        self.chunk_doc_ids = array('q')
+        self.doc_chunks: Dict[int, List[int]] = {}
+        # One thread per retriever for hybrid search
+        self.search_pool = ThreadPoolExecutor(max_workers=2)
         
-        for file_path in email_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Extract email metadata
-                email_data = self.parse_email(content, file_path)
-                self.emails_data.append(email_data)
-            except Exception as e:
-                st.error(f"Error loading {file_path}: {e}")
-    
-    def parse_email(self, content: str, file_path: str) -> Dict:
-        """Parse email content and extract metadata"""
-        lines = content.split('\n')
-        
-        email_data = {
-            'file_path': file_path,
-            'club': os.path.basename(os.path.dirname(file_path)),
-            'filename': os.path.basename(file_path),
-            'content': content,
-            'from': '',
-            'to': '',
-            'subject': '',
-            'date': '',
-            'body': ''
-        }
-        
-        # Extract header information
-        body_start = 0
-        for i, line in enumerate(lines):
-            if line.startswith('From:'):
-                email_data['from'] = line[5:].strip()
-            elif line.startswith('To:'):
-                email_data['to'] = line[3:].strip()
-            elif line.startswith('Subject:'):
-                email_data['subject'] = line[8:].strip()
-            elif line.startswith('Date:'):
-                email_data['date'] = line[5:].strip()
-            elif line.strip() == '' and i > 3:  # Empty line after headers
-                body_start = i + 1
-                break
-        
-        # Extract body
-        email_data['body'] = '\n'.join(lines[body_start:])
-        
-        return email_data
+        # With warm_up pages render immediately; semantic modes answer from keywords until the index is ready
+        super().__init__(emails_directory,
+                         snapshot_path=snapshot_path or default_snapshot_path(emails_directory, SNAPSHOT_NAME),
+                         background=warm_up)
+    
+    def restore(self, snapshot):
+        """Adopt the snapshot's emails plus their normalized chunk embeddings"""
+        super().restore(snapshot)
+        self._aggregates = None
+        self.snapshot_embeddings = None
+        self.snapshot_rows: Dict[int, List[int]] = {}
+        if snapshot is None or snapshot.keyword_index is None:
+            return
+        # Rows chunked another way cannot be reused; they are re-embedded from the cache
+        if snapshot.embeddings is not None and snapshot.metadata.get('chunk_strategy') == self.chunk_strategy:
+            self.snapshot_embeddings = snapshot.embeddings
+            for row, doc_id in enumerate(snapshot.embedding_ids):
+                self.snapshot_rows.setdefault(doc_id, []).append(row)
+    
+    @property
+    def model(self):
+        """The sentence embedding model, loaded on first use"""
+        from query_encoder import load_model
+        return load_model(MODEL_NAME)
+    
+    @property
+    def query_encoder(self) -> 'BatchingQueryEncoder':
+        from query_encoder import shared_query_encoder
+        return shared_query_encoder(MODEL_NAME)
+    
+    @property
+    def aggregates(self) -> 'FactAggregates':
+        """Group-by statistics over the fact table; NumPy is imported on first use"""
+        if self._aggregates is None:
+            from fact_aggregates import FactAggregates
+            self._aggregates = FactAggregates(self.store)
+        return self._aggregates
+    
+    @property
+    def embedding_cache(self) -> 'EmbeddingCache':
+        if self._embedding_cache is None:
+            from embedding_cache import EmbeddingCache
+            self._embedding_cache = EmbeddingCache(self.cache_dir, MODEL_NAME)
+        return self._embedding_cache
+    
+    def ensure_index(self):
+        """Load the model and build the semantic index if that has not happened yet"""
+        if self.index_ready:
+            return
+        # The sync lock keeps the store still while it is embedded; it is always taken before index_lock
+        with self.sync_lock, self.index_lock:
+            if self.index_ready:
+                return
+            self.create_index()
+            self.index_ready = True
+            if self.snapshot_pending:
+                try:
+                    self.save_snapshot()
+                except OSError as e:
+                    # May run on the build thread, where st calls are dropped; show_build_status reports it
+                    self.build.errors[self.snapshot_path] = e
+    
+    def report_errors(self, errors):
+        """Show files that failed to load on the page"""
+        import streamlit as st
+        for file_path, e in errors.items():
+            st.error(f"Error loading {file_path}: {e}")
+    
+    def build_index(self, build: BackgroundBuild):
+        """Background load: emails club by club (one pass over a snapshot), then the semantic index"""
+        super().build_index(build)
+        build.stage = 'semantic'
+        self.ensure_index()
     
     def create_index(self):
-        """Create FAISS index for semantic search"""
-        if not self.emails_data:
+        """Create FAISS index of chunk embeddings for semantic search"""
+        import numpy as np
+        from vector_index import build_vector_index
+        
+        self.index = None
+        self.chunk_doc_ids = array('q')
+        self.doc_chunks = {}
+        doc_ids = self.store.live_doc_ids()
+        if not doc_ids:
+            return
+        
+        embeddings, owners = self.embed_documents(doc_ids)
+        chunk_ids = self.register_chunks(owners)
+        
+        # Trains IVF centroids on a sample when the ivf backend is selected
+        self.index = build_vector_index(
+            embeddings, np.array(chunk_ids, dtype='int64'),
+            backend=self.index_backend, nprobe=self.nprobe, ef_search=self.ef_search
+        )
+    
+    def register_chunks(self, owners: List[int]) -> List[int]:
+        """Assign chunk ids to embedded rows, given the document id of each row"""
+        chunk_ids = list(range(len(self.chunk_doc_ids), len(self.chunk_doc_ids) + len(owners)))
+        self.chunk_doc_ids.extend(owners)
+        for chunk_id, doc_id in zip(chunk_ids, owners):
+            self.doc_chunks.setdefault(doc_id, []).append(chunk_id)
+        return chunk_ids
+    
+    def encode_chunks(self, texts: List[str]) -> 'np.ndarray':
+        """Encode chunk texts in large batches"""
+        return self.model.encode(texts, batch_size=CHUNK_BATCH_SIZE)
+    
+    def chunk_vectors(self, chunk_ids: List[int]) -> 'np.ndarray':
+        """Normalized float32 vectors of a few chunks, from the snapshot or the embedding cache
+
+        Quantized indexes keep no float copy of the corpus; both sources are
+        memory-mapped, so their pages are shared by every worker process.
+        """
+        import faiss
+        import numpy as np
+        
+        chunks_by_doc: Dict[int, List[str]] = {}
+        snapshot_positions, snapshot_rows = [], []
+        text_positions, texts = [], []
+        for i, chunk_id in enumerate(chunk_ids):
+            doc_id = self.chunk_doc_ids[chunk_id]
+            position = self.doc_chunks[doc_id].index(chunk_id)
+            rows = self.snapshot_rows.get(doc_id)
+            if rows:
+                snapshot_positions.append(i)
+                snapshot_rows.append(rows[position])
+                continue
+            if doc_id not in chunks_by_doc:
+                chunks_by_doc[doc_id] = chunk_email(self.store.documents[doc_id], self.chunk_strategy)
+            text_positions.append(i)
+            texts.append(chunks_by_doc[doc_id][position])
+        
+        if not texts:
+            return np.array(self.snapshot_embeddings[snapshot_rows], dtype='float32')
+        
+        encoded = self.embedding_cache.encode(texts, self.encode_chunks)
+        faiss.normalize_L2(encoded)
+        if not snapshot_rows:
+            return encoded
+        
+        vectors = np.empty((len(chunk_ids), encoded.shape[1]), dtype='float32')
+        vectors[snapshot_positions] = self.snapshot_embeddings[snapshot_rows]
+        vectors[text_positions] = encoded
+        return vectors
+    
+    def embed_documents(self, doc_ids: List[int]) -> Tuple['np.ndarray', List[int]]:
+        """L2-normalized float32 chunk embeddings of the given documents, with the document id of each row"""
+        import faiss
+        import numpy as np
+        
+        owners = []
+        snapshot_positions, snapshot_rows = [], []
+        text_positions, texts = [], []
+        for doc_id in doc_ids:
+            rows = self.snapshot_rows.get(doc_id)
+            if rows:
+                snapshot_positions.extend(range(len(owners), len(owners) + len(rows)))
+                snapshot_rows.extend(rows)
+                owners.extend([doc_id] * len(rows))
+            else:
+                chunks = chunk_email(self.store.documents[doc_id], self.chunk_strategy)
+                text_positions.extend(range(len(owners), len(owners) + len(chunks)))
+                texts.extend(chunks)
+                owners.extend([doc_id] * len(chunks))
+        
+        encoded = None
+        if texts:
+            # Every uncached chunk is encoded in one batched call; unchanged chunks come from the cache
+            encoded = self.embedding_cache.encode(texts, self.encode_chunks)
+            
+            # Normalize embeddings for cosine similarity
+            faiss.normalize_L2(encoded)
+            if not snapshot_rows:
+                return encoded, owners
+        
+        # Rows restored from the snapshot are already normalized
+        embeddings = np.empty((len(owners), self.snapshot_embeddings.shape[1]), dtype='float32')
+        embeddings[snapshot_positions] = self.snapshot_embeddings[snapshot_rows]
+        if encoded is not None:
+            embeddings[text_positions] = encoded
+        return embeddings, owners
+    
+    def save_snapshot(self):
+        """Write parsed emails and their chunk embeddings for the next cold start (raises OSError)
+
+        Before the semantic index is built the write is deferred to ensure_index,
+        so keyword-only use never loads the model just to save a snapshot.
+        """
+        with self.sync_lock, self.index_lock:
+            if not self.index_ready:
+                self.snapshot_pending = True
+                return
+            
+            doc_ids = self.store.live_doc_ids()
+            embeddings, owners = self.embed_documents(doc_ids) if doc_ids else (None, [])
+            save_snapshot(self.snapshot_path, self.store, self.keyword_index,
+                          embeddings=embeddings, embedding_ids=owners,
+                          metadata={'chunk_strategy': self.chunk_strategy})
+            self.snapshot_pending = False
+    
+    def add_to_index(self, doc_ids: List[int]):
+        """Embed emails' chunks and add them to the FAISS index"""
+        import numpy as np
+        
+        if not doc_ids:
+            return
+        if self.index is None:
+            self.create_index()
             return
         
-        # Create embeddings for email content
-        texts = [email['content'] for email in self.emails_data]
-        embeddings = self.model.encode(texts)
+        embeddings, owners = self.embed_documents(doc_ids)
+        chunk_ids = self.register_chunks(owners)
+        self.index.add_with_ids(embeddings, np.array(chunk_ids, dtype='int64'))
+    
+    def update_emails(self) -> SyncResult:
+        """Re-index only the email files added, changed or removed since the last load"""
+        # Files are parsed without blocking searches; apply_sync_result runs under the write lock
+        return self.load_emails()
+    
+    def apply_sync_result(self, result: SyncResult):
+        """Bring the keyword index, and the semantic index once built, in line with a store sync"""
+        super().apply_sync_result(result)
+        with self.index_lock:
+            if not self.index_ready:
+                # The index will be built from the synced store on first semantic query
+                return
+            
+            import numpy as np
+            from vector_index import supports_removal
+            
+            if result.removed_ids and self.index is not None:
+                if not supports_removal(self.index):
+                    # HNSW cannot delete vectors; rebuild from cached embeddings instead
+                    self.create_index()
+                    return
+                chunk_ids = [chunk_id for doc_id in result.removed_ids for chunk_id in self.doc_chunks.pop(doc_id, [])]
+                self.index.remove_ids(np.array(chunk_ids, dtype='int64'))
+            self.add_to_index(result.added_ids)
+    
+    def benchmark_index(self, queries: List[str], configs: List[Dict] = None, top_k: int = 3) -> str:
+        """Recall, latency and memory report of ANN and quantized backends against the exact flat index"""
+        from vector_index import benchmark_backends, format_benchmark
         
-        # Create FAISS index
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product similarity
+        if configs is None:
+            configs = [
+                {'backend': 'ivf', 'nprobe': 1},
+                {'backend': 'ivf', 'nprobe': DEFAULT_NPROBE},
+                {'backend': 'hnsw', 'ef_search': 16},
+                {'backend': 'hnsw', 'ef_search': DEFAULT_EF_SEARCH},
+                {'backend': 'sq8'},
+                {'backend': 'sq8', 'rerank': DEFAULT_RERANK_FACTOR},
+                {'backend': 'pq'},
+                {'backend': 'pq', 'rerank': DEFAULT_RERANK_FACTOR},
+            ]
         
-        # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(embeddings)
-        self.index.add(embeddings.astype('float32'))
+        query_embeddings = self.query_encoder.encode_many(queries)
+        with self.rw_lock.read():
+            embeddings, _ = self.embed_documents(self.store.live_doc_ids())
+        report = benchmark_backends(embeddings, query_embeddings, configs, top_k=top_k)
+        return format_benchmark(report)
     
-    def search_emails(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Search for relevant emails based on query"""
-        if not self.index:
+    def semantic_search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """(doc_id, cosine similarity) pairs, scoring each email by its best-matching chunk"""
+        from vector_index import is_quantized, rerank
+        
+        self.ensure_index()
+        if self.index is None:
             return []
         
-        # Encode query
-        query_embedding = self.model.encode([query])
-        faiss.normalize_L2(query_embedding)
+        # Encode query (cached, and batched with concurrent queries)
+        query_embedding = self.query_encoder.encode(query)
         
-        # Search
-        scores, indices = self.index.search(query_embedding.astype('float32'), top_k)
+        # Over-fetch chunks so top_k distinct emails survive the per-email max
+        depth = top_k * CHUNK_OVERFETCH
+        if is_quantized(self.index):
+            # Approximate codes pick the candidates; exact float scores order them
+            scores, indices = self.index.search(query_embedding, depth * self.rerank_factor)
+            candidates = [int(chunk_id) for chunk_id in indices[0]
+                          if chunk_id >= 0 and self.store.documents[self.chunk_doc_ids[chunk_id]] is not None]
+            hits = rerank(query_embedding, candidates, self.chunk_vectors(candidates), depth)
+        else:
+            scores, indices = self.index.search(query_embedding, depth)
+            hits = [(int(chunk_id), float(score)) for score, chunk_id in zip(scores[0], indices[0]) if chunk_id >= 0]
         
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.emails_data):
-                email = self.emails_data[idx].copy()
-                email['similarity_score'] = float(score)
-                results.append(email)
+        best: Dict[int, float] = {}
+        for chunk_id, score in hits:
+            doc_id = self.chunk_doc_ids[chunk_id]
+            # Results arrive best first, so the first chunk seen is the email's max
+            if doc_id not in best and self.store.documents[doc_id] is not None:
+                best[doc_id] = float(score)
+                if len(best) == top_k:
+                    break
+        return list(best.items())
+    
+    def keyword_search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """(doc_id, BM25 score) pairs from the keyword index"""
+        return self.keyword_index.search(query, top_k, mode='bm25')
+    
+    def search_emails(self, query: str, top_k: int = 3, mode: str = None) -> List[SearchResult]:
+        """Search for relevant emails: 'semantic', 'keyword' or fused 'hybrid' retrieval"""
+        mode = self.prepare_mode(mode)
+        with self.rw_lock.read():
+            return self.retrieve(query, top_k, mode)
+    
+    def prepare_mode(self, mode: Optional[str]) -> str:
+        """Validate a retrieval mode and build the semantic index first if the mode needs it"""
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if mode != 'keyword' and not self.index_ready and not self.build.ready:
+            # Still building in the background: answer from keywords rather than wait
+            return 'keyword'
+        # Built outside the read lock: building waits for the index lock, not for readers
+        if mode != 'keyword':
+            self.ensure_index()
+        return mode
+    
+    def retrieve(self, query: str, top_k: int, mode: str) -> List[SearchResult]:
+        """Run the retrievers for a validated mode; callers hold the read lock"""
+        if mode == 'semantic':
+            hits = self.semantic_search(query, top_k)
+        elif mode == 'keyword':
+            hits = self.keyword_search(query, top_k)
+        else:
+            # Query encoding and FAISS release the GIL, so both retrievers run
+            # concurrently and latency tracks the slower of the two
+            depth = max(top_k, HYBRID_CANDIDATES)
+            semantic = self.search_pool.submit(self.semantic_search, query, depth)
+            keyword = self.search_pool.submit(self.keyword_search, query, depth)
+            rankings = [[doc_id for doc_id, _ in future.result()] for future in (semantic, keyword)]
+            hits = reciprocal_rank_fusion(rankings, top_k)
         
-        return results
+        return [self.result(doc_id, score, 'similarity_score') for doc_id, score in hits]
     
-    def generate_answer(self, query: str, search_results: List[Dict]) -> str:
+    def answer_query(self, query: str, top_k: int = 3, mode: str = None) -> Tuple[List[SearchResult], str]:
+        """Search and answer, reusing the result of an identical query on the same corpus version"""
+        mode = self.prepare_mode(mode)
+        key = QueryCache.key(query, top_k, mode)
+        
+        with self.rw_lock.read():
+            version = self.store.version
+            cached = self.query_cache.get(key, version)
+            if cached is not None:
+                results = [self.result(doc_id, score, 'similarity_score') for doc_id, score in cached.hits]
+                return results, cached.answer
+            
+            results = self.retrieve(query, top_k, mode)
+            answer = self.generate_answer(query, results) if results else ""
+        
+        self.query_cache.put(key, version, CachedResult([(result.doc_id, result.score) for result in results], answer))
+        return results, answer
+    
+    def memory_report(self) -> Dict[str, int]:
+        """Memory of this process and the engine's main structures, in bytes"""
+        report = process_memory()
+        report['emails'] = len(self.store.emails_data)
+        report['chunks'] = len(self.chunk_doc_ids)
+        report['index_bytes'] = 0
+        if self.index is not None:
+            from vector_index import index_memory_bytes
+            report['index_bytes'] = index_memory_bytes(self.index)
+        # Memory-mapped, so shared with other processes through the page cache
+        report['snapshot_embedding_bytes'] = 0 if self.snapshot_embeddings is None else int(self.snapshot_embeddings.nbytes)
+        return report
+    
+    def generate_answer(self, query: str, search_results: List[SearchResult]) -> str:
         """Generate answer based on search results"""
         if not search_results:
             return "申し訳ございませんが、関連するメールが見つかりませんでした。"
@@ -114,6 +456,7 @@ class EmailRAGChatbot:
         # Extract relevant information from search results
         relevant_info = []
         sources = []
+        facts = []
         
         for result in search_results:
             club = result['club']
@@ -123,102 +466,82 @@ class EmailRAGChatbot:
             
             relevant_info.append(f"【{club}】{subject}\n{body}")
             sources.append(f"{club}/{filename}")
+            facts.append(self.facts_for(result))
         
         # Generate contextual answer based on query type
-        answer = self.create_contextual_answer(query, relevant_info, sources)
+        answer = self.create_contextual_answer(query, relevant_info, sources, facts)
         
         return answer
     
-    def create_contextual_answer(self, query: str, relevant_info: List[str], sources: List[str]) -> str:
+    def create_contextual_answer(self, query: str, relevant_info: List[str], sources: List[str],
+                                 facts: List[Fact]) -> str:
         """Create contextual answer based on query and email content"""
         query_lower = query.lower()
         
         # Analyze query intent
         if any(word in query_lower for word in ['契約', '年俸', '給与', 'salary', 'contract']):
-            return self.answer_contract_query(query, relevant_info, sources)
+            return self.answer_contract_query(query, facts, sources)
         elif any(word in query_lower for word in ['移籍', 'transfer', '移籍金']):
-            return self.answer_transfer_query(query, relevant_info, sources)
+            return self.answer_transfer_query(query, facts, sources)
         elif any(word in query_lower for word in ['出場', 'appearances', '試合', 'matches']):
-            return self.answer_performance_query(query, relevant_info, sources)
+            return self.answer_performance_query(query, facts, sources)
         elif any(word in query_lower for word in ['怪我', 'injury', '負傷']):
             return self.answer_injury_query(query, relevant_info, sources)
         else:
             return self.answer_general_query(query, relevant_info, sources)
     
-    def answer_contract_query(self, query: str, relevant_info: List[str], sources: List[str]) -> str:
+    def answer_contract_query(self, query: str, facts: List[Fact], sources: List[str]) -> str:
         """Answer contract-related queries"""
         answer = "契約に関する情報：\n\n"
         
-        for i, info in enumerate(relevant_info):
-            # Extract contract details
-            salary_match = re.search(r'£([\d,]+)/week|£([\d,]+) per week|Weekly Wage: £([\d,]+)', info)
-            contract_match = re.search(r'Duration: (\d+) years|Contract: (\d+) years', info)
-            bonus_matches = re.findall(r'Bonus: £([\d,]+)', info)
-            
+        for i, fact in enumerate(facts):
             answer += f"**出典: {sources[i]}**\n"
             
-            if salary_match:
-                salary = salary_match.group(1) or salary_match.group(2) or salary_match.group(3)
-                answer += f"- 週給: £{salary}\n"
+            if fact.weekly_wage is not None:
+                answer += f"- 週給: £{format_money(fact.weekly_wage)}\n"
             
-            if contract_match:
-                duration = contract_match.group(1) or contract_match.group(2)
-                answer += f"- 契約期間: {duration}年\n"
+            if fact.duration is not None:
+                answer += f"- 契約期間: {fact.duration}年\n"
             
-            if bonus_matches:
-                answer += f"- ボーナス: " + ", ".join([f"£{bonus}" for bonus in bonus_matches]) + "\n"
+            if fact.bonuses:
+                answer += f"- ボーナス: " + ", ".join([f"£{format_money(bonus)}" for bonus in fact.bonuses]) + "\n"
             
             answer += "\n"
         
         return answer
     
-    def answer_transfer_query(self, query: str, relevant_info: List[str], sources: List[str]) -> str:
+    def answer_transfer_query(self, query: str, facts: List[Fact], sources: List[str]) -> str:
         """Answer transfer-related queries"""
         answer = "移籍に関する情報：\n\n"
         
-        for i, info in enumerate(relevant_info):
-            # Extract transfer details
-            fee_match = re.search(r'Transfer Fee: £([\d,]+) million|Fee: £([\d,]+) million|€([\d,]+) million', info)
-            from_club_match = re.search(r'from ([A-Za-z\s]+)', info)
-            
+        for i, fact in enumerate(facts):
             answer += f"**出典: {sources[i]}**\n"
             
-            if fee_match:
-                fee = fee_match.group(1) or fee_match.group(2) or fee_match.group(3)
-                currency = "£" if fee_match.group(1) or fee_match.group(2) else "€"
-                answer += f"- 移籍金: {currency}{fee} million\n"
+            if fact.fee is not None:
+                answer += f"- 移籍金: {fact.currency}{format_money(fact.fee)} million\n"
             
-            if from_club_match:
-                from_club = from_club_match.group(1).strip()
-                answer += f"- 移籍元: {from_club}\n"
+            if fact.from_club:
+                answer += f"- 移籍元: {fact.from_club}\n"
             
             answer += "\n"
         
         return answer
     
-    def answer_performance_query(self, query: str, relevant_info: List[str], sources: List[str]) -> str:
+    def answer_performance_query(self, query: str, facts: List[Fact], sources: List[str]) -> str:
         """Answer performance-related queries"""
         answer = "パフォーマンス統計：\n\n"
         
-        for i, info in enumerate(relevant_info):
-            # Extract performance stats
-            appearances_match = re.search(r'(\d+) appearances', info)
-            goals_match = re.search(r'(\d+) goals', info)
-            assists_match = re.search(r'(\d+) assists', info)
-            
+        for i, fact in enumerate(facts):
             answer += f"**出典: {sources[i]}**\n"
             
-            if appearances_match:
-                appearances = appearances_match.group(1)
-                answer += f"- 出場試合数: {appearances}試合\n"
+            if fact.appearances is not None:
+                answer += f"- 出場試合数: {fact.appearances}試合\n"
             
-            if goals_match:
-                goals = goals_match.group(1)
-                answer += f"- ゴール数: {goals}ゴール\n"
+            if fact.goals is not None:
+                answer += f"- ゴール数: {fact.goals}ゴール\n"
             
-            if assists_match:
-                assists = assists_match.group(1)
-                answer += f"- アシスト数: {assists}アシスト\n"
+            if fact.assists is not None:
+                answer += f"- アシスト数: {fact.assists}アシスト\n"
             
             answer += "\n"
         
@@ -255,6 +578,8 @@ class EmailRAGChatbot:
         return answer
 
 def main():
+    import streamlit as st
+    
     st.set_page_config(
         page_title="プレミアリーグ メール検索チャットボット",
         page_icon="⚽",
@@ -264,12 +589,11 @@ def main():
     st.title("⚽ プレミアリーグ メール検索チャットボット")
     st.markdown("2040年のプレミアリーグクラブのメールから選手の契約情報を検索できます")
     
-    # Initialize chatbot
-    if 'chatbot' not in st.session_state:
-        with st.spinner("メールデータを読み込み中..."):
-            emails_dir = "/root/Desktop/premier_league_emails_2040"
-            st.session_state.chatbot = EmailRAGChatbot(emails_dir)
-            st.success(f"{len(st.session_state.chatbot.emails_data)}通のメールを読み込みました")
+    # Initialize chatbot (shared by every session in this process); emails and the index load in the background
+    emails_dir = "/root/Desktop/premier_league_emails_2040"
+    # st.cache_resource outlives reruns, which re-execute this script and reset its globals
+    chatbot = st.cache_resource(create_shared_chatbot)(emails_dir)
+    show_build_status(chatbot.build, len(chatbot.emails_data))
     
     # Chat interface
     st.subheader("質問を入力してください")
@@ -285,16 +609,17 @@ def main():
         """)
     
     user_query = st.text_input("質問:", placeholder="例: Mohamed Salah Jr.の契約内容を教えて")
+    retrieval_mode = st.radio("検索モード", RETRIEVAL_MODES, index=RETRIEVAL_MODES.index('hybrid'),
+                              format_func=RETRIEVAL_MODE_LABELS.get, horizontal=True)
     
     if user_query:
+        if chatbot.prepare_mode(retrieval_mode) != retrieval_mode:
+            st.info("意味検索インデックスを構築中のため、キーワード検索の結果を表示しています")
         with st.spinner("検索中..."):
-            # Search for relevant emails
-            search_results = st.session_state.chatbot.search_emails(user_query, top_k=3)
+            # Search and generate the answer, or reuse a cached result
+            search_results, answer = chatbot.answer_query(user_query, top_k=3, mode=retrieval_mode)
             
             if search_results:
-                # Generate answer
-                answer = st.session_state.chatbot.generate_answer(user_query, search_results)
-                
                 # Display answer
                 st.subheader("回答")
                 st.markdown(answer)
@@ -302,7 +627,7 @@ def main():
                 # Display source emails
                 st.subheader("参照したメール")
                 for result in search_results:
-                    with st.expander(f"{result['club']} - {result['subject']} (類似度: {result['similarity_score']:.3f})"):
+                    with st.expander(f"{result['club']} - {result['subject']} (スコア: {result['similarity_score']:.3f})"):
                         st.text(f"送信者: {result['from']}")
                         st.text(f"宛先: {result['to']}")
                         st.text(f"日付: {result['date']}")
@@ -315,17 +640,37 @@ def main():
     # Statistics
     with st.sidebar:
         st.subheader("統計情報")
-        if 'chatbot' in st.session_state:
-            total_emails = len(st.session_state.chatbot.emails_data)
-            clubs = list(set([email['club'] for email in st.session_state.chatbot.emails_data]))
-            
-            st.metric("総メール数", total_emails)
-            st.metric("クラブ数", len(clubs))
-            
-            st.subheader("対象クラブ")
-            for club in sorted(clubs):
-                club_emails = len([e for e in st.session_state.chatbot.emails_data if e['club'] == club])
-                st.text(f"{club}: {club_emails}通")
+        # The background build may be swapping in a club's emails
+        with chatbot.rw_lock.read():
+            total_emails = len(chatbot.emails_data)
+            club_counts = chatbot.aggregates.aggregate('club')
+        
+        st.metric("総メール数", total_emails)
+        st.metric("クラブ数", len(club_counts))
+        
+        if st.button("新着メールを取り込む", disabled=not chatbot.build.ready):
+            result = chatbot.update_emails()
+            if result.added_ids or result.removed_ids:
+                try:
+                    chatbot.save_snapshot()
+                except OSError as e:
+                    chatbot.report_errors({chatbot.snapshot_path: e})
+            st.info(f"追加・更新 {len(result.added_ids)}通 / 削除 {len(result.removed_ids)}通")
+        
+        st.subheader("対象クラブ")
+        for club, club_emails in club_counts.items():
+            st.text(f"{club}: {club_emails:g}通")
+        
+        if st.button("ANNインデックスのベンチマーク", disabled=not chatbot.build.ready):
+            with st.spinner("ベンチマーク中..."):
+                st.markdown(chatbot.benchmark_index(BENCHMARK_QUERIES))
+        
+        st.subheader("メモリ使用量 (このプロセス)")
+        memory = chatbot.memory_report()
+        st.text(f"PID {memory['pid']}: RSS {memory['rss_bytes'] / 2**20:.1f} MB "
+                f"(ピーク {memory['peak_rss_bytes'] / 2**20:.1f} MB)")
+        st.text(f"ベクトルインデックス: {memory['index_bytes'] / 2**20:.2f} MB ({memory['chunks']}チャンク)")
+        st.text(f"スナップショット埋め込み (共有mmap): {memory['snapshot_embedding_bytes'] / 2**20:.2f} MB")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
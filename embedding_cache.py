@@ -0,0 +1,149 @@
+"""
+Content-hash keyed embedding cache stored on disk
+"""
+import json
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from email_corpus import content_hash
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends are not serialized between processes
+    fcntl = None
+
+
+class EmbeddingCache:
+    """Embeddings keyed by content hash, kept as a memory-mapped float32 matrix
+
+    The cache is two files per model: ``<model>.f32`` holds the raw row-major
+    float32 matrix and ``<model>.keys.json`` lists the content hash of each row.
+    Rows are only ever appended, so unchanged emails are never re-encoded.
+    Processes sharing ``cache_dir`` append under an exclusive lock on
+    ``<model>.lock`` and re-read the key table first, so each row is written
+    once, at the end of the matrix, under the key it was encoded for.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        self.cache_dir = cache_dir
+        self.matrix_path = os.path.join(cache_dir, f"{model_name}.f32")
+        self.keys_path = os.path.join(cache_dir, f"{model_name}.keys.json")
+        self.lock_path = os.path.join(cache_dir, f"{model_name}.lock")
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.dimension: Optional[int] = None
+        self.matrix: Optional[np.memmap] = None
+        self.load()
+
+    def load(self):
+        """Map the cached matrix, discarding the cache if it is inconsistent"""
+        if not os.path.exists(self.keys_path) or not os.path.exists(self.matrix_path):
+            return
+
+        try:
+            with open(self.keys_path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            keys = table['keys']
+            dimension = table['dimension']
+        except (OSError, ValueError, KeyError):
+            return
+
+        expected_bytes = len(keys) * dimension * 4
+        if os.path.getsize(self.matrix_path) < expected_bytes:
+            return
+
+        self.keys = keys
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self.dimension = dimension
+        self._map_matrix()
+
+    def _map_matrix(self):
+        if self.keys:
+            self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r',
+                                    shape=(len(self.keys), self.dimension))
+        else:
+            self.matrix = None
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return float32 embeddings for texts, encoding only cache misses"""
+        hashes = [content_hash(text) for text in texts]
+        if not hashes:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+
+        missing = {}
+        for text, key in zip(texts, hashes):
+            if key not in self.rows and key not in missing:
+                missing[key] = text
+
+        if missing:
+            new_embeddings = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            self.append(list(missing.keys()), new_embeddings)
+
+        # Fancy indexing copies out of the read-only map, so callers may
+        # normalize the result in place
+        return np.array(self.matrix[[self.rows[key] for key in hashes]], dtype=np.float32)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the cache's file lock, excluding appends from other processes"""
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        with open(self.lock_path, 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, keys: List[str], embeddings: np.ndarray):
+        """Append rows for new keys and persist the key table"""
+        with self._locked():
+            # Another process may have appended since this one last looked
+            self.keys, self.rows, self.dimension, self.matrix = [], {}, None, None
+            self.load()
+
+            if self.dimension is None:
+                self.dimension = embeddings.shape[1]
+            elif embeddings.shape[1] != self.dimension:
+                self._map_matrix()
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match cache dimension {self.dimension}"
+                )
+
+            # Keys the other process already stored keep its rows
+            fresh, seen = [], set(self.rows)
+            for i, key in enumerate(keys):
+                if key not in seen:
+                    seen.add(key)
+                    fresh.append(i)
+            if not fresh:
+                self._map_matrix()
+                return
+            keys = [keys[i] for i in fresh]
+            embeddings = embeddings[fresh]
+
+            # Drop the map before growing the file underneath it
+            self.matrix = None
+            mode = 'r+b' if os.path.exists(self.matrix_path) else 'wb'
+            with open(self.matrix_path, mode) as f:
+                # Overwrite any rows a previous run wrote without recording their keys
+                f.seek(len(self.keys) * self.dimension * 4)
+                f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+                f.truncate()
+
+            for key in keys:
+                self.rows[key] = len(self.keys)
+                self.keys.append(key)
+
+            # Write the key table atomically, after the rows it refers to
+            tmp_path = self.keys_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'dimension': self.dimension, 'keys': self.keys}, f)
+            os.replace(tmp_path, self.keys_path)
+
+            self._map_matrix()
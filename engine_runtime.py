@@ -0,0 +1,212 @@
+"""
+Process-level helpers for search engines shared across Streamlit sessions
+"""
+import ctypes
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from email_corpus import EmailStore, SyncResult
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer
+
+    Searches take the read side and run in parallel; syncing new emails
+    takes the write side and waits for in-flight searches to finish.
+    Waiting writers block new readers, so a steady query stream cannot
+    starve an update.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class BackgroundBuild:
+    """Readiness of an engine whose index is built on a daemon thread
+
+    Pages render straight away and poll ``state``, ``done``/``total`` and
+    ``ready_parts`` (the clubs searchable so far) instead of waiting on the
+    build. Errors that would have been shown during loading are kept in
+    ``errors`` for the page to display.
+    """
+
+    BUILDING = 'building'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self, name: str = 'index-build'):
+        self.name = name
+        self.state = self.BUILDING
+        self.stage = ''
+        self.done = 0
+        self.total = 0
+        self.ready_parts: List[str] = []
+        self.errors: Dict[str, Exception] = {}
+        self.finished = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self, build_fn: Callable[['BackgroundBuild'], None]) -> 'BackgroundBuild':
+        def run():
+            try:
+                build_fn(self)
+                self.state = self.READY
+            except Exception as e:
+                self.errors[self.name] = e
+                self.state = self.FAILED
+            finally:
+                self.finished.set()
+
+        self.thread = threading.Thread(target=run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def mark_ready(self, ready_parts: Sequence[str] = ()) -> 'BackgroundBuild':
+        """Record a build that already ran on the calling thread"""
+        self.ready_parts = list(ready_parts)
+        self.done = self.total
+        self.state = self.READY
+        self.finished.set()
+        return self
+
+    @property
+    def ready(self) -> bool:
+        return self.state == self.READY
+
+    @property
+    def fraction(self) -> float:
+        if self.ready or not self.total:
+            return 1.0 if self.ready else 0.0
+        return min(self.done / self.total, 1.0)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the build finishes; False on timeout"""
+        return self.finished.wait(timeout)
+
+
+def sync_in_stages(build: BackgroundBuild, store: EmailStore, stages: Sequence[Tuple[str, Sequence[str]]],
+                   rw_lock: ReadWriteLock, apply_fn: Callable[[SyncResult], None]) -> List[SyncResult]:
+    """Sync a store stage by stage, publishing each stage as soon as it is parsed
+
+    Files are read and parsed without any lock held; only swapping the
+    parsed emails in (and ``apply_fn`` updating the indexes built on the
+    store) takes the write lock, so searches keep running throughout.
+    """
+    results = []
+    build.total = len(stages[-1][1]) if stages else 0
+    for part, file_paths in stages:
+        build.stage = part
+        offset = build.done
+
+        def progress(i: int, total_files: int, file_path: str):
+            build.done = offset + i + 1
+
+        prepared = store.prepare_sync(file_paths, progress_fn=progress)
+        with rw_lock.write():
+            result = store.apply_sync(prepared)
+            apply_fn(result)
+        build.errors.update(result.errors)
+        if part and part not in build.ready_parts:
+            build.ready_parts.append(part)
+        results.append(result)
+    build.done = build.total
+    return results
+
+
+def show_build_status(build: BackgroundBuild, email_count: int):
+    """Loading banner: progress while the build runs, the email count once it is ready"""
+    import streamlit as st
+
+    if build.ready:
+        st.success(f"✅ {email_count}通のメールを読み込みました")
+    elif build.state == BackgroundBuild.FAILED:
+        st.error(f"インデックスの構築に失敗しました: {build.errors.get(build.name)}")
+    else:
+        searchable = "、".join(build.ready_parts) or "なし"
+        st.progress(build.fraction, text=f"📧 インデックス構築中... {build.done}/{build.total}通 "
+                                         f"(検索対象: {searchable})")
+        # Any interaction reruns the page; this one just refreshes the progress
+        st.button("🔄 進捗を更新")
+
+    for file_path, e in build.errors.items():
+        if file_path != build.name:
+            st.error(f"Error loading {file_path}: {e}")
+
+
+def _windows_memory() -> Tuple[int, int]:
+    """(working set, peak working set) in bytes from GetProcessMemoryInfo"""
+    size_t = ctypes.c_size_t
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', ctypes.c_uint32), ('PageFaultCount', ctypes.c_uint32),
+                    ('PeakWorkingSetSize', size_t), ('WorkingSetSize', size_t),
+                    ('QuotaPeakPagedPoolUsage', size_t), ('QuotaPagedPoolUsage', size_t),
+                    ('QuotaPeakNonPagedPoolUsage', size_t), ('QuotaNonPagedPoolUsage', size_t),
+                    ('PagefileUsage', size_t), ('PeakPagefileUsage', size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        raise OSError('GetProcessMemoryInfo failed')
+    return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+
+def process_memory() -> Dict[str, int]:
+    """Resident and peak memory of this process in bytes (0 where unknown), plus its pid"""
+    try:
+        # POSIX only; Windows reads the working set through psapi instead
+        import resource
+    except ImportError:
+        try:
+            rss_bytes, peak_bytes = _windows_memory()
+        except (AttributeError, OSError):
+            rss_bytes = peak_bytes = 0
+        return {'pid': os.getpid(), 'rss_bytes': rss_bytes, 'peak_rss_bytes': peak_bytes}
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_bytes = peak if sys.platform == 'darwin' else peak * 1024
+
+    rss_bytes = peak_bytes
+    try:
+        with open('/proc/self/statm') as f:
+            rss_bytes = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return {'pid': os.getpid(), 'rss_bytes': rss_bytes, 'peak_rss_bytes': peak_bytes}
@@ -0,0 +1,255 @@
+"""
+Contract, transfer and performance facts extracted once at ingest time
+"""
+import bisect
+import math
+import re
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+WAGE_PATTERN = re.compile(r'£([\d,]+)/week|£([\d,]+) per week|Weekly Wage: £([\d,]+)|Base Salary: £([\d,]+)')
+FEE_PATTERN = re.compile(r'Transfer Fee: £([\d,]+) million|Fee: £([\d,]+) million|€([\d,]+) million')
+DURATION_PATTERN = re.compile(r'Duration: (\d+) years|Contract: (\d+) years')
+GOALS_PATTERN = re.compile(r'(\d+) goals')
+ASSISTS_PATTERN = re.compile(r'(\d+) assists')
+APPEARANCES_PATTERN = re.compile(r'(\d+) appearances')
+FROM_CLUB_PATTERN = re.compile(r'from ([A-Za-z\s]+)')
+BONUS_PATTERN = re.compile(r'Bonus: £([\d,]+)')
+
+# Subject words that mark a topic rather than a player name
+SUBJECT_TOPIC_WORDS = {
+    'Analysis', 'Availability', 'Captain', 'Case', 'Compliance', 'Contract', 'Deal',
+    'Extension', 'Fee', 'Injury', 'Investments', 'January', 'Management', 'Obligations',
+    'Player', 'Prevention', 'Renewals', 'Report', 'Review', 'Season', 'Squad', 'Staff',
+    'Structure', 'Support', 'Targets', 'Tracking', 'Transfer', 'Update', 'Window',
+    'Winter', 'Workload',
+}
+
+# Placeholder for a missing integer in the array('q') columns
+MISSING = -1
+
+# Fixed rate used to put euro fees on the same scale as pound fees
+EUR_TO_GBP = 0.85
+
+# Fields that can be range- or top-N-queried; 'fee' is normalized to £ millions
+NUMERIC_FIELDS = ('weekly_wage', 'fee', 'duration', 'goals', 'assists', 'appearances')
+
+
+class Fact(NamedTuple):
+    player: str
+    club: str
+    weekly_wage: Optional[int]  # GBP per week
+    fee: Optional[float]  # millions, in ``currency``
+    currency: str
+    duration: Optional[int]  # years
+    goals: Optional[int]
+    assists: Optional[int]
+    appearances: Optional[int]
+    from_club: str
+    bonuses: Tuple[int, ...]
+
+
+def _first_number(pattern: re.Pattern, text: str) -> Optional[int]:
+    match = pattern.search(text)
+    if not match:
+        return None
+    value = next(group for group in match.groups() if group is not None)
+    return int(value.replace(',', ''))
+
+
+def player_from_subject(subject: str) -> str:
+    """Best-effort player name from subjects like 'Contract Extension - Marcus Rodriguez'"""
+    if ' - ' not in subject:
+        return ''
+    name = re.sub(r'\(.*?\)', '', subject.rsplit(' - ', 1)[1]).split()
+
+    # Trim topic words around the name ("Captain Sofia Petrov", "David Yamamoto Fee Structure")
+    while name and name[0] in SUBJECT_TOPIC_WORDS:
+        name.pop(0)
+    while name and name[-1] in SUBJECT_TOPIC_WORDS:
+        name.pop()
+
+    if len(name) < 2 or any(not word[0].isupper() or any(ch.isdigit() for ch in word) for word in name):
+        return ''
+    if any(word in SUBJECT_TOPIC_WORDS for word in name):
+        return ''
+    return ' '.join(name)
+
+
+def extract_facts(record) -> Fact:
+    """Pull contract, transfer and performance figures out of one email"""
+    body = record.body
+
+    fee = None
+    currency = ''
+    fee_match = FEE_PATTERN.search(body)
+    if fee_match:
+        fee = float((fee_match.group(1) or fee_match.group(2) or fee_match.group(3)).replace(',', ''))
+        currency = '€' if fee_match.group(3) else '£'
+
+    from_club_match = FROM_CLUB_PATTERN.search(body)
+
+    return Fact(
+        player=player_from_subject(record.subject),
+        club=record.club,
+        weekly_wage=_first_number(WAGE_PATTERN, body),
+        fee=fee,
+        currency=currency,
+        duration=_first_number(DURATION_PATTERN, body),
+        goals=_first_number(GOALS_PATTERN, body),
+        assists=_first_number(ASSISTS_PATTERN, body),
+        appearances=_first_number(APPEARANCES_PATTERN, body),
+        from_club=from_club_match.group(1).strip() if from_club_match else '',
+        bonuses=tuple(int(bonus.replace(',', '')) for bonus in BONUS_PATTERN.findall(body)),
+    )
+
+
+class FactTable:
+    """Column-per-field fact table, one row per email, keyed by document id
+
+    Integer columns are array('q') with MISSING for absent values and the
+    fee column is array('d') with NaN, so whole columns can be handed to
+    bisect or NumPy without touching email text.
+    """
+
+    INT_COLUMNS = ('weekly_wage', 'duration', 'goals', 'assists', 'appearances')
+
+    def __init__(self):
+        self.doc_ids = array('q')
+        self.player: List[str] = []
+        self.club: List[str] = []
+        self.weekly_wage = array('q')
+        self.fee = array('d')
+        self.currency: List[str] = []
+        self.duration = array('q')
+        self.goals = array('q')
+        self.assists = array('q')
+        self.appearances = array('q')
+        self.from_club: List[str] = []
+        self.bonuses: List[Tuple[int, ...]] = []
+        self.live = bytearray()
+        self.rows: Dict[int, int] = {}
+        # Bumped on every append/remove; sorted columns are rebuilt when it moves
+        self.version = 0
+        self._sorted: Dict[str, SortedColumn] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getstate__(self) -> Dict:
+        # Sorted columns are cheap to rebuild and not worth a place in snapshots
+        state = dict(self.__dict__)
+        state['_sorted'] = {}
+        return state
+
+    def append(self, doc_id: int, fact: Fact):
+        """Add the facts of a newly indexed document"""
+        self.rows[doc_id] = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.player.append(fact.player)
+        self.club.append(fact.club)
+        self.fee.append(math.nan if fact.fee is None else fact.fee)
+        self.currency.append(fact.currency)
+        for column in self.INT_COLUMNS:
+            value = getattr(fact, column)
+            getattr(self, column).append(MISSING if value is None else value)
+        self.from_club.append(fact.from_club)
+        self.bonuses.append(fact.bonuses)
+        self.live.append(1)
+        self.version += 1
+
+    def remove(self, doc_id: int):
+        """Drop a document's row (the slot stays, marked dead)"""
+        row = self.rows.pop(doc_id, None)
+        if row is not None:
+            self.live[row] = 0
+            self.version += 1
+
+    def row(self, doc_id: int) -> Optional[Fact]:
+        """Facts of one document, or None if it has none recorded"""
+        row = self.rows.get(doc_id)
+        if row is None:
+            return None
+
+        ints = {}
+        for column in self.INT_COLUMNS:
+            value = getattr(self, column)[row]
+            ints[column] = None if value == MISSING else value
+        fee = self.fee[row]
+
+        return Fact(
+            player=self.player[row],
+            club=self.club[row],
+            fee=None if math.isnan(fee) else fee,
+            currency=self.currency[row],
+            from_club=self.from_club[row],
+            bonuses=self.bonuses[row],
+            **ints,
+        )
+
+    def normalized_values(self, field: str) -> array:
+        """A numeric column on a common scale, NaN where the value is missing
+
+        Fees are converted to £ millions; every other field is returned as is.
+        """
+        if field == 'fee':
+            return array('d', (
+                fee * EUR_TO_GBP if currency == '€' else fee
+                for fee, currency in zip(self.fee, self.currency)
+            ))
+        if field in self.INT_COLUMNS:
+            return array('d', (math.nan if value == MISSING else value for value in getattr(self, field)))
+        raise ValueError(f"Unknown numeric field: {field}")
+
+    def sorted_column(self, field: str) -> 'SortedColumn':
+        """Live, non-missing values of a field in ascending order, cached per table version"""
+        column = self._sorted.get(field)
+        if column is None or column.version != self.version:
+            pairs = sorted(
+                (value, doc_id)
+                for value, doc_id, live in zip(self.normalized_values(field), self.doc_ids, self.live)
+                if live and not math.isnan(value)
+            )
+            column = SortedColumn(array('d', (value for value, _ in pairs)),
+                                  array('q', (doc_id for _, doc_id in pairs)), self.version)
+            self._sorted[field] = column
+        return column
+
+    def range_query(self, field: str, low: Optional[float] = None, high: Optional[float] = None,
+                    include_low: bool = True, include_high: bool = True,
+                    club: Optional[str] = None) -> List[Tuple[int, float]]:
+        """(doc_id, value) pairs with low <= value <= high, ascending, by binary search"""
+        column = self.sorted_column(field)
+        start = 0
+        end = len(column.values)
+        if low is not None:
+            start = (bisect.bisect_left if include_low else bisect.bisect_right)(column.values, low)
+        if high is not None:
+            end = (bisect.bisect_right if include_high else bisect.bisect_left)(column.values, high)
+        return [(column.doc_ids[i], column.values[i]) for i in range(start, end)
+                if club is None or self.club[self.rows[column.doc_ids[i]]] == club]
+
+    def top_n(self, field: str, n: int, largest: bool = True,
+              club: Optional[str] = None) -> List[Tuple[int, float]]:
+        """The n (doc_id, value) pairs with the largest (or smallest) values"""
+        column = self.sorted_column(field)
+        rows = range(len(column.values) - 1, -1, -1) if largest else range(len(column.values))
+        found = []
+        for i in rows:
+            if len(found) >= n:
+                break
+            doc_id = column.doc_ids[i]
+            if club is None or self.club[self.rows[doc_id]] == club:
+                found.append((doc_id, column.values[i]))
+        return found
+
+
+class SortedColumn(NamedTuple):
+    values: array
+    doc_ids: array
+    version: int
+
+
+def format_money(amount: float) -> str:
+    """Render an amount the way the emails write it: 180,000 or 85 or 2.5"""
+    return f"{amount:,.0f}" if float(amount).is_integer() else f"{amount:,}"
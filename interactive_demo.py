@@ -2,75 +2,43 @@
 """
 Interactive HTML page generator for Premier League Email Search
 """
+import argparse
 import os
-import glob
-import re
-import json
-from typing import List, Dict
 
-class EmailSearchApp:
-    def __init__(self, emails_directory: str):
-        self.emails_directory = emails_directory
-        self.emails_data = []
-        self.load_emails()
-    
-    def load_emails(self):
-        """Load all email files and extract content"""
-        email_files = glob.glob(os.path.join(self.emails_directory, "**/*.msg"), recursive=True)
-        
-        for file_path in email_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                email_data = self.parse_email(content, file_path)
-                self.emails_data.append(email_data)
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
-    
-    def parse_email(self, content: str, file_path: str) -> Dict:
-        """Parse email content and extract metadata"""
-        lines = content.split('\n')
-        
-        email_data = {
-            'file_path': file_path,
-            'club': os.path.basename(os.path.dirname(file_path)),
-            'filename': os.path.basename(file_path),
-            'content': content,
-            'from': '',
-            'to': '',
-            'subject': '',
-            'date': '',
-            'body': ''
-        }
-        
-        # Extract header information
-        body_start = 0
-        for i, line in enumerate(lines):
-            if line.startswith('From:'):
-                email_data['from'] = line[5:].strip()
-            elif line.startswith('To:'):
-                email_data['to'] = line[3:].strip()
-            elif line.startswith('Subject:'):
-                email_data['subject'] = line[8:].strip()
-            elif line.startswith('Date:'):
-                email_data['date'] = line[5:].strip()
-            elif line.strip() == '' and i > 3:
-                body_start = i + 1
-                break
-        
-        email_data['body'] = '\n'.join(lines[body_start:])
-        return email_data
+from static_search import (
+    SEARCH_SCRIPT, SEARCH_WORKER_SCRIPT, SHARDED_SEARCH_SCRIPT, build_search_payload, payload_json,
+    write_sharded_payload
+)
+from search_engine import SearchEngine
+
+# Where --sharded writes the search data, next to the page
+SHARD_DIRECTORY_NAME = "search_data"
+
+def generate_interactive_html(shard_directory: str = None):
+    """Generate an interactive HTML page with search functionality
 
-def generate_interactive_html():
-    """Generate an interactive HTML page with search functionality"""
+    With shard_directory the search data is written there as gzipped shards
+    that the page fetches on demand (serve the page over HTTP, next to the
+    directory); otherwise it is inlined into the page.
+    """
     
     # Initialize search app and serialize data
     emails_dir = "/root/Desktop/premier_league_emails_2040"
-    search_app = EmailSearchApp(emails_dir)
+    search_app = SearchEngine(emails_dir)
     
-    # Convert emails data to JSON for JavaScript
-    emails_json = json.dumps(search_app.emails_data, ensure_ascii=False, indent=2)
+    # Ship a prebuilt inverted index and fact table instead of the emails themselves
+    if shard_directory:
+        # The page only carries the manifest; shards load as queries need them
+        payload = write_sharded_payload(search_app.emails_data, shard_directory)
+        shard_url = os.path.basename(os.path.normpath(shard_directory)) + "/"
+        search_script = SEARCH_SCRIPT + SHARDED_SEARCH_SCRIPT
+        club_count = len(payload['docs'])
+    else:
+        payload = build_search_payload(search_app.emails_data)
+        shard_url = ""
+        search_script = SEARCH_SCRIPT
+        club_count = len(payload['clubs'])
+    search_data_json = payload_json(payload)
     
     html_content = f"""
 <!DOCTYPE html>
@@ -356,11 +324,11 @@ def generate_interactive_html():
         
         <div class="stats">
             <div class="stat-card">
-                <div class="stat-number">30</div>
+                <div class="stat-number">{len(search_app.emails_data)}</div>
                 <div class="stat-label">総メール数</div>
             </div>
             <div class="stat-card">
-                <div class="stat-number">3</div>
+                <div class="stat-number">{club_count}</div>
                 <div class="stat-label">対象クラブ</div>
             </div>
             <div class="stat-card">
@@ -382,7 +350,7 @@ def generate_interactive_html():
             <div class="search-form">
                 <input type="text" id="searchInput" class="search-input" 
                        placeholder="例: Mohamed Salah Jr.の契約条件は？" 
-                       onkeypress="handleKeyPress(event)">
+                       onkeypress="handleKeyPress(event)" oninput="performSearch(true)">
                 <button class="search-button" onclick="performSearch()">検索</button>
                 <button class="clear-button" onclick="clearResults()">クリア</button>
             </div>
@@ -421,9 +389,32 @@ def generate_interactive_html():
         </div>
     </div>
 
+    <script type="application/json" id="searchData" data-base="{shard_url}">{search_data_json}</script>
+    <script id="searchLibrary">{search_script}</script>
+    <script type="text/plain" id="searchWorkerScript">{SEARCH_WORKER_SCRIPT}</script>
     <script>
-        // Email data embedded in JavaScript
-        const emailsData = {emails_json};
+        // Prebuilt index: postings, email headers and extracted facts (no email bodies),
+        // or for sharded output just the manifest of the shards to fetch
+        const searchDataElement = document.getElementById('searchData');
+        const shardBaseUrl = new URL(searchDataElement.dataset.base, document.baseURI).href;
+        
+        // The worker parses and owns the index, so typing never waits on a search
+        let searchWorker = null;
+        try {{
+            const workerSource = document.getElementById('searchLibrary').textContent +
+                document.getElementById('searchWorkerScript').textContent;
+            searchWorker = new Worker(URL.createObjectURL(new Blob([workerSource], {{ type: 'text/javascript' }})));
+            searchWorker.onmessage = event => showResults(event.data);
+            searchWorker.postMessage({{ type: 'load', text: searchDataElement.textContent, baseUrl: shardBaseUrl }});
+        }} catch (error) {{
+            // Workers unavailable (e.g. blocked for this origin): search on the page instead
+            searchWorker = null;
+        }}
+        
+        let searchData = null;
+        let searchIndexData = null;
+        let latestQueryId = 0;
+        let latestQuery = '';
         
         function handleKeyPress(event) {{
             if (event.key === 'Enter') {{
@@ -437,56 +428,71 @@ def generate_interactive_html():
         }}
         
         function clearResults() {{
+            // Answers still in flight are ignored
+            latestQueryId++;
             document.getElementById('searchInput').value = '';
             document.getElementById('resultsSection').style.display = 'none';
         }}
         
-        function performSearch() {{
+        function performSearch(live) {{
             const query = document.getElementById('searchInput').value.trim();
             
             if (!query) {{
-                alert('質問を入力してください');
+                if (live) {{
+                    clearResults();
+                }} else {{
+                    alert('質問を入力してください');
+                }}
                 return;
             }}
             
-            // Show loading
             const resultsSection = document.getElementById('resultsSection');
             const resultsContent = document.getElementById('resultsContent');
             
             resultsSection.style.display = 'block';
-            resultsContent.innerHTML = '<div class="loading">🔍 検索中...</div>';
+            if (!live) {{
+                // Show loading; while typing the previous results stay until the new ones arrive
+                resultsContent.innerHTML = '<div class="loading">🔍 検索中...</div>';
+            }}
             
-            // Simulate search delay for better UX
-            setTimeout(() => {{
-                const results = searchEmails(query);
-                displayResults(query, results);
-            }}, 500);
+            const id = ++latestQueryId;
+            latestQuery = query;
+            if (searchWorker) {{
+                searchWorker.postMessage({{ type: 'search', id: id, query: query, topK: 3 }});
+                return;
+            }}
+            searchEmails(query)
+                .then(results => showResults({{ id: id, results: results }}))
+                .catch(error => showResults({{ id: id, error: error.message }}));
+        }}
+        
+        function showResults(response) {{
+            // Drop answers to queries the user has already typed past
+            if (response.id !== latestQueryId) {{
+                return;
+            }}
+            if (response.error) {{
+                document.getElementById('resultsContent').innerHTML =
+                    `<div class="no-results">⚠️ 検索データを読み込めませんでした: ${{escapeHtml(response.error)}}</div>`;
+                return;
+            }}
+            displayResults(latestQuery, response.results);
         }}
         
         function searchEmails(query) {{
-            const queryWords = query.toLowerCase().split(/\\s+/);
-            const results = [];
-            
-            emailsData.forEach(email => {{
-                const contentLower = email.content.toLowerCase();
-                let score = 0;
-                
-                queryWords.forEach(word => {{
-                    if (contentLower.includes(word)) {{
-                        score += (contentLower.match(new RegExp(word, 'g')) || []).length;
-                    }}
-                }});
-                
-                if (score > 0) {{
-                    results.push({{
-                        ...email,
-                        score: score
-                    }});
-                }}
-            }});
-            
-            // Sort by score and return top 3
-            return results.sort((a, b) => b.score - a.score).slice(0, 3);
+            // On-page fallback when no worker could be started
+            if (!searchData) {{
+                searchData = JSON.parse(searchDataElement.textContent);
+                searchIndexData = searchData.docs ? null : loadSearchIndex(searchData);
+            }}
+            if (!searchIndexData) {{
+                return searchShards(searchData, shardBaseUrl, query, 3);
+            }}
+            // Postings lookups only; return the top 3 by summed term frequency
+            return Promise.resolve(searchIndex(searchIndexData, query, 3).map(hit => ({{
+                ...emailAt(searchIndexData, hit.docId),
+                score: hit.score
+            }})));
         }}
         
         function displayResults(query, results) {{
@@ -517,7 +523,7 @@ def generate_interactive_html():
                                 <strong>👤 送信者:</strong> ${{result.from}}<br>
                                 <strong>📧 宛先:</strong> ${{result.to}}
                             </div>
-                            ${{extractRelevantInfo(query, result.body)}}
+                            ${{extractRelevantInfo(query, result)}}
                         </div>
                     </div>
                 `;
@@ -526,32 +532,31 @@ def generate_interactive_html():
             resultsContent.innerHTML = html;
         }}
         
-        function extractRelevantInfo(query, body) {{
+        function extractRelevantInfo(query, email) {{
             const queryLower = query.toLowerCase();
             let info = '';
             
             // Check for contract-related queries
             if (queryLower.includes('契約') || queryLower.includes('contract') || queryLower.includes('salary') || queryLower.includes('年俸')) {{
-                info += extractContractInfo(body);
+                info += extractContractInfo(email.facts);
             }}
             
             // Check for transfer-related queries
             if (queryLower.includes('移籍') || queryLower.includes('transfer')) {{
-                info += extractTransferInfo(body);
+                info += extractTransferInfo(email.facts);
             }}
             
             // Check for performance-related queries
             if (queryLower.includes('出場') || queryLower.includes('ゴール') || queryLower.includes('appearances') || queryLower.includes('goals')) {{
-                info += extractPerformanceInfo(body);
+                info += extractPerformanceInfo(email.facts);
             }}
             
             // If no specific info found, show general content
             if (!info) {{
-                const lines = body.split('\\n').slice(0, 5);
                 info = `
                     <div class="performance-info">
                         <strong>📄 内容抜粋:</strong><br>
-                        ${{lines.filter(line => line.trim()).map(line => `&nbsp;&nbsp;${{escapeHtml(line.trim())}}`).join('<br>')}}
+                        ${{email.excerpt.map(line => `&nbsp;&nbsp;${{escapeHtml(line)}}`).join('<br>')}}
                     </div>
                 `;
             }}
@@ -559,43 +564,36 @@ def generate_interactive_html():
             return info;
         }}
         
-        function extractContractInfo(body) {{
+        function formatMoney(amount) {{
+            return amount.toLocaleString('en-US', {{ maximumFractionDigits: 2 }});
+        }}
+        
+        function extractContractInfo(facts) {{
             let info = '<div class="contract-info"><strong>💼 契約情報:</strong><br>';
             let found = false;
             
-            // Extract salary
-            const salaryMatch = body.match(/£([\\d,]+)\\/week|Weekly Wage: £([\\d,]+)|Base Salary: £([\\d,]+) per week/);
-            if (salaryMatch) {{
-                const salary = salaryMatch[1] || salaryMatch[2] || salaryMatch[3];
-                info += `💰 週給: £${{salary}}<br>`;
+            if (facts.weekly_wage !== null) {{
+                info += `💰 週給: £${{formatMoney(facts.weekly_wage)}}<br>`;
                 found = true;
             }}
             
-            // Extract contract duration
-            const durationMatch = body.match(/Duration: (\\d+) years/);
-            if (durationMatch) {{
-                info += `📆 契約期間: ${{durationMatch[1]}}年<br>`;
+            if (facts.duration !== null) {{
+                info += `📆 契約期間: ${{facts.duration}}年<br>`;
                 found = true;
             }}
             
-            // Extract appearances
-            const appearancesMatch = body.match(/(\\d+) appearances/);
-            if (appearancesMatch) {{
-                info += `⚽ 出場試合数: ${{appearancesMatch[1]}}試合<br>`;
+            if (facts.appearances !== null) {{
+                info += `⚽ 出場試合数: ${{facts.appearances}}試合<br>`;
                 found = true;
             }}
             
-            // Extract goals
-            const goalsMatch = body.match(/(\\d+) goals/);
-            if (goalsMatch) {{
-                info += `🥅 ゴール数: ${{goalsMatch[1]}}ゴール<br>`;
+            if (facts.goals !== null) {{
+                info += `🥅 ゴール数: ${{facts.goals}}ゴール<br>`;
                 found = true;
             }}
             
-            // Extract assists
-            const assistsMatch = body.match(/(\\d+) assists/);
-            if (assistsMatch) {{
-                info += `🎯 アシスト数: ${{assistsMatch[1]}}アシスト<br>`;
+            if (facts.assists !== null) {{
+                info += `🎯 アシスト数: ${{facts.assists}}アシスト<br>`;
                 found = true;
             }}
             
@@ -603,23 +601,17 @@ def generate_interactive_html():
             return found ? info : '';
         }}
         
-        function extractTransferInfo(body) {{
+        function extractTransferInfo(facts) {{
             let info = '<div class="transfer-info"><strong>🔄 移籍情報:</strong><br>';
             let found = false;
             
-            // Extract transfer fee
-            const feeMatch = body.match(/€([\\d,]+) million|£([\\d,]+) million|Transfer Fee: £([\\d,]+) million/);
-            if (feeMatch) {{
-                const currency = feeMatch[1] ? '€' : '£';
-                const amount = feeMatch[1] || feeMatch[2] || feeMatch[3];
-                info += `💵 移籍金: ${{currency}}${{amount}} million<br>`;
+            if (facts.fee !== null) {{
+                info += `💵 移籍金: ${{facts.currency}}${{formatMoney(facts.fee)}} million<br>`;
                 found = true;
             }}
             
-            // Extract clubs
-            const fromMatch = body.match(/from ([A-Za-z\\s]+)(?:FC|CF)?/);
-            if (fromMatch) {{
-                info += `🏟️ 移籍元: ${{fromMatch[1].trim()}}<br>`;
+            if (facts.from_club !== null) {{
+                info += `🏟️ 移籍元: ${{escapeHtml(facts.from_club)}}<br>`;
                 found = true;
             }}
             
@@ -627,30 +619,24 @@ def generate_interactive_html():
             return found ? info : '';
         }}
         
-        function extractPerformanceInfo(body) {{
+        function extractPerformanceInfo(facts) {{
             let info = '<div class="performance-info"><strong>📊 パフォーマンス:</strong><br>';
             let found = false;
             
-            // Extract various performance metrics
-            const appearances = body.match(/(\\d+) appearances/);
-            const goals = body.match(/(\\d+) goals/);
-            const assists = body.match(/(\\d+) assists/);
-            const cleanSheets = body.match(/(\\d+) clean sheets/);
-            
-            if (appearances) {{
-                info += `⚽ 出場: ${{appearances[1]}}試合<br>`;
+            if (facts.appearances !== null) {{
+                info += `⚽ 出場: ${{facts.appearances}}試合<br>`;
                 found = true;
             }}
-            if (goals) {{
-                info += `🥅 ゴール: ${{goals[1]}}ゴール<br>`;
+            if (facts.goals !== null) {{
+                info += `🥅 ゴール: ${{facts.goals}}ゴール<br>`;
                 found = true;
             }}
-            if (assists) {{
-                info += `🎯 アシスト: ${{assists[1]}}アシスト<br>`;
+            if (facts.assists !== null) {{
+                info += `🎯 アシスト: ${{facts.assists}}アシスト<br>`;
                 found = true;
             }}
-            if (cleanSheets) {{
-                info += `🛡️ クリーンシート: ${{cleanSheets[1]}}試合<br>`;
+            if (facts.clean_sheets !== null) {{
+                info += `🛡️ クリーンシート: ${{facts.clean_sheets}}試合<br>`;
                 found = true;
             }}
             
@@ -676,15 +662,25 @@ def generate_interactive_html():
     return html_content
 
 def main():
-    print("🚀 インタラクティブHTMLページを生成中...")
+    parser = argparse.ArgumentParser(description="Generate interactive_search.html")
+    parser.add_argument("--sharded", action="store_true",
+                        help=f"write the search data as on-demand shards in {SHARD_DIRECTORY_NAME}/ next to the page")
+    args = parser.parse_args()
     
-    html_content = generate_interactive_html()
+    print("🚀 インタラクティブHTMLページを生成中...")
     
     output_file = "/root/Desktop/premier_league_emails_2040/interactive_search.html"
+    shard_directory = None
+    if args.sharded:
+        shard_directory = os.path.join(os.path.dirname(output_file), SHARD_DIRECTORY_NAME)
+    html_content = generate_interactive_html(shard_directory)
+    
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(html_content)
     
     print(f"✅ インタラクティブページが生成されました: {output_file}")
+    if shard_directory:
+        print(f"📦 検索データ: {shard_directory}/ (HTTPサーバー経由で開いてください)")
     print("🌐 ブラウザでファイルを開いて、自由に質問を入力できます")
     print("\n📋 機能:")
     print("  • リアルタイム検索")
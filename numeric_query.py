@@ -0,0 +1,135 @@
+"""
+Recognize range and top-N questions over the numeric fact columns
+"""
+import re
+from typing import NamedTuple, Optional, Sequence
+
+from fact_table import EUR_TO_GBP
+
+# Query words that pick the fact column, checked in order
+FIELD_KEYWORDS = (
+    ('fee', ('transfer fee', 'fee', '移籍金', 'transfer', '移籍')),
+    ('weekly_wage', ('wage', 'salary', 'earn', 'earning', 'per week', '/week', '週給', '年俸', '給与', '給料')),
+    ('assists', ('assist', 'アシスト')),
+    ('goals', ('goal', 'scored', 'ゴール', '得点')),
+    ('appearances', ('appearance', 'played', '出場', '試合')),
+    ('duration', ('contract length', 'years', '契約期間', '年契約')),
+)
+
+LOWER_BOUND_WORDS = ('over', 'above', 'more than', 'greater than', 'at least', 'exceeding',
+                     'or more', '>', '以上', '超', 'より多', 'を超え')
+UPPER_BOUND_WORDS = ('under', 'below', 'less than', 'at most', 'fewer than', 'or less',
+                     'up to', '<', '以下', '未満', 'より少な')
+# Bounds that exclude the number itself
+EXCLUSIVE_WORDS = ('over', 'above', 'more than', 'greater than', 'exceeding', '>', '超', 'より多',
+                   'を超え', 'under', 'below', 'less than', 'fewer than', '<', '未満', 'より少な')
+
+TOP_WORDS = ('top', 'highest', 'most', 'best', 'biggest', 'largest', 'richest', '上位', 'トップ',
+             '最も', '一番', '最高', '最多')
+BOTTOM_WORDS = ('lowest', 'least', 'fewest', 'smallest', 'cheapest', 'bottom', '下位', '最低', '最少')
+
+DEFAULT_TOP_N = 5
+
+NUMBER_PATTERN = re.compile(
+    r'([£€])?\s*(\d[\d,]*(?:\.\d+)?)\s*(million|mil|m\b|k\b|万|億)?', re.IGNORECASE
+)
+BETWEEN_PATTERN = re.compile(r'between|から.*まで|〜|~|-')
+COUNT_PATTERN = re.compile(r'(?:top|上位|トップ|bottom|下位)\s*(\d+)', re.IGNORECASE)
+
+UNIT_MULTIPLIERS = {'million': 1e6, 'mil': 1e6, 'm': 1e6, 'k': 1e3, '万': 1e4, '億': 1e8}
+
+
+def _keyword_pattern(words: Sequence[str]) -> re.Pattern:
+    """Match any of the words: Latin words whole (plural allowed), CJK words anywhere
+
+    Whole-word matching keeps "Christopher", "Stop" and "Almost" from
+    reading as "top" or "most".
+    """
+    alternatives = []
+    for word in words:
+        pattern = re.escape(word)
+        if word[0].isascii() and word[0].isalnum():
+            pattern = r'\b' + pattern
+        if word[-1].isascii() and word[-1].isalnum():
+            pattern += r's?\b'
+        alternatives.append(pattern)
+    return re.compile('|'.join(alternatives))
+
+
+FIELD_PATTERNS = tuple((name, _keyword_pattern(words)) for name, words in FIELD_KEYWORDS)
+LOWER_BOUND_PATTERN = _keyword_pattern(LOWER_BOUND_WORDS)
+UPPER_BOUND_PATTERN = _keyword_pattern(UPPER_BOUND_WORDS)
+EXCLUSIVE_PATTERN = _keyword_pattern(EXCLUSIVE_WORDS)
+TOP_PATTERN = _keyword_pattern(TOP_WORDS)
+BOTTOM_PATTERN = _keyword_pattern(BOTTOM_WORDS)
+
+
+class NumericQuery(NamedTuple):
+    field: str
+    low: Optional[float] = None
+    high: Optional[float] = None
+    include_low: bool = True
+    include_high: bool = True
+    top_n: Optional[int] = None
+    largest: bool = True
+    club: Optional[str] = None
+
+
+def _amount(currency: str, number: str, unit: str, field: str) -> float:
+    """A query number on the fact column's scale (£ per week, £ millions for fees)"""
+    value = float(number.replace(',', ''))
+    unit = (unit or '').lower()
+    if field == 'fee':
+        # "£50 million" and "50m" mean 50 on the fee scale; bare large numbers are pounds
+        if unit in ('million', 'mil', 'm'):
+            pass
+        elif unit or value >= 1000:
+            value = value * UNIT_MULTIPLIERS.get(unit, 1) / 1e6
+        if currency == '€':
+            value *= EUR_TO_GBP
+        return value
+    return value * UNIT_MULTIPLIERS.get(unit, 1)
+
+
+def parse_numeric_query(query: str, clubs: Sequence[str] = ()) -> Optional[NumericQuery]:
+    """Turn "who earns over £150,000/week" or "top 3 goals at Chelsea" into a NumericQuery
+
+    Returns None for questions that are not about a numeric range or ranking.
+    """
+    query_lower = query.lower()
+
+    field = next((name for name, pattern in FIELD_PATTERNS if pattern.search(query_lower)), None)
+    if field is None:
+        return None
+
+    club = next((name for name in clubs if name.lower() in query_lower), None)
+
+    # Ignore digits that only give a top-N count or a year such as 2040
+    count_match = COUNT_PATTERN.search(query_lower)
+    numbers = []
+    for match in NUMBER_PATTERN.finditer(query_lower):
+        if count_match and match.start(2) == count_match.start(1):
+            continue
+        if not match.group(1) and not match.group(3) and re.fullmatch(r'20\d\d', match.group(2)):
+            continue
+        numbers.append(_amount(match.group(1) or '', match.group(2), match.group(3), field))
+
+    has_lower = bool(LOWER_BOUND_PATTERN.search(query_lower))
+    has_upper = bool(UPPER_BOUND_PATTERN.search(query_lower))
+    exclusive = bool(EXCLUSIVE_PATTERN.search(query_lower))
+
+    if len(numbers) >= 2 and (BETWEEN_PATTERN.search(query_lower) or (has_lower and has_upper)):
+        low, high = sorted(numbers[:2])
+        return NumericQuery(field, low=low, high=high, club=club)
+    if numbers and has_lower:
+        return NumericQuery(field, low=numbers[0], include_low=not exclusive, club=club)
+    if numbers and has_upper:
+        return NumericQuery(field, high=numbers[0], include_high=not exclusive, club=club)
+
+    largest = bool(TOP_PATTERN.search(query_lower))
+    smallest = bool(BOTTOM_PATTERN.search(query_lower))
+    if largest or smallest:
+        top_n = int(count_match.group(1)) if count_match else DEFAULT_TOP_N
+        return NumericQuery(field, top_n=top_n, largest=not smallest, club=club)
+
+    return None
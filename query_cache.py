@@ -0,0 +1,75 @@
+"""
+Bounded LRU cache of query results, invalidated when the corpus changes
+"""
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable, List, NamedTuple, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 256
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """NFKC-fold and collapse whitespace, so '　Arsenal  salary ' and 'Arsenal salary' share an entry
+
+    Case is kept: answers quote player names from the query as typed.
+    """
+    return WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', query)).strip()
+
+
+class CachedResult(NamedTuple):
+    hits: List[Tuple[int, float]]  # Ranked (doc_id, score) pairs
+    answer: Any  # Rendered answer, as returned by the app's generate_answer
+
+
+class QueryCache:
+    """LRU map from (normalized query, top_k, mode) to ranked ids and the rendered answer
+
+    Every lookup passes the current corpus version; the first lookup after
+    the version moves empties the cache, so no answer outlives the emails
+    it was built from. Safe to share between Streamlit sessions.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Hashable, CachedResult]' = OrderedDict()
+        self.version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(query: str, top_k: int, mode: str) -> Tuple[str, int, str]:
+        return normalize_query(query), top_k, mode
+
+    def _check_version(self, version: int):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key: Hashable, version: int) -> Optional[CachedResult]:
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, version: int, entry: CachedResult):
+        with self.lock:
+            self._check_version(version)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,140 @@
+"""
+Query embedding cache with micro-batched encoding
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_MAX_BATCH = 32
+# How long the batcher waits for more queries after the first one arrives
+DEFAULT_MAX_WAIT_MS = 5
+
+# Process-wide models and encoders. They live here rather than in the Streamlit
+# script, which is re-executed as a fresh __main__ module on every rerun.
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+_encoders: Dict[str, 'BatchingQueryEncoder'] = {}
+_encoders_lock = threading.Lock()
+
+
+class BatchingQueryEncoder:
+    """Encodes queries through an LRU cache, batching concurrent misses into one model call
+
+    A daemon thread takes the first pending query, keeps collecting for up
+    to ``max_wait_ms`` (or until ``max_batch`` queries are waiting), and
+    encodes the distinct texts together. Callers block only on their own
+    future. Returned vectors are L2-normalized float32 rows of shape (1, d).
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 cache_size: int = DEFAULT_CACHE_SIZE, max_batch: int = DEFAULT_MAX_BATCH,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.cache: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.pending: 'queue.Queue[Tuple[str, Future]]' = queue.Queue()
+        self.batches = 0
+        self.encoded = 0
+        self.worker: Optional[threading.Thread] = None
+        self.worker_lock = threading.Lock()
+
+    def _cached(self, query: str) -> Optional[np.ndarray]:
+        with self.cache_lock:
+            vector = self.cache.get(query)
+            if vector is not None:
+                self.cache.move_to_end(query)
+            return vector
+
+    def _remember(self, query: str, vector: np.ndarray):
+        with self.cache_lock:
+            self.cache[query] = vector
+            self.cache.move_to_end(query)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _ensure_worker(self):
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='query-encoder', daemon=True)
+                self.worker.start()
+
+    def submit(self, query: str) -> Future:
+        """Future resolving to the query's embedding"""
+        future: Future = Future()
+        vector = self._cached(query)
+        if vector is not None:
+            future.set_result(vector.copy())
+            return future
+
+        self._ensure_worker()
+        self.pending.put((query, future))
+        return future
+
+    def encode(self, query: str) -> np.ndarray:
+        """Embedding of one query, shape (1, d)"""
+        return self.submit(query).result()
+
+    def encode_many(self, queries: List[str]) -> np.ndarray:
+        """Embeddings of several queries, shape (n, d), sharing batches with other callers"""
+        futures = [self.submit(query) for query in queries]
+        return np.vstack([future.result() for future in futures])
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = list(dict.fromkeys(query for query, _ in batch))
+            try:
+                embeddings = np.asarray(self.encode_fn(texts), dtype=np.float32).reshape(len(texts), -1)
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                embeddings = embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.encoded += len(texts)
+            vectors = {text: embeddings[i:i + 1] for i, text in enumerate(texts)}
+            for text, vector in vectors.items():
+                self._remember(text, vector)
+            for query, future in batch:
+                future.set_result(vectors[query].copy())
+
+
+def load_model(model_name: str):
+    """Import sentence-transformers and load the embedding model, once per process"""
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(model_name)
+        return _models[model_name]
+
+
+def shared_query_encoder(model_name: str) -> BatchingQueryEncoder:
+    """Process-wide query encoder, so concurrent sessions share batches and cached embeddings"""
+    with _encoders_lock:
+        if model_name not in _encoders:
+            _encoders[model_name] = BatchingQueryEncoder(load_model(model_name).encode)
+        return _encoders[model_name]
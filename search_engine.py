@@ -0,0 +1,193 @@
+"""
+Email search engine shared by every entry point
+
+A SearchEngine owns the parsed corpus (EmailStore with its fact table), a
+keyword index backend chosen by name, an optional snapshot for fast cold
+starts, the read/write lock that lets searches run while new emails are
+synced, and the query-result cache. Apps subclass it and add their own
+answer formatting; the RAG chatbot adds a semantic index on top.
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from corpus_snapshot import Snapshot, load_snapshot, save_snapshot
+from email_corpus import (
+    EmailRecord, EmailStore, SearchResult, SyncResult, cumulative_stages, find_email_files, parse_email
+)
+from engine_runtime import BackgroundBuild, ReadWriteLock, sync_in_stages
+from fact_table import Fact, extract_facts
+from query_cache import QueryCache
+from search_index import KeywordIndex, ScanIndex
+
+# Keyword index backends by name. A backend assigns sequential ids from
+# add_document(text) and provides remove_document(doc_id),
+# refresh_statistics() and search(query, top_k, mode) -> [(doc_id, score)].
+INDEX_BACKENDS: Dict[str, Callable[[], object]] = {
+    'keyword': KeywordIndex,
+    'scan': ScanIndex,
+}
+
+
+def register_backend(name: str, factory: Callable[[], object]):
+    """Make a keyword index backend available to SearchEngine(backend=name)"""
+    INDEX_BACKENDS[name] = factory
+
+
+def create_backend(name: str):
+    """A new, empty index of the named backend"""
+    factory = INDEX_BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown index backend: {name} (expected one of {', '.join(INDEX_BACKENDS)})")
+    return factory()
+
+
+class SearchEngine:
+    """Parsed emails, a keyword index and the machinery to keep them in sync
+
+    Document ids are shared by the store, its fact table and the keyword
+    index. With ``snapshot_path`` the engine starts from the last snapshot
+    and only parses what changed since; with ``background`` the sync runs
+    on a BackgroundBuild thread (club by club on a cold start) and the
+    engine answers from whatever has been indexed so far.
+    """
+
+    def __init__(self, emails_directory: str, clubs: Optional[Sequence[str]] = None,
+                 snapshot_path: Optional[str] = None, backend: str = 'keyword',
+                 parse_workers: Optional[int] = None, background: bool = False):
+        self.emails_directory = emails_directory
+        self.clubs = clubs
+        self.snapshot_path = snapshot_path
+        self.backend = backend
+        self.parse_workers = parse_workers
+        # Shared by every session: searches read in parallel, syncing new emails writes
+        self.rw_lock = ReadWriteLock()
+        # One sync (prepare + apply) at a time, since each diffs against the manifest the
+        # last one applied; snapshots are written under it too so the store cannot change
+        self.sync_lock = threading.RLock()
+        self.query_cache = QueryCache()
+
+        snapshot = load_snapshot(snapshot_path) if snapshot_path else None
+        self.restore(snapshot)
+
+        if background:
+            # Pages render immediately and search whatever has been indexed so far
+            # Assigned before the thread starts, so the build can record errors on self.build
+            self.build = BackgroundBuild(f'{type(self).__name__}-build')
+            self.build.start(self.build_index)
+            return
+
+        result = self.load_emails()
+        if snapshot is None or result.added_ids or result.removed_ids:
+            try:
+                self.save_snapshot()
+            except OSError as e:
+                self.report_errors({self.snapshot_path: e})
+        self.build = BackgroundBuild(f'{type(self).__name__}-build').mark_ready(self.indexed_clubs())
+
+    @property
+    def emails_data(self) -> List[EmailRecord]:
+        return self.store.emails_data
+
+    @property
+    def version(self) -> int:
+        return self.store.version
+
+    def restore(self, snapshot: Optional[Snapshot]):
+        """Adopt a snapshot's store and index, or start empty"""
+        index_type = INDEX_BACKENDS.get(self.backend)
+        if snapshot is not None and snapshot.keyword_index is not None:
+            self.store = snapshot.store
+            if isinstance(index_type, type) and isinstance(snapshot.keyword_index, index_type):
+                self.keyword_index = snapshot.keyword_index
+            else:
+                # Written with another backend: re-index the restored emails
+                self.keyword_index = self.index_documents(self.store.documents)
+        else:
+            self.store = EmailStore(parse_email, parse_workers=self.parse_workers)
+            self.keyword_index = create_backend(self.backend)
+
+    def index_documents(self, documents: Iterable[Optional[EmailRecord]]):
+        """A new backend index holding documents under their store ids"""
+        index = create_backend(self.backend)
+        for email in documents:
+            doc_id = index.add_document(email['content'] if email is not None else '')
+            if email is None:
+                index.remove_document(doc_id)
+        index.refresh_statistics()
+        return index
+
+    def email_files(self) -> List[str]:
+        return find_email_files(self.emails_directory, self.clubs)
+
+    def indexed_clubs(self) -> List[str]:
+        return sorted({email['club'] for email in self.emails_data})
+
+    def load_emails(self) -> SyncResult:
+        """Load email files added or changed since the last load and drop removed ones"""
+        result = self.sync()
+        if result.errors:
+            self.report_errors(result.errors)
+        return result
+
+    def sync(self, progress_fn: Optional[Callable[[int, int, str], None]] = None) -> SyncResult:
+        """Parse changed files without blocking searches, then swap them in under the write lock"""
+        with self.sync_lock:
+            prepared = self.store.prepare_sync(self.email_files(), progress_fn=progress_fn)
+            with self.rw_lock.write():
+                result = self.store.apply_sync(prepared)
+                self.apply_sync_result(result)
+        return result
+
+    def apply_sync_result(self, result: SyncResult):
+        """Bring the keyword index in line with a store sync"""
+        # Index ids follow store ids because both are assigned in sync order
+        for doc_id in result.removed_ids:
+            self.keyword_index.remove_document(doc_id)
+        for doc_id in result.added_ids:
+            self.keyword_index.add_document(self.store.documents[doc_id]['content'])
+        self.keyword_index.refresh_statistics()
+
+    def build_index(self, build: BackgroundBuild):
+        """Background load: one club at a time on a cold start, one pass over a snapshot"""
+        with self.sync_lock:
+            email_files = self.email_files()
+            if self.store.documents:
+                # The snapshot already answers queries for every club; only catch up on changes
+                build.ready_parts = self.indexed_clubs()
+                stages = [('', email_files)]
+            else:
+                stages = cumulative_stages(self.emails_directory, email_files)
+
+            results = sync_in_stages(build, self.store, stages, self.rw_lock, self.apply_sync_result)
+            if any(result.added_ids or result.removed_ids for result in results):
+                try:
+                    self.save_snapshot()
+                except OSError as e:
+                    build.errors[self.snapshot_path] = e
+
+    def save_snapshot(self):
+        """Write parsed emails and the keyword index for the next cold start (raises OSError)"""
+        if self.snapshot_path:
+            with self.sync_lock:
+                save_snapshot(self.snapshot_path, self.store, self.keyword_index)
+
+    def report_errors(self, errors: Dict[str, Exception]):
+        """Tell the user about files that failed to load; apps show these in their UI"""
+        for file_path, e in errors.items():
+            print(f"Error loading {file_path}: {e}")
+
+    def search_emails(self, query: str, top_k: int = 3, mode: str = 'count') -> List[SearchResult]:
+        """Keyword search answered from the index backend"""
+        with self.rw_lock.read():
+            return self.retrieve(query, top_k, mode)
+
+    def retrieve(self, query: str, top_k: int, mode: str = 'count') -> List[SearchResult]:
+        """Ranked results for a query; callers hold the read lock"""
+        return [self.result(doc_id, score) for doc_id, score in self.keyword_index.search(query, top_k, mode=mode)]
+
+    def result(self, doc_id: int, score: float, score_key: str = 'score') -> SearchResult:
+        return SearchResult(self.store.documents[doc_id], score, score_key, doc_id)
+
+    def facts_for(self, result: SearchResult) -> Fact:
+        """Facts extracted from a result's email at ingest time"""
+        return self.store.facts.row(result.doc_id) or extract_facts(result.record)
@@ -0,0 +1,283 @@
+"""
+Inverted keyword index shared by the email search apps
+"""
+import heapq
+import math
+import re
+from array import array
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Kana, kanji and half-width katakana: scripts written without spaces
+CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f'
+CJK_RUN_PATTERN = re.compile(f'[{CJK_CHARS}]+')
+WORD_PATTERN = re.compile(f'[^\\W{CJK_CHARS}]+')
+
+# Character n-gram sizes used for CJK runs
+NGRAM_SIZES = (2, 3)
+
+# Ranking modes accepted by InvertedIndex.search
+RANKING_MODES = ('count', 'bm25')
+
+# Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion damping constant (Cormack et al. use 60)
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens, skipping CJK runs"""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def tokenize_ngrams(text: str) -> List[str]:
+    """Split CJK runs into character bigrams and trigrams"""
+    ngrams = []
+    for run in CJK_RUN_PATTERN.findall(text):
+        if len(run) < min(NGRAM_SIZES):
+            ngrams.append(run)
+            continue
+        for size in NGRAM_SIZES:
+            ngrams.extend(run[i:i + size] for i in range(len(run) - size + 1))
+    return ngrams
+
+
+class InvertedIndex:
+    """Term -> postings index with per-document term frequencies"""
+
+    def __init__(self, emails_data: Iterable[Dict] = (),
+                 tokenizer: Callable[[str], List[str]] = tokenize):
+        self.tokenizer = tokenizer
+        self.vocabulary: Dict[str, int] = {}
+        self.postings_docs: List[array] = []
+        self.postings_freqs: List[array] = []
+        self.doc_count = 0
+        self.doc_lengths = array('I')
+        self.live = bytearray()
+        self.live_count = 0
+
+        # BM25 tables, refreshed whenever documents have been added or removed
+        self.idf = array('d')
+        self.length_norms = array('d')
+        self._stats_stale = False
+        self._removed_since_purge = 0
+
+        self.build(emails_data)
+
+    def build(self, emails_data: Iterable[Dict]):
+        """Index every email's content, in emails_data order"""
+        for email in emails_data:
+            self.add_document(email['content'])
+        self.refresh_statistics()
+
+    def refresh_statistics(self):
+        """Precompute IDF per term and BM25 length norm per document"""
+        if self._removed_since_purge:
+            self.purge_removed()
+
+        total_docs = self.live_count
+        self.idf = array('d', (
+            math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for docs in self.postings_docs
+        ))
+
+        avg_length = sum(self.doc_lengths) / total_docs if total_docs else 0.0
+        self.length_norms = array('d', (
+            BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) if avg_length else BM25_K1
+            for length in self.doc_lengths
+        ))
+        self._stats_stale = False
+
+    def add_document(self, text: str) -> int:
+        """Add a document and return its id (ids are assigned sequentially)"""
+        doc_id = self.doc_count
+        self.doc_count += 1
+        self.live_count += 1
+        self.live.append(1)
+        self._stats_stale = True
+
+        tokens = self.tokenizer(text)
+        self.doc_lengths.append(len(tokens))
+
+        term_freqs: Dict[str, int] = {}
+        for token in tokens:
+            term_freqs[token] = term_freqs.get(token, 0) + 1
+
+        for term, freq in term_freqs.items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = len(self.vocabulary)
+                self.vocabulary[term] = term_id
+                self.postings_docs.append(array('I'))
+                self.postings_freqs.append(array('I'))
+            self.postings_docs[term_id].append(doc_id)
+            self.postings_freqs[term_id].append(freq)
+
+        return doc_id
+
+    def remove_document(self, doc_id: int):
+        """Drop a document; its postings are purged on the next statistics refresh"""
+        if doc_id >= self.doc_count or not self.live[doc_id]:
+            return
+        self.live[doc_id] = 0
+        self.live_count -= 1
+        self.doc_lengths[doc_id] = 0
+        self._removed_since_purge += 1
+        self._stats_stale = True
+
+    def purge_removed(self):
+        """Rewrite postings without removed documents (ids are not renumbered)"""
+        live = self.live
+        for term_id, docs in enumerate(self.postings_docs):
+            freqs = self.postings_freqs[term_id]
+            keep = [i for i, doc_id in enumerate(docs) if live[doc_id]]
+            if len(keep) != len(docs):
+                self.postings_docs[term_id] = array('I', (docs[i] for i in keep))
+                self.postings_freqs[term_id] = array('I', (freqs[i] for i in keep))
+        self._removed_since_purge = 0
+
+    def search(self, query: str, top_k: int = 3, mode: str = 'count') -> List[Tuple[int, float]]:
+        """Return (doc_id, score) pairs ranked by the given mode
+
+        'count' sums raw query-term frequencies; 'bm25' applies Okapi BM25
+        using the precomputed IDF and document length tables.
+        """
+        scores = self.score(query, mode)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def score(self, query: str, mode: str = 'count') -> Dict[int, float]:
+        """Score every document sharing a term with the query"""
+        if mode not in RANKING_MODES:
+            raise ValueError(f"Unknown ranking mode: {mode}")
+        if self._stats_stale:
+            self.refresh_statistics()
+
+        scores: Dict[int, float] = {}
+
+        for term in self.tokenizer(query):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+
+            docs = self.postings_docs[term_id]
+            freqs = self.postings_freqs[term_id]
+            if mode == 'bm25':
+                idf = self.idf[term_id]
+                norms = self.length_norms
+                for doc_id, freq in zip(docs, freqs):
+                    weight = idf * freq * (BM25_K1 + 1) / (freq + norms[doc_id])
+                    scores[doc_id] = scores.get(doc_id, 0) + weight
+            else:
+                for doc_id, freq in zip(docs, freqs):
+                    scores[doc_id] = scores.get(doc_id, 0) + freq
+
+        return scores
+
+
+class KeywordIndex:
+    """Word index for Latin text plus a character n-gram index for CJK text
+
+    Both indexes share document ids, so a mixed query such as
+    "Mohamed Salah Jr.の契約条件は？" is answered from postings only: the
+    Latin words hit the word index and the Japanese run hits the n-gram index.
+    """
+
+    def __init__(self, emails_data: Iterable[Dict] = ()):
+        self.words = InvertedIndex(tokenizer=tokenize)
+        self.ngrams = InvertedIndex(tokenizer=tokenize_ngrams)
+        self.build(emails_data)
+
+    @property
+    def doc_count(self) -> int:
+        return self.words.doc_count
+
+    def build(self, emails_data: Iterable[Dict]):
+        """Index every email's content, in emails_data order"""
+        for email in emails_data:
+            self.add_document(email['content'])
+        self.refresh_statistics()
+
+    def refresh_statistics(self):
+        """Precompute the BM25 tables of both indexes"""
+        self.words.refresh_statistics()
+        self.ngrams.refresh_statistics()
+
+    def add_document(self, text: str) -> int:
+        """Add a document to both indexes and return its id"""
+        doc_id = self.words.add_document(text)
+        self.ngrams.add_document(text)
+        return doc_id
+
+    def remove_document(self, doc_id: int):
+        """Remove a document from both indexes"""
+        self.words.remove_document(doc_id)
+        self.ngrams.remove_document(doc_id)
+
+    def search(self, query: str, top_k: int = 3, mode: str = 'count') -> List[Tuple[int, float]]:
+        """Return (doc_id, score) pairs with word and n-gram scores summed"""
+        scores = self.words.score(query, mode)
+        for doc_id, score in self.ngrams.score(query, mode).items():
+            scores[doc_id] = scores.get(doc_id, 0) + score
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+class ScanIndex:
+    """Scores by scanning every document for substring counts of the query's words
+
+    This is the scoring the apps used before the inverted index, kept as a
+    reference backend: no tokenizer, so any substring (including Japanese)
+    matches, at the cost of a full pass over the corpus per query.
+    """
+
+    def __init__(self, emails_data: Iterable[Dict] = ()):
+        self.texts: List[str] = []
+        self.build(emails_data)
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.texts)
+
+    def build(self, emails_data: Iterable[Dict]):
+        """Index every email's content, in emails_data order"""
+        for email in emails_data:
+            self.add_document(email['content'])
+
+    def refresh_statistics(self):
+        """Nothing is precomputed"""
+
+    def add_document(self, text: str) -> int:
+        """Add a document and return its id (ids are assigned sequentially)"""
+        self.texts.append(text.lower())
+        return len(self.texts) - 1
+
+    def remove_document(self, doc_id: int):
+        """Drop a document and free its text"""
+        if doc_id < len(self.texts):
+            self.texts[doc_id] = ''
+
+    def search(self, query: str, top_k: int = 3, mode: str = 'count') -> List[Tuple[int, float]]:
+        """Return (doc_id, score) pairs, scoring the summed occurrence count of each query word"""
+        if mode != 'count':
+            raise ValueError(f"Unknown ranking mode for a scan: {mode}")
+        query_words = query.lower().split()
+        scores = {}
+        for doc_id, text in enumerate(self.texts):
+            score = sum(text.count(word) for word in query_words)
+            if score > 0:
+                scores[doc_id] = score
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Iterable[int]], top_k: int = 3,
+                           k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked doc id lists: each doc scores the sum of 1 / (k + rank) over the lists
+
+    Only ranks matter, so keyword counts, BM25 scores and cosine
+    similarities can be combined without calibrating them against each other.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
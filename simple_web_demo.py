@@ -3,100 +3,31 @@
 Simple HTML-based demo that can be opened in a browser
 """
 import os
-import glob
+import json
 import re
-from typing import List, Dict
+from functools import partial
+from typing import Callable, List, Dict, Tuple
 
-class EmailSearchApp:
-    def __init__(self, emails_directory: str):
-        self.emails_directory = emails_directory
-        self.emails_data = []
-        self.load_emails()
-    
-    def load_emails(self):
-        """Load all email files and extract content"""
-        email_files = glob.glob(os.path.join(self.emails_directory, "**/*.msg"), recursive=True)
-        
-        for file_path in email_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                email_data = self.parse_email(content, file_path)
-                self.emails_data.append(email_data)
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
-    
-    def parse_email(self, content: str, file_path: str) -> Dict:
-        """Parse email content and extract metadata"""
-        lines = content.split('\n')
-        
-        email_data = {
-            'file_path': file_path,
-            'club': os.path.basename(os.path.dirname(file_path)),
-            'filename': os.path.basename(file_path),
-            'content': content,
-            'from': '',
-            'to': '',
-            'subject': '',
-            'date': '',
-            'body': ''
-        }
-        
-        # Extract header information
-        body_start = 0
-        for i, line in enumerate(lines):
-            if line.startswith('From:'):
-                email_data['from'] = line[5:].strip()
-            elif line.startswith('To:'):
-                email_data['to'] = line[3:].strip()
-            elif line.startswith('Subject:'):
-                email_data['subject'] = line[8:].strip()
-            elif line.startswith('Date:'):
-                email_data['date'] = line[5:].strip()
-            elif line.strip() == '' and i > 3:
-                body_start = i + 1
-                break
-        
-        email_data['body'] = '\n'.join(lines[body_start:])
-        return email_data
-    
-    def search_emails(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Simple keyword-based search"""
-        query_words = query.lower().split()
-        results = []
-        
-        for email in self.emails_data:
-            content_lower = email['content'].lower()
-            score = 0
-            
-            for word in query_words:
-                if word in content_lower:
-                    score += content_lower.count(word)
-            
-            if score > 0:
-                email_copy = email.copy()
-                email_copy['score'] = score
-                results.append(email_copy)
-        
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
+from email_corpus import SearchResult, content_hash, find_email_files
+from search_engine import SearchEngine
 
-def generate_html_demo():
-    """Generate an HTML page with search results for sample queries"""
-    
-    # Initialize search app
-    emails_dir = "/root/Desktop/premier_league_emails_2040"
-    search_app = EmailSearchApp(emails_dir)
-    
-    sample_queries = [
-        "Mohamed Salah Jr.の契約条件は？",
-        "Gabriel Fernandez 移籍金",
-        "Arsenal contract salary",
-        "Kai Havertz Jr. transfer"
-    ]
-    
-    html_content = """
+EMAILS_DIRECTORY = "/root/Desktop/premier_league_emails_2040"
+
+SAMPLE_QUERIES = [
+    "Mohamed Salah Jr.の契約条件は？",
+    "Gabriel Fernandez 移籍金",
+    "Arsenal contract salary",
+    "Kai Havertz Jr. transfer"
+]
+RESULTS_PER_QUERY = 2
+
+# Rendered fragments from the previous run, kept next to the page
+FRAGMENT_CACHE_FILENAME = ".demo_fragments.json"
+
+# Modules next to this one whose code decides which results a query gets and how they read
+RESULT_MODULES = ("email_corpus.py", "fact_table.py", "search_index.py", "search_engine.py")
+
+PAGE_HEAD = """
 <!DOCTYPE html>
 <html lang="ja">
 <head>
@@ -223,7 +154,9 @@ def generate_html_demo():
         
         <div class="stats">
             <div class="stat-item">
-                <div class="stat-number">""" + str(len(search_app.emails_data)) + """</div>
+                <div class="stat-number">"""
+
+PAGE_STATS_TAIL = """</div>
                 <div class="stat-label">総メール数</div>
             </div>
             <div class="stat-item">
@@ -242,20 +175,34 @@ def generate_html_demo():
         
         <div class="content">
 """
-    
-    for query in sample_queries:
-        results = search_app.search_emails(query, top_k=2)
+
+PAGE_FOOTER = """
+        </div>
         
-        html_content += f"""
+        <div class="footer">
+            🏆 Premier League Email Search System 2040 | Built with Python | 📧 30 emails from Arsenal, Chelsea, Liverpool
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+def render_header(email_count: int) -> str:
+    """Page head, styles and the stats bar"""
+    return PAGE_HEAD + str(email_count) + PAGE_STATS_TAIL
+
+def render_query_section(query: str, results: List[SearchResult]) -> str:
+    """One sample question and its results"""
+    parts = [f"""
         <div class="query-section">
             <div class="query-header">
                 🔍 質問: {query}
             </div>
-"""
-        
-        if results:
-            for i, result in enumerate(results, 1):
-                html_content += f"""
+"""]
+    
+    if results:
+        for i, result in enumerate(results, 1):
+            parts.append(f"""
             <div class="result">
                 <div class="result-header">
                     📧 結果 {i}: {result['club']}/{result['filename']} (スコア: {result['score']})
@@ -267,72 +214,162 @@ def generate_html_demo():
                     <strong>送信者:</strong> {result['from']}<br>
                     <strong>宛先:</strong> {result['to']}
                 </div>
-"""
-                
-                # Add contract info if found
-                if any(word in query.lower() for word in ['契約', 'contract', 'salary']):
-                    # Extract contract details
-                    salary_match = re.search(r'£([\d,]+)/week|Weekly Wage: £([\d,]+)', result['body'])
-                    duration_match = re.search(r'Duration: (\d+) years', result['body'])
-                    appearances_match = re.search(r'(\d+) appearances', result['body'])
-                    goals_match = re.search(r'(\d+) goals', result['body'])
-                    
-                    if any([salary_match, duration_match, appearances_match, goals_match]):
-                        html_content += '<div class="contract-info"><strong>💼 契約情報:</strong><br>'
-                        if salary_match:
-                            salary = salary_match.group(1) or salary_match.group(2)
-                            html_content += f'💰 週給: £{salary}<br>'
-                        if duration_match:
-                            html_content += f'📆 契約期間: {duration_match.group(1)}年<br>'
-                        if appearances_match:
-                            html_content += f'⚽ 出場試合数: {appearances_match.group(1)}試合<br>'
-                        if goals_match:
-                            html_content += f'🥅 ゴール数: {goals_match.group(1)}ゴール<br>'
-                        html_content += '</div>'
-                
-                # Add transfer info if found
-                elif any(word in query.lower() for word in ['移籍', 'transfer']):
-                    fee_match = re.search(r'€([\d,]+) million|£([\d,]+) million', result['body'])
-                    if fee_match:
-                        currency = "€" if fee_match.group(1) else "£"
-                        amount = fee_match.group(1) or fee_match.group(2)
-                        html_content += f'<div class="transfer-info"><strong>🔄 移籍情報:</strong><br>💵 移籍金: {currency}{amount} million</div>'
+""")
+            
+            # Add contract info if found
+            if any(word in query.lower() for word in ['契約', 'contract', 'salary']):
+                # Extract contract details
+                salary_match = re.search(r'£([\d,]+)/week|Weekly Wage: £([\d,]+)', result['body'])
+                duration_match = re.search(r'Duration: (\d+) years', result['body'])
+                appearances_match = re.search(r'(\d+) appearances', result['body'])
+                goals_match = re.search(r'(\d+) goals', result['body'])
                 
-                html_content += '</div>'
+                if any([salary_match, duration_match, appearances_match, goals_match]):
+                    parts.append('<div class="contract-info"><strong>💼 契約情報:</strong><br>')
+                    if salary_match:
+                        salary = salary_match.group(1) or salary_match.group(2)
+                        parts.append(f'💰 週給: £{salary}<br>')
+                    if duration_match:
+                        parts.append(f'📆 契約期間: {duration_match.group(1)}年<br>')
+                    if appearances_match:
+                        parts.append(f'⚽ 出場試合数: {appearances_match.group(1)}試合<br>')
+                    if goals_match:
+                        parts.append(f'🥅 ゴール数: {goals_match.group(1)}ゴール<br>')
+                    parts.append('</div>')
+            
+            # Add transfer info if found
+            elif any(word in query.lower() for word in ['移籍', 'transfer']):
+                fee_match = re.search(r'€([\d,]+) million|£([\d,]+) million', result['body'])
+                if fee_match:
+                    currency = "€" if fee_match.group(1) else "£"
+                    amount = fee_match.group(1) or fee_match.group(2)
+                    parts.append(f'<div class="transfer-info"><strong>🔄 移籍情報:</strong><br>💵 移籍金: {currency}{amount} million</div>')
+            
+            parts.append('</div>')
+    else:
+        parts.append('<div class="no-results">❌ 関連するメールが見つかりませんでした</div>')
+    
+    parts.append('</div>')
+    return ''.join(parts)
+
+def template_fingerprint() -> str:
+    """Changes whenever this generator or the parsing, ranking and fact code behind its results changes"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    sources = []
+    for module_path in [__file__] + [os.path.join(directory, name) for name in RESULT_MODULES]:
+        with open(module_path, 'r', encoding='utf-8') as f:
+            sources.append(f.read())
+    return content_hash('\0'.join(sources))
+
+def corpus_stat_fingerprint(emails_directory: str) -> str:
+    """Cheap fingerprint of the mailbox from file paths, sizes and mtimes (nothing is read)"""
+    entries = []
+    for file_path in find_email_files(emails_directory):
+        stat = os.stat(file_path)
+        entries.append(f"{file_path}\0{stat.st_size}\0{stat.st_mtime_ns}")
+    return content_hash("\n".join(entries))
+
+def fragment_key(*parts: str) -> str:
+    return content_hash("\0".join(parts))
+
+def page_fragments(search_app: SearchEngine, sample_queries: List[str],
+                   template: str) -> List[Tuple[str, Callable[[], str]]]:
+    """(fingerprint, render) for each fragment of the page, in page order
+
+    A query section's fingerprint covers the query and the identity,
+    content and score of each result, so it only changes when the
+    rendered section would.
+    """
+    email_count = len(search_app.emails_data)
+    fragments = [(fragment_key(template, 'header', str(email_count)), partial(render_header, email_count))]
+    
+    for query in sample_queries:
+        results = search_app.search_emails(query, top_k=RESULTS_PER_QUERY)
+        result_keys = [f"{result['club']}/{result['filename']}:{result['score']}:{content_hash(result['content'])}"
+                       for result in results]
+        fragments.append((fragment_key(template, 'query', query, *result_keys),
+                          partial(render_query_section, query, results)))
+    
+    fragments.append((fragment_key(template, 'footer'), lambda: PAGE_FOOTER))
+    return fragments
+
+def generate_html_demo():
+    """Generate an HTML page with search results for sample queries"""
+    
+    # Initialize search app
+    search_app = SearchEngine(EMAILS_DIRECTORY)
+    
+    return ''.join(render() for _, render in page_fragments(search_app, SAMPLE_QUERIES, template_fingerprint()))
+
+def write_html_demo(output_file: str, emails_directory: str = EMAILS_DIRECTORY,
+                    sample_queries: List[str] = SAMPLE_QUERIES) -> Dict:
+    """Regenerate the page, re-rendering only fragments whose inputs changed
+
+    Fragments are cached next to the page. When the mailbox's file stats,
+    the template and the queries all match the previous run, the cached
+    fragments are reused without loading a single email. Otherwise the
+    emails are searched and only sections whose results changed are
+    re-rendered. The page is streamed fragment by fragment into a
+    temporary file, and left untouched when nothing in it changed.
+    """
+    cache_path = os.path.join(os.path.dirname(output_file) or '.', FRAGMENT_CACHE_FILENAME)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cached_fragments = cache.get('fragments', {})
+    
+    template = template_fingerprint()
+    run_key = fragment_key(template, corpus_stat_fingerprint(emails_directory), *sample_queries)
+    
+    keys = cache.get('run_keys', {}).get(run_key)
+    if keys is not None and all(key in cached_fragments for key in keys):
+        fragments = [(key, None) for key in keys]
+    else:
+        fragments = page_fragments(SearchEngine(emails_directory), sample_queries, template)
+    
+    rendered = 0
+    html_fragments = {}
+    for key, render in fragments:
+        if key in cached_fragments:
+            html_fragments[key] = cached_fragments[key]
         else:
-            html_content += '<div class="no-results">❌ 関連するメールが見つかりませんでした</div>'
-        
-        html_content += '</div>'
+            html_fragments[key] = render()
+            rendered += 1
     
-    html_content += """
-        </div>
-        
-        <div class="footer">
-            🏆 Premier League Email Search System 2040 | Built with Python | 📧 30 emails from Arsenal, Chelsea, Liverpool
-        </div>
-    </div>
-</body>
-</html>
-"""
+    keys = [key for key, _ in fragments]
+    page_key = fragment_key(*keys)
+    written = page_key != cache.get('page') or not os.path.exists(output_file)
+    if written:
+        temp_file = output_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for key in keys:
+                f.write(html_fragments[key])
+        os.replace(temp_file, output_file)
     
-    return html_content
+    # Keep only what this run used, so the cache does not grow across snapshots
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'run_keys': {run_key: keys}, 'page': page_key, 'fragments': html_fragments},
+                  f, ensure_ascii=False)
+    
+    return {'fragments': len(keys), 'rendered': rendered, 'written': written}
 
 def main():
     print("📄 HTMLデモページを生成中...")
     
-    html_content = generate_html_demo()
-    
     output_file = "/root/Desktop/premier_league_emails_2040/demo.html"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    stats = write_html_demo(output_file)
     
-    print(f"✅ デモページが生成されました: {output_file}")
+    if stats['written']:
+        print(f"✅ デモページが生成されました: {output_file}")
+    else:
+        print(f"✅ 変更はありません: {output_file}")
+    print(f"🧩 再描画 {stats['rendered']}/{stats['fragments']} フラグメント")
     print("🌐 ブラウザでファイルを開いて確認できます")
     print("\n📋 含まれているサンプル質問:")
-    print("  • Mohamed Salah Jr.の契約条件は？")
-    print("  • Gabriel Fernandez 移籍金")
-    print("  • Arsenal contract salary") 
-    print("  • Kai Havertz Jr. transfer")
+    for query in SAMPLE_QUERIES:
+        print(f"  • {query}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
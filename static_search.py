@@ -0,0 +1,364 @@
+"""
+Precomputed search data for the generated static HTML pages
+
+The pages ship a compact inverted index and fact table instead of the
+emails themselves, so the browser answers a query from postings lookups
+and never scans email text. Large corpora are written as gzipped shards
+instead: postings partitioned by term hash and email data partitioned by
+club, listed in a small manifest, so a query only downloads the postings
+shards holding its terms and the club shards holding its top hits.
+"""
+import gzip
+import json
+import math
+import os
+import re
+from typing import Dict, List, Sequence
+
+from email_corpus import EmailRecord
+from fact_table import extract_facts
+from search_index import CJK_CHARS, NGRAM_SIZES, KeywordIndex
+
+PAYLOAD_FORMAT = 1
+
+# Postings entries (term, document pairs) per postings shard
+POSTINGS_PER_SHARD = 50000
+
+# FNV-1a parameters of the term -> postings shard hash, mirrored in the page
+FNV_OFFSET = 0x811c9dc5
+FNV_PRIME = 0x01000193
+
+# The result card's fallback excerpt: non-empty lines among the first few of the body
+EXCERPT_LINES = 5
+
+CLEAN_SHEETS_PATTERN = re.compile(r'(\d+) clean sheets')
+
+# Email fields shown on a result card
+EMAIL_COLUMNS = ('filename', 'subject', 'date', 'from', 'to')
+
+# Fact columns read by the page; missing values are null
+FACT_COLUMNS = ('weekly_wage', 'fee', 'currency', 'duration', 'goals', 'assists',
+                'appearances', 'from_club', 'clean_sheets')
+
+
+def excerpt(body: str) -> List[str]:
+    """Stripped non-empty lines among the first EXCERPT_LINES lines of a body"""
+    return [line.strip() for line in body.split('\n')[:EXCERPT_LINES] if line.strip()]
+
+
+def encode_postings(docs: Sequence[int], freqs: Sequence[int]) -> List[List[int]]:
+    """[gaps between doc ids, freqs]; the freqs list is left out when every freq is 1"""
+    gaps = [doc_id - previous for previous, doc_id in zip([0] + list(docs), docs)]
+    if all(freq == 1 for freq in freqs):
+        return [gaps]
+    return [gaps, list(freqs)]
+
+
+def build_search_payload(emails_data: Sequence[EmailRecord]) -> Dict:
+    """Columnar emails, facts and keyword postings for the in-page search
+
+    Document ids are positions in ``emails_data``. Word terms and CJK
+    n-grams never collide, so both indexes share one vocabulary; the page
+    scores a document by the summed frequency of the query's terms, like
+    KeywordIndex's 'count' mode.
+    """
+    clubs = sorted({email['club'] for email in emails_data})
+    club_ids = {club: i for i, club in enumerate(clubs)}
+
+    emails = {column: [email[column] for email in emails_data] for column in EMAIL_COLUMNS}
+    emails['club'] = [club_ids[email['club']] for email in emails_data]
+    emails['excerpt'] = [excerpt(email['body']) for email in emails_data]
+
+    facts = {column: [] for column in FACT_COLUMNS}
+    for email in emails_data:
+        row = extract_facts(email)._asdict()
+        clean_sheets = CLEAN_SHEETS_PATTERN.search(email['body'])
+        row['clean_sheets'] = int(clean_sheets.group(1)) if clean_sheets else None
+        for column in FACT_COLUMNS:
+            facts[column].append(row[column] if row[column] != '' else None)
+
+    keyword_index = KeywordIndex(emails_data)
+    vocabulary, postings = [], []
+    for index in (keyword_index.words, keyword_index.ngrams):
+        for term, term_id in index.vocabulary.items():
+            vocabulary.append(term)
+            postings.append(encode_postings(index.postings_docs[term_id], index.postings_freqs[term_id]))
+
+    return {
+        'format': PAYLOAD_FORMAT,
+        'clubs': clubs,
+        'emails': emails,
+        'facts': facts,
+        'vocabulary': vocabulary,
+        'postings': postings,
+    }
+
+
+def payload_json(payload: Dict) -> str:
+    """Compact JSON that is safe inside a <script type="application/json"> element"""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+
+def term_shard(term: str, shard_count: int) -> int:
+    """Postings shard of a term: 32-bit FNV-1a over its code points"""
+    value = FNV_OFFSET
+    for char in term:
+        value = ((value ^ ord(char)) * FNV_PRIME) & 0xffffffff
+    return value % shard_count
+
+
+def shard_slug(club: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', club.lower()).strip('-') or 'club'
+
+
+def write_shard(path: str, data: Dict) -> int:
+    """Write one gzipped JSON shard and return its size in bytes"""
+    compressed = gzip.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                               mtime=0)
+    with open(path, 'wb') as f:
+        f.write(compressed)
+    return len(compressed)
+
+
+def write_sharded_payload(emails_data: Sequence[EmailRecord], output_directory: str,
+                          postings_per_shard: int = POSTINGS_PER_SHARD) -> Dict:
+    """Write postings and per-club email shards plus manifest.json; return the manifest
+
+    Emails are ordered by club so each club shard covers a contiguous range
+    of document ids. Every term lives in exactly one postings shard, so
+    scores summed across the shards a query touches equal the scores of
+    the single-file payload.
+    """
+    emails_data = sorted(emails_data, key=lambda email: email['club'])
+    payload = build_search_payload(emails_data)
+    os.makedirs(output_directory, exist_ok=True)
+
+    total_postings = sum(len(entry[0]) for entry in payload['postings'])
+    shard_count = max(1, math.ceil(total_postings / postings_per_shard))
+    postings_shards = [{'vocabulary': [], 'postings': []} for _ in range(shard_count)]
+    for term, entry in zip(payload['vocabulary'], payload['postings']):
+        shard = postings_shards[term_shard(term, shard_count)]
+        shard['vocabulary'].append(term)
+        shard['postings'].append(entry)
+
+    manifest = {'format': PAYLOAD_FORMAT, 'emails': len(emails_data), 'postings': [], 'docs': []}
+    for i, shard in enumerate(postings_shards):
+        path = f"postings-{i:03d}.json.gz"
+        size = write_shard(os.path.join(output_directory, path), shard)
+        manifest['postings'].append({'path': path, 'terms': len(shard['vocabulary']), 'bytes': size})
+
+    start = 0
+    for club_id, club in enumerate(payload['clubs']):
+        count = payload['emails']['club'].count(club_id)
+        rows = slice(start, start + count)
+        shard = {
+            'clubs': [club],
+            'emails': {column: values[rows] for column, values in payload['emails'].items()},
+            'facts': {column: values[rows] for column, values in payload['facts'].items()},
+        }
+        shard['emails']['club'] = [0] * count
+        path = f"docs-{club_id:03d}-{shard_slug(club)}.json.gz"
+        size = write_shard(os.path.join(output_directory, path), shard)
+        manifest['docs'].append({'club': club, 'path': path, 'start': start, 'count': count, 'bytes': size})
+        start += count
+
+    with open(os.path.join(output_directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+# Query tokenizer and postings search run in the page; kept in step with search_index
+SEARCH_SCRIPT = """
+const CJK_RUN_PATTERN = new RegExp('[' + %(cjk_chars)s + ']+', 'gu');
+const WORD_PATTERN = /[\\p{L}\\p{N}\\p{M}_]+/gu;
+const NGRAM_SIZES = %(ngram_sizes)s;
+
+function tokenizeQuery(query) {
+    const lower = query.toLowerCase();
+    const tokens = lower.replace(CJK_RUN_PATTERN, ' ').match(WORD_PATTERN) || [];
+    for (const run of query.match(CJK_RUN_PATTERN) || []) {
+        const chars = Array.from(run);
+        if (chars.length < Math.min(...NGRAM_SIZES)) {
+            tokens.push(run);
+            continue;
+        }
+        for (const size of NGRAM_SIZES) {
+            for (let i = 0; i + size <= chars.length; i++) {
+                tokens.push(chars.slice(i, i + size).join(''));
+            }
+        }
+    }
+    return tokens;
+}
+
+function loadSearchIndex(data) {
+    const termIds = new Map();
+    data.vocabulary.forEach((term, termId) => termIds.set(term, termId));
+    return { data: data, termIds: termIds };
+}
+
+function scoreTerm(index, term, scores) {
+    const termId = index.termIds.get(term);
+    if (termId === undefined) {
+        return;
+    }
+    const [gaps, freqs] = index.data.postings[termId];
+    let docId = 0;
+    for (let i = 0; i < gaps.length; i++) {
+        docId += gaps[i];
+        scores.set(docId, (scores.get(docId) || 0) + (freqs ? freqs[i] : 1));
+    }
+}
+
+function topHits(scores, topK) {
+    return Array.from(scores, ([docId, score]) => ({ docId: docId, score: score }))
+        .sort((a, b) => b.score - a.score || a.docId - b.docId)
+        .slice(0, topK);
+}
+
+function searchIndex(index, query, topK) {
+    const scores = new Map();
+    for (const term of tokenizeQuery(query)) {
+        scoreTerm(index, term, scores);
+    }
+    return topHits(scores, topK);
+}
+
+function emailAt(index, docId) {
+    const emails = index.data.emails;
+    const email = { docId: docId, club: index.data.clubs[emails.club[docId]], excerpt: emails.excerpt[docId] };
+    for (const column of %(email_columns)s) {
+        email[column] = emails[column][docId];
+    }
+    const facts = {};
+    for (const column in index.data.facts) {
+        facts[column] = index.data.facts[column][docId];
+    }
+    email.facts = facts;
+    return email;
+}
+""" % {
+    'cjk_chars': json.dumps(CJK_CHARS),
+    'ngram_sizes': json.dumps(list(NGRAM_SIZES)),
+    'email_columns': json.dumps(list(EMAIL_COLUMNS)),
+}
+
+
+# Shard loading for pages written with write_sharded_payload; needs SEARCH_SCRIPT
+SHARDED_SEARCH_SCRIPT = """
+const FNV_OFFSET = %(fnv_offset)d;
+const FNV_PRIME = %(fnv_prime)d;
+const shardRequests = new Map();
+
+function termShard(term, shardCount) {
+    let value = FNV_OFFSET;
+    for (const char of term) {
+        value = Math.imul(value ^ char.codePointAt(0), FNV_PRIME) >>> 0;
+    }
+    return value %% shardCount;
+}
+
+function fetchShard(baseUrl, shard, load) {
+    // Each shard is downloaded and loaded at most once; a failed download is retried on the next query
+    if (!shardRequests.has(shard.path)) {
+        const request = fetch(baseUrl + shard.path).then(response => {
+            if (!response.ok) {
+                throw new Error(`${shard.path}: HTTP ${response.status}`);
+            }
+            return new Response(response.body.pipeThrough(new DecompressionStream('gzip'))).json();
+        }).then(load);
+        request.catch(() => shardRequests.delete(shard.path));
+        shardRequests.set(shard.path, request);
+    }
+    return shardRequests.get(shard.path);
+}
+
+function docShardOf(manifest, docId) {
+    let low = 0;
+    let high = manifest.docs.length - 1;
+    while (low < high) {
+        const middle = (low + high + 1) >> 1;
+        if (manifest.docs[middle].start <= docId) {
+            low = middle;
+        } else {
+            high = middle - 1;
+        }
+    }
+    return manifest.docs[low];
+}
+
+async function searchShards(manifest, baseUrl, query, topK) {
+    const terms = tokenizeQuery(query);
+    const shardIds = [...new Set(terms.map(term => termShard(term, manifest.postings.length)))];
+    const indexes = new Map(await Promise.all(shardIds.map(async shardId =>
+        [shardId, await fetchShard(baseUrl, manifest.postings[shardId], loadSearchIndex)])));
+
+    const scores = new Map();
+    for (const term of terms) {
+        scoreTerm(indexes.get(termShard(term, manifest.postings.length)), term, scores);
+    }
+    const hits = topHits(scores, topK);
+
+    // Only the clubs holding the top hits are downloaded
+    return Promise.all(hits.map(async hit => {
+        const shard = docShardOf(manifest, hit.docId);
+        const email = emailAt(await fetchShard(baseUrl, shard, data => ({ data: data })), hit.docId - shard.start);
+        email.docId = hit.docId;
+        email.score = hit.score;
+        return email;
+    }));
+}
+""" % {
+    'fnv_offset': FNV_OFFSET,
+    'fnv_prime': FNV_PRIME,
+}
+
+
+# Body of the search Web Worker, appended to the search scripts above. The worker
+# owns the parsed index; only the newest query is answered, older ones are dropped.
+SEARCH_WORKER_SCRIPT = """
+let index = null;
+let manifest = null;
+let baseUrl = '';
+let latest = null;
+let scheduled = false;
+
+self.onmessage = event => {
+    const message = event.data;
+    if (message.type === 'load') {
+        const data = JSON.parse(message.text);
+        if (data.docs) {
+            manifest = data;
+            baseUrl = message.baseUrl;
+        } else {
+            index = loadSearchIndex(data);
+        }
+        return;
+    }
+    // Queries typed while this one waits in the queue replace it
+    latest = message;
+    if (!scheduled) {
+        scheduled = true;
+        setTimeout(runLatest, 0);
+    }
+};
+
+async function runLatest() {
+    scheduled = false;
+    const message = latest;
+    let response;
+    try {
+        const results = manifest
+            ? await searchShards(manifest, baseUrl, message.query, message.topK)
+            : searchIndex(index, message.query, message.topK).map(hit =>
+                Object.assign(emailAt(index, hit.docId), { score: hit.score }));
+        response = { id: message.id, results: results };
+    } catch (error) {
+        response = { id: message.id, error: error.message };
+    }
+    // A newer query arrived while shards were downloading; its answer follows
+    if (message === latest) {
+        self.postMessage(response);
+    }
+}
+"""
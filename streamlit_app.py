@@ -1,8 +1,15 @@
 import streamlit as st
 import os
-import glob
-import re
-from typing import List, Dict
+from typing import List, Dict, Tuple
+
+from corpus_snapshot import default_snapshot_path
+from email_corpus import SearchResult, SyncResult
+from engine_runtime import process_memory, show_build_status
+from fact_aggregates import GROUP_KEYS, STATISTICS, FactAggregates
+from fact_table import NUMERIC_FIELDS, Fact, format_money
+from numeric_query import NumericQuery, parse_numeric_query
+from query_cache import CachedResult, QueryCache
+from search_engine import SearchEngine
 
 # Configure page
 st.set_page_config(
@@ -12,108 +19,92 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-class EmailSearchApp:
-    def __init__(self, emails_directory: str = "."):
-        self.emails_directory = emails_directory
-        self.emails_data = self.load_emails()
+CLUBS = ["Arsenal", "Chelsea", "Liverpool"]
+
+# Names this app's snapshot in the app-owned snapshot directory (corpus_snapshot)
+SNAPSHOT_NAME = "streamlit_app"
+
+# Display names of the numeric fact fields, and how many matches a numeric answer lists
+NUMERIC_FIELD_LABELS = {
+    'weekly_wage': '週給',
+    'fee': '移籍金',
+    'duration': '契約期間',
+    'goals': 'ゴール数',
+    'assists': 'アシスト数',
+    'appearances': '出場試合数',
+}
+NUMERIC_ANSWER_LIMIT = 10
+
+GROUP_KEY_LABELS = {'club': 'クラブ', 'date': '月', 'sender': '送信者'}
+STATISTIC_LABELS = {'count': '件数', 'sum': '合計', 'mean': '平均', 'min': '最小', 'max': '最大'}
+
+class EmailSearchApp(SearchEngine):
+    def __init__(self, emails_directory: str = ".", snapshot_path: str = None, background: bool = False):
+        # Start from the last snapshot; loading then only indexes what changed since
+        super().__init__(emails_directory, CLUBS,
+                         snapshot_path=snapshot_path or default_snapshot_path(emails_directory, SNAPSHOT_NAME),
+                         background=background)
     
-    @st.cache_data
-    def load_emails(_self):
+    def restore(self, snapshot):
+        """Adopt the snapshot and aggregate over its fact table"""
+        super().restore(snapshot)
+        self.aggregates = FactAggregates(self.store)
+    
+    def load_emails(self) -> SyncResult:
         """Load all email files and extract content"""
-        emails_data = []
+        return self.update_emails()
+    
+    def report_errors(self, errors):
+        """Show files that failed to load on the page"""
+        for file_path, e in errors.items():
+            st.error(f"Error loading {file_path}: {e}")
+    
+    def update_emails(self) -> SyncResult:
+        """Index only the email files added, changed or removed since the last load"""
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        # Search for email files in subdirectories
-        email_files = []
-        for club in ["Arsenal", "Chelsea", "Liverpool"]:
-            club_dir = os.path.join(_self.emails_directory, club)
-            if os.path.exists(club_dir):
-                email_files.extend(glob.glob(os.path.join(club_dir, "*.msg")))
-        
-        total_files = len(email_files)
-        for i, file_path in enumerate(email_files):
-            try:
-                progress = (i + 1) / total_files
-                progress_bar.progress(progress)
-                status_text.text(f"Loading {os.path.basename(file_path)}... ({i+1}/{total_files})")
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                email_data = _self.parse_email_static(content, file_path)
-                emails_data.append(email_data)
-            except Exception as e:
-                st.error(f"Error loading {file_path}: {e}")
+        def show_progress(i: int, total_files: int, file_path: str):
+            progress_bar.progress((i + 1) / total_files)
+            status_text.text(f"Loading {os.path.basename(file_path)}... ({i+1}/{total_files})")
+        
+        result = self.sync(progress_fn=show_progress)
+        self.report_errors(result.errors)
         
         progress_bar.empty()
         status_text.empty()
         
-        return emails_data
-    
-    @staticmethod
-    def parse_email_static(content: str, file_path: str) -> Dict:
-        """Parse email content and extract metadata"""
-        lines = content.split('\n')
-        
-        email_data = {
-            'file_path': file_path,
-            'club': os.path.basename(os.path.dirname(file_path)),
-            'filename': os.path.basename(file_path),
-            'content': content,
-            'from': '',
-            'to': '',
-            'subject': '',
-            'date': '',
-            'body': ''
-        }
-        
-        # Extract header information
-        body_start = 0
-        for i, line in enumerate(lines):
-            if line.startswith('From:'):
-                email_data['from'] = line[5:].strip()
-            elif line.startswith('To:'):
-                email_data['to'] = line[3:].strip()
-            elif line.startswith('Subject:'):
-                email_data['subject'] = line[8:].strip()
-            elif line.startswith('Date:'):
-                email_data['date'] = line[5:].strip()
-            elif line.strip() == '' and i > 3:
-                body_start = i + 1
-                break
-        
-        email_data['body'] = '\n'.join(lines[body_start:])
-        return email_data
+        return result
     
-    def search_emails(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Simple keyword-based search"""
-        query_words = query.lower().split()
-        results = []
-        
-        for email in self.emails_data:
-            content_lower = email['content'].lower()
-            score = 0
+    def answer_query(self, query: str, top_k: int = 3, mode: str = 'count') -> Tuple[List[SearchResult], str, str]:
+        """Search and answer, reusing the result of an identical query on the same corpus version"""
+        key = QueryCache.key(query, top_k, mode)
+        with self.rw_lock.read():
+            version = self.store.version
             
-            for word in query_words:
-                if word in content_lower:
-                    score += content_lower.count(word)
+            cached = self.query_cache.get(key, version)
+            if cached is not None:
+                results = [self.result(doc_id, score) for doc_id, score in cached.hits]
+                return (results,) + cached.answer
             
-            if score > 0:
-                email_copy = email.copy()
-                email_copy['score'] = score
-                results.append(email_copy)
-        
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
+            results = self.retrieve(query, top_k, mode=mode)
+            # Range and top-N questions are answered from the fact table even without keyword hits
+            if results or parse_numeric_query(query, CLUBS) is not None:
+                answer = self.generate_answer(query, results)
+            else:
+                answer = ("", "")
+            self.query_cache.put(key, version, CachedResult([(result.doc_id, result.score) for result in results], answer))
+            return (results,) + answer
     
     def generate_answer(self, query: str, search_results: List[Dict]) -> tuple[str, str]:
         """Generate direct answer and sources based on search results"""
-        if not search_results:
+        if not search_results and parse_numeric_query(query, CLUBS) is None:
             return "申し訳ございませんが、関連するメールが見つかりませんでした。", ""
         
         # Generate direct answer first
         direct_answer = self.generate_direct_answer(query, search_results)
+        if not search_results:
+            return direct_answer, ""
         
         # Generate sources section
         sources = "\n## 📋 参考となったメール\n\n"
@@ -138,6 +129,11 @@ class EmailSearchApp:
     
     def generate_direct_answer(self, query: str, search_results: List[Dict]) -> str:
         """Generate a direct, concise answer to the user's question"""
+        # Range and top-N questions are answered from the sorted fact columns
+        numeric_query = parse_numeric_query(query, CLUBS)
+        if numeric_query is not None:
+            return self.answer_numeric_question(numeric_query)
+        
         if not search_results:
             return "関連情報が見つかりませんでした。"
         
@@ -160,75 +156,108 @@ class EmailSearchApp:
         else:
             return self.answer_general_question(query, search_results)
     
-    def answer_contract_question(self, query: str, search_results: List[Dict]) -> str:
+    def answer_numeric_question(self, numeric_query: NumericQuery) -> str:
+        """Answer range and top-N questions by binary search over the fact table"""
+        facts = self.store.facts
+        field = numeric_query.field
+        
+        if numeric_query.top_n is not None:
+            matches = facts.top_n(field, numeric_query.top_n, numeric_query.largest, club=numeric_query.club)
+        else:
+            matches = facts.range_query(field, numeric_query.low, numeric_query.high,
+                                        numeric_query.include_low, numeric_query.include_high,
+                                        club=numeric_query.club)
+            matches.reverse()  # Largest first
+        
+        condition = self.describe_numeric_query(numeric_query)
+        if not matches:
+            return f"📊 {condition}に該当する選手は見つかりませんでした。"
+        
+        answer = f"📊 **{condition}:** {len(matches)}件\n"
+        for doc_id, _ in matches[:NUMERIC_ANSWER_LIMIT]:
+            email = self.store.documents[doc_id]
+            fact = facts.row(doc_id)
+            name = fact.player or email['subject']
+            answer += f"- {name} ({email['club']}): {self.format_fact_value(field, fact)}\n"
+        if len(matches) > NUMERIC_ANSWER_LIMIT:
+            answer += f"- ...他{len(matches) - NUMERIC_ANSWER_LIMIT}件\n"
+        
+        return answer
+    
+    def describe_numeric_query(self, numeric_query: NumericQuery) -> str:
+        """Human-readable condition, e.g. 'Arsenal 週給 £150,000超'"""
+        def amount(value: float) -> str:
+            if numeric_query.field == 'weekly_wage':
+                return f"£{format_money(value)}"
+            if numeric_query.field == 'fee':
+                return f"£{format_money(round(value, 2))} million"
+            return format_money(value)
+        
+        parts = [numeric_query.club] if numeric_query.club else []
+        parts.append(NUMERIC_FIELD_LABELS[numeric_query.field])
+        if numeric_query.top_n is not None:
+            parts.append(f"{'上位' if numeric_query.largest else '下位'}{numeric_query.top_n}件")
+        if numeric_query.low is not None:
+            parts.append(amount(numeric_query.low) + ("以上" if numeric_query.include_low else "超"))
+        if numeric_query.high is not None:
+            parts.append(amount(numeric_query.high) + ("以下" if numeric_query.include_high else "未満"))
+        return ' '.join(parts)
+    
+    def format_fact_value(self, field: str, fact: Fact) -> str:
+        """One numeric fact as shown in answers"""
+        if field == 'weekly_wage':
+            return f"週給£{format_money(fact.weekly_wage)}"
+        if field == 'fee':
+            return f"移籍金{fact.currency}{format_money(fact.fee)} million"
+        if field == 'duration':
+            return f"{fact.duration}年契約"
+        if field == 'goals':
+            return f"{fact.goals}ゴール"
+        if field == 'assists':
+            return f"{fact.assists}アシスト"
+        return f"{fact.appearances}試合出場"
+    
+    def answer_contract_question(self, query: str, search_results: List[SearchResult]) -> str:
         """Answer contract-related questions"""
         for result in search_results:
-            contract_info = self.extract_contract_info(result['body'])
-            if contract_info:
-                # Extract key information for direct answer
-                body = result['body']
+            facts = self.facts_for(result)
+            if self.extract_contract_info(facts):
                 player_name = self.extract_player_name(query, result)
                 
-                # Extract salary
-                salary_match = re.search(r'£([\d,]+)/week|Weekly Wage: £([\d,]+)|Base Salary: £([\d,]+)', body)
-                if salary_match:
-                    salary = salary_match.group(1) or salary_match.group(2) or salary_match.group(3)
-                    return f"💰 **{player_name}の契約条件:** 週給£{salary}です。"
+                # Salary first, then duration
+                if facts.weekly_wage is not None:
+                    return f"💰 **{player_name}の契約条件:** 週給£{format_money(facts.weekly_wage)}です。"
                 
-                # Extract duration
-                duration_match = re.search(r'Duration: (\d+) years', body)
-                if duration_match:
-                    duration = duration_match.group(1)
-                    return f"📅 **{player_name}の契約期間:** {duration}年契約です。"
+                if facts.duration is not None:
+                    return f"📅 **{player_name}の契約期間:** {facts.duration}年契約です。"
         
         return "💼 契約に関する具体的な情報が見つかりませんでした。"
     
-    def answer_transfer_question(self, query: str, search_results: List[Dict]) -> str:
+    def answer_transfer_question(self, query: str, search_results: List[SearchResult]) -> str:
         """Answer transfer-related questions"""
         for result in search_results:
-            body = result['body']
-            player_name = self.extract_player_name(query, result)
-            
-            # Extract transfer fee
-            fee_patterns = [
-                r'Transfer Fee: £([\d,]+) million',
-                r'Fee: £([\d,]+) million',
-                r'€([\d,]+) million'
-            ]
-            
-            for pattern in fee_patterns:
-                match = re.search(pattern, body)
-                if match:
-                    fee = match.group(1)
-                    currency = "£" if "£" in pattern else "€"
-                    return f"💵 **{player_name}の移籍金:** {currency}{fee} millionです。"
+            facts = self.facts_for(result)
+            if facts.fee is not None:
+                player_name = self.extract_player_name(query, result)
+                return f"💵 **{player_name}の移籍金:** {facts.currency}{format_money(facts.fee)} millionです。"
         
         return "🔄 移籍金に関する具体的な情報が見つかりませんでした。"
     
-    def answer_performance_question(self, query: str, search_results: List[Dict]) -> str:
+    def answer_performance_question(self, query: str, search_results: List[SearchResult]) -> str:
         """Answer performance-related questions"""
         for result in search_results:
-            body = result['body']
-            player_name = self.extract_player_name(query, result)
+            facts = self.facts_for(result)
             
             stats = []
-            
-            # Extract goals
-            goals_match = re.search(r'(\d+) goals', body)
-            if goals_match:
-                stats.append(f"{goals_match.group(1)}ゴール")
-            
-            # Extract assists
-            assists_match = re.search(r'(\d+) assists', body)
-            if assists_match:
-                stats.append(f"{assists_match.group(1)}アシスト")
-            
-            # Extract appearances
-            appearances_match = re.search(r'(\d+) appearances', body)
-            if appearances_match:
-                stats.append(f"{appearances_match.group(1)}試合出場")
+            if facts.goals is not None:
+                stats.append(f"{facts.goals}ゴール")
+            if facts.assists is not None:
+                stats.append(f"{facts.assists}アシスト")
+            if facts.appearances is not None:
+                stats.append(f"{facts.appearances}試合出場")
             
             if stats:
+                player_name = self.extract_player_name(query, result)
                 return f"⚽ **{player_name}の成績:** {', '.join(stats)}です。"
         
         return "📊 成績に関する具体的な情報が見つかりませんでした。"
@@ -274,101 +303,96 @@ class EmailSearchApp:
         
         return "選手"
     
-    def extract_contract_info(self, body: str) -> str:
-        """Extract contract-related information"""
+    def extract_contract_info(self, facts: Fact) -> str:
+        """Format the contract-related facts of an email"""
         info = "💼 契約情報:\n"
         found_info = False
         
-        # Extract salary information
-        salary_patterns = [
-            r'£([\d,]+)/week',
-            r'Weekly Wage: £([\d,]+)',
-            r'Base Salary: £([\d,]+) per week'
-        ]
-        
-        for pattern in salary_patterns:
-            match = re.search(pattern, body)
-            if match:
-                info += f"  💰 週給: £{match.group(1)}\n"
-                found_info = True
-                break
-        
-        # Extract contract duration
-        duration_match = re.search(r'Duration: (\d+) years', body)
-        if duration_match:
-            info += f"  📆 契約期間: {duration_match.group(1)}年\n"
+        if facts.weekly_wage is not None:
+            info += f"  💰 週給: £{format_money(facts.weekly_wage)}\n"
             found_info = True
         
-        # Extract appearances
-        appearances_match = re.search(r'(\d+) appearances', body)
-        if appearances_match:
-            info += f"  ⚽ 出場試合数: {appearances_match.group(1)}試合\n"
+        if facts.duration is not None:
+            info += f"  📆 契約期間: {facts.duration}年\n"
             found_info = True
         
-        # Extract goals
-        goals_match = re.search(r'(\d+) goals', body)
-        if goals_match:
-            info += f"  🥅 ゴール数: {goals_match.group(1)}ゴール\n"
+        if facts.appearances is not None:
+            info += f"  ⚽ 出場試合数: {facts.appearances}試合\n"
             found_info = True
         
-        # Extract assists
-        assists_match = re.search(r'(\d+) assists', body)
-        if assists_match:
-            info += f"  🎯 アシスト数: {assists_match.group(1)}アシスト\n"
+        if facts.goals is not None:
+            info += f"  🥅 ゴール数: {facts.goals}ゴール\n"
             found_info = True
         
-        return info if found_info else ""
-    
-    def extract_transfer_info(self, body: str) -> str:
-        """Extract transfer-related information"""
-        info = "🔄 移籍情報:\n"
-        found_info = False
-        
-        # Extract transfer fee
-        fee_patterns = [
-            r'Transfer Fee: £([\d,]+) million',
-            r'Fee: £([\d,]+) million',
-            r'€([\d,]+) million'
-        ]
-        
-        for pattern in fee_patterns:
-            match = re.search(pattern, body)
-            if match:
-                currency = "£" if "£" in pattern else "€"
-                info += f"  💵 移籍金: {currency}{match.group(1)} million\n"
-                found_info = True
-                break
+        if facts.assists is not None:
+            info += f"  🎯 アシスト数: {facts.assists}アシスト\n"
+            found_info = True
         
         return info if found_info else ""
+    
+    def extract_transfer_info(self, facts: Fact) -> str:
+        """Format the transfer-related facts of an email"""
+        if facts.fee is None:
+            return ""
+        return f"🔄 移籍情報:\n  💵 移籍金: {facts.currency}{format_money(facts.fee)} million\n"
 
 @st.cache_resource
 def get_email_search_app():
-    """Create and cache the EmailSearchApp instance"""
-    return EmailSearchApp()
+    """Create the EmailSearchApp once per process and share it across sessions"""
+    return EmailSearchApp(background=True)
 
 def main():
     # Header
     st.title("⚽ プレミアリーグ メール検索システム")
     st.markdown("### 2040年のプレミアリーグクラブのメールから選手情報を検索")
     
-    # Initialize the app with caching
-    with st.spinner("📧 メールデータを読み込み中..."):
-        search_app = get_email_search_app()
-    st.success(f"✅ {len(search_app.emails_data)}通のメールを読み込みました")
+    # Initialize the app with caching; emails load in the background
+    search_app = get_email_search_app()
+    show_build_status(search_app.build, len(search_app.emails_data))
     
     # Sidebar with information
     with st.sidebar:
         st.header("📊 システム情報")
-        total_emails = len(search_app.emails_data)
-        clubs = list(set([email['club'] for email in search_app.emails_data]))
+        # The background build may be swapping in a club's emails
+        with search_app.rw_lock.read():
+            total_emails = len(search_app.emails_data)
+            club_counts = search_app.aggregates.aggregate('club')
         
         st.metric("📧 総メール数", total_emails)
-        st.metric("🏟️ 対象クラブ数", len(clubs))
+        st.metric("🏟️ 対象クラブ数", len(club_counts))
         
         st.subheader("🏆 対象クラブ")
-        for club in sorted(clubs):
-            club_emails = len([e for e in search_app.emails_data if e['club'] == club])
-            st.write(f"🔸 **{club}**: {club_emails}通")
+        for club, club_emails in club_counts.items():
+            st.write(f"🔸 **{club}**: {club_emails:g}通")
+        
+        with st.expander("📈 集計"):
+            group_key = st.selectbox("グループ", GROUP_KEYS, format_func=GROUP_KEY_LABELS.get)
+            field = st.selectbox("項目", NUMERIC_FIELDS, format_func=NUMERIC_FIELD_LABELS.get)
+            statistic = st.selectbox("集計方法", STATISTICS, index=1, format_func=STATISTIC_LABELS.get)
+            with search_app.rw_lock.read():
+                aggregated = search_app.aggregates.aggregate(group_key, field, statistic)
+            st.table({
+                GROUP_KEY_LABELS[group_key]: list(aggregated),
+                f"{NUMERIC_FIELD_LABELS[field]} ({STATISTIC_LABELS[statistic]})": [
+                    f"{value:,.2f}".rstrip('0').rstrip('.') for value in aggregated.values()
+                ],
+            })
+            if field == 'fee':
+                st.caption("移籍金は£ million換算 (€は固定レートで換算)")
+        
+        if st.button("🔄 新着メールを取り込む", disabled=not search_app.build.ready):
+            result = search_app.update_emails()
+            if result.added_ids or result.removed_ids:
+                try:
+                    search_app.save_snapshot()
+                except OSError as e:
+                    search_app.report_errors({search_app.snapshot_path: e})
+            st.info(f"追加・更新 {len(result.added_ids)}通 / 削除 {len(result.removed_ids)}通")
+        
+        st.caption(f"クエリキャッシュ: {len(search_app.query_cache.entries)}件 / ヒット率 {search_app.query_cache.hit_rate:.0%}")
+        memory = process_memory()
+        st.caption(f"🧠 PID {memory['pid']}: RSS {memory['rss_bytes'] / 2**20:.1f} MB "
+                   f"(ピーク {memory['peak_rss_bytes'] / 2**20:.1f} MB)")
         
         st.markdown("---")
         st.subheader("💡 使い方のヒント")
@@ -414,44 +438,54 @@ def main():
     search_clicked = col1.button("🔍 検索", type="primary")
     clear_clicked = col2.button("🗑️ クリア")
     
+    # Ranking mode
+    ranking_mode = col3.radio(
+        "ランキング方式:",
+        options=["count", "bm25"],
+        format_func=lambda mode: "出現回数" if mode == "count" else "BM25",
+        horizontal=True,
+        key="ranking_mode"
+    )
+    
     if clear_clicked:
         st.rerun()
     
     # Perform search
     if search_clicked and query:
         with st.spinner("🔍 検索中..."):
-            results = search_app.search_emails(query, top_k=3)
+            # Search and generate the direct answer and sources, or reuse a cached result
+            results, direct_answer, sources = search_app.answer_query(query, top_k=3, mode=ranking_mode)
             
-            if results:
-                st.success(f"✅ {len(results)}件の関連メールが見つかりました")
-                
-                # Generate direct answer and sources
-                direct_answer, sources = search_app.generate_answer(query, results)
+            if results or direct_answer:
+                if results:
+                    st.success(f"✅ {len(results)}件の関連メールが見つかりました")
                 
                 st.markdown("---")
                 st.subheader("💡 回答")
                 st.markdown(direct_answer)
                 
-                st.markdown(sources)
-                
-                # Show detailed email content in expandable sections
-                st.markdown("---")
-                st.subheader("📧 詳細なメール内容")
+                if sources:
+                    st.markdown(sources)
                 
-                for i, result in enumerate(results, 1):
-                    with st.expander(f"📄 {i}. {result['club']} - {result['subject']} (スコア: {result['score']})"):
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.write(f"**送信者:** {result['from']}")
-                            st.write(f"**宛先:** {result['to']}")
-                        
-                        with col2:
-                            st.write(f"**日付:** {result['date']}")
-                            st.write(f"**クラブ:** {result['club']}")
-                        
-                        st.markdown("**内容:**")
-                        st.text(result['body'])
+                if results:
+                    # Show detailed email content in expandable sections
+                    st.markdown("---")
+                    st.subheader("📧 詳細なメール内容")
+                    
+                    for i, result in enumerate(results, 1):
+                        with st.expander(f"📄 {i}. {result['club']} - {result['subject']} (スコア: {result['score']:g})"):
+                            col1, col2 = st.columns(2)
+                            
+                            with col1:
+                                st.write(f"**送信者:** {result['from']}")
+                                st.write(f"**宛先:** {result['to']}")
+                            
+                            with col2:
+                                st.write(f"**日付:** {result['date']}")
+                                st.write(f"**クラブ:** {result['club']}")
+                            
+                            st.markdown("**内容:**")
+                            st.text(result['body'])
             else:
                 st.warning("❌ 関連するメールが見つかりませんでした。別のキーワードで検索してみてください。")
     
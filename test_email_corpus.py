@@ -0,0 +1,102 @@
+"""
+Tests for incremental corpus sync: manifest diffs and EmailStore add/change/remove handling
+"""
+import os
+import shutil
+
+from conftest import CLUBS
+from email_corpus import EmailStore, find_email_files, parse_emails
+
+
+def sync(store: EmailStore, mailbox: str):
+    return store.sync(find_email_files(mailbox, CLUBS))
+
+
+def rewrite(file_path: str, content: str):
+    """Write new content with a different mtime, as mail delivery would"""
+    stat = os.stat(file_path)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_initial_sync_adds_every_file(mailbox):
+    store = EmailStore(parse_workers=1)
+    result = sync(store, mailbox)
+    file_count = len(find_email_files(mailbox, CLUBS))
+    assert result.added_ids == list(range(file_count))
+    assert result.removed_ids == [] and result.errors == {}
+    assert len(store.emails_data) == file_count
+    assert store.version == 1
+
+
+def test_unchanged_mailbox_is_a_no_op(mailbox):
+    store = EmailStore(parse_workers=1)
+    sync(store, mailbox)
+    result = sync(store, mailbox)
+    assert result.added_ids == [] and result.removed_ids == []
+    assert store.version == 1
+
+
+def test_touched_file_with_same_content_is_not_reindexed(mailbox):
+    store = EmailStore(parse_workers=1)
+    sync(store, mailbox)
+    file_path = os.path.join(mailbox, 'Arsenal', 'email_001.msg')
+    with open(file_path, encoding='utf-8') as f:
+        rewrite(file_path, f.read())
+    result = sync(store, mailbox)
+    assert result.added_ids == [] and result.removed_ids == []
+
+
+def test_added_changed_and_removed_files(mailbox):
+    store = EmailStore(parse_workers=1)
+    sync(store, mailbox)
+    count = len(store.emails_data)
+    changed_path = os.path.join(mailbox, 'Chelsea', 'email_002.msg')
+    removed_path = os.path.join(mailbox, 'Liverpool', 'email_003.msg')
+    added_path = os.path.join(mailbox, 'Arsenal', 'email_999.msg')
+    old_changed_id = store.doc_ids[changed_path]
+    old_removed_id = store.doc_ids[removed_path]
+
+    shutil.copy(os.path.join(mailbox, 'Arsenal', 'email_001.msg'), added_path)
+    with open(changed_path, encoding='utf-8') as f:
+        rewrite(changed_path, f.read() + "\nPS: Release clause added.\n")
+    os.remove(removed_path)
+
+    result = sync(store, mailbox)
+    assert sorted(result.removed_ids) == sorted([old_changed_id, old_removed_id])
+    assert len(result.added_ids) == 2
+    # Ids are never reused: the changed file gets a new id and its old slot is emptied
+    assert store.documents[old_changed_id] is None and store.documents[old_removed_id] is None
+    assert store.doc_ids[changed_path] in result.added_ids
+    assert 'Release clause' in store.documents[store.doc_ids[changed_path]]['content']
+    assert removed_path not in store.doc_ids
+    assert store.facts.row(old_removed_id) is None
+    assert len(store.emails_data) == count
+    assert store.version == 2
+
+
+def test_unreadable_file_is_retried_on_the_next_sync(mailbox):
+    store = EmailStore(parse_workers=1)
+    broken_path = os.path.join(mailbox, 'Arsenal', 'email_998.msg')
+    with open(broken_path, 'wb') as f:
+        f.write(b'\xff\xfe not utf-8')
+    result = sync(store, mailbox)
+    assert broken_path in result.errors
+    assert broken_path not in store.manifest.entries
+
+    rewrite(broken_path, "From: a@b.com\nSubject: Fixed\n\nBody\n")
+    result = sync(store, mailbox)
+    assert result.errors == {}
+    assert store.doc_ids[broken_path] in result.added_ids
+
+
+def test_parallel_parse_keeps_file_order(mailbox):
+    items = []
+    for file_path in find_email_files(mailbox, CLUBS):
+        with open(file_path, encoding='utf-8') as f:
+            items.append((file_path, f.read()))
+    serial = [(email.to_dict(), facts) for email, facts, _ in parse_emails(items, workers=1)]
+    parallel = [(email.to_dict(), facts) for email, facts, _ in parse_emails(items, workers=2, chunk_size=4)]
+    assert parallel == serial
+    assert [email['filename'] for email, _ in serial] == [os.path.basename(path) for path, _ in items]
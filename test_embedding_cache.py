@@ -0,0 +1,89 @@
+"""
+Tests for the on-disk embedding cache
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embedding_cache import EmbeddingCache
+
+TEXTS = ["Salah signs a new contract", "Havertz transfer fee agreed", "Saka injury update"]
+
+
+class CountingEncoder:
+    """Deterministic stand-in for a sentence model that records what it encodes"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[len(text), sum(map(ord, text)) % 97, text.count(' ')] for text in texts])
+
+
+def test_only_misses_are_encoded(tmp_path):
+    encoder = CountingEncoder()
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    first = cache.encode(TEXTS[:2], encoder)
+    both = cache.encode(TEXTS, encoder)
+    assert encoder.encoded == TEXTS
+    np.testing.assert_array_equal(both[:2], first)
+    np.testing.assert_array_equal(both, CountingEncoder()(TEXTS))
+
+
+def test_reopened_cache_serves_stored_rows(tmp_path):
+    expected = EmbeddingCache(str(tmp_path), 'model').encode(TEXTS, CountingEncoder())
+    encoder = CountingEncoder()
+    reopened = EmbeddingCache(str(tmp_path), 'model')
+    np.testing.assert_array_equal(reopened.encode(TEXTS, encoder), expected)
+    assert encoder.encoded == []
+
+
+def test_truncated_matrix_is_discarded(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    cache.encode(TEXTS, CountingEncoder())
+    with open(cache.matrix_path, 'r+b') as f:
+        f.truncate(4)
+    encoder = CountingEncoder()
+    reopened = EmbeddingCache(str(tmp_path), 'model')
+    np.testing.assert_array_equal(reopened.encode(TEXTS, encoder), CountingEncoder()(TEXTS))
+    assert encoder.encoded == TEXTS
+
+
+def test_stale_instance_appends_after_another_writer(tmp_path):
+    first = EmbeddingCache(str(tmp_path), 'model')
+    stale = EmbeddingCache(str(tmp_path), 'model')
+    first.encode(TEXTS[:2], CountingEncoder())
+    # stale still maps the empty cache; its append must not overwrite the rows above
+    encoder = CountingEncoder()
+    stale.encode(TEXTS[1:], encoder)
+    assert encoder.encoded == TEXTS[1:]
+
+    encoder = CountingEncoder()
+    reopened = EmbeddingCache(str(tmp_path), 'model')
+    np.testing.assert_array_equal(reopened.encode(TEXTS, encoder), CountingEncoder()(TEXTS))
+    assert encoder.encoded == []
+    assert len(reopened.keys) == len(TEXTS)
+
+
+def append_one_by_one(cache_dir: str, texts):
+    cache = EmbeddingCache(cache_dir, 'model')
+    for text in texts:
+        cache.encode([text], CountingEncoder())
+
+
+def test_concurrent_writers_keep_every_row(tmp_path):
+    shared = [f"shared email {i}" for i in range(10)]
+    batches = [[f"worker {worker} email {i}" for i in range(10)] + shared for worker in range(4)]
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        for future in [pool.submit(append_one_by_one, str(tmp_path), texts) for texts in batches]:
+            future.result()
+
+    texts = sorted({text for batch in batches for text in batch})
+    encoder = CountingEncoder()
+    reopened = EmbeddingCache(str(tmp_path), 'model')
+    np.testing.assert_array_equal(reopened.encode(texts, encoder), CountingEncoder()(texts))
+    assert encoder.encoded == []
+    assert len(reopened.keys) == len(texts)
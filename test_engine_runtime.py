@@ -0,0 +1,55 @@
+"""
+Tests for the read/write lock shared by searches and syncs
+"""
+import threading
+import time
+
+from engine_runtime import ReadWriteLock
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+
+    def reader():
+        with lock.read():
+            # Every reader must be inside at once for the barrier to open
+            inside.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not inside.broken
+
+
+def test_writer_waits_for_readers_and_excludes_them():
+    lock = ReadWriteLock()
+    events = []
+    writing = threading.Event()
+
+    def writer():
+        with lock.write():
+            events.append('write start')
+            writing.set()
+            time.sleep(0.1)
+            events.append('write end')
+
+    def late_reader():
+        with lock.read():
+            events.append('late read')
+
+    with lock.read():
+        write_thread = threading.Thread(target=writer)
+        write_thread.start()
+        time.sleep(0.1)
+        # A waiting writer blocks new readers, so this one queues behind it
+        read_thread = threading.Thread(target=late_reader)
+        read_thread.start()
+        time.sleep(0.1)
+        assert events == []
+    assert writing.wait(5)
+    write_thread.join()
+    read_thread.join()
+    assert events == ['write start', 'write end', 'late read']
@@ -0,0 +1,64 @@
+"""
+Tests for group-by aggregation over the fact table
+"""
+import os
+import shutil
+from collections import defaultdict
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from conftest import CLUBS
+from email_corpus import EmailStore, find_email_files
+from fact_aggregates import FactAggregates
+from fact_table import extract_facts
+
+
+def load_store(mailbox: str) -> EmailStore:
+    store = EmailStore(parse_workers=1)
+    store.sync(find_email_files(mailbox, CLUBS))
+    return store
+
+
+def wages_by_club(store: EmailStore):
+    wages = defaultdict(list)
+    for email in store.emails_data:
+        wage = extract_facts(email).weekly_wage
+        if wage is not None:
+            wages[email.club].append(wage)
+    return wages
+
+
+def test_statistics_match_a_scan(mailbox):
+    store = load_store(mailbox)
+    aggregates = FactAggregates(store)
+    wages = wages_by_club(store)
+
+    assert aggregates.aggregate('club') == {
+        club: float(sum(email.club == club for email in store.emails_data)) for club in CLUBS
+    }
+    assert aggregates.aggregate('club', 'weekly_wage', 'count') == {club: len(wages[club]) for club in CLUBS}
+    assert aggregates.aggregate('club', 'weekly_wage', 'sum') == pytest.approx(
+        {club: sum(wages[club]) for club in CLUBS})
+    assert aggregates.aggregate('club', 'weekly_wage', 'mean') == pytest.approx(
+        {club: sum(wages[club]) / len(wages[club]) for club in CLUBS})
+    assert aggregates.aggregate('club', 'weekly_wage', 'max') == {club: max(wages[club]) for club in CLUBS}
+    assert aggregates.aggregate('club', 'weekly_wage', 'min') == {club: min(wages[club]) for club in CLUBS}
+
+
+def test_results_follow_a_sync(mailbox):
+    store = load_store(mailbox)
+    aggregates = FactAggregates(store)
+    before = aggregates.aggregate('club')
+    shutil.copy(os.path.join(mailbox, 'Chelsea', 'email_001.msg'), os.path.join(mailbox, 'Chelsea', 'email_999.msg'))
+    store.sync(find_email_files(mailbox, CLUBS))
+    assert aggregates.aggregate('club')['Chelsea'] == before['Chelsea'] + 1
+
+
+def test_invalid_arguments_are_rejected(mailbox):
+    aggregates = FactAggregates(load_store(mailbox))
+    with pytest.raises(ValueError):
+        aggregates.aggregate('player')
+    with pytest.raises(ValueError):
+        aggregates.aggregate('club', statistic='sum')
@@ -0,0 +1,63 @@
+"""
+Tests for numeric question parsing and the fact table's range and top-N queries
+"""
+from conftest import CLUBS, EMAILS_DIRECTORY
+from email_corpus import EmailStore, find_email_files
+from fact_table import extract_facts
+from numeric_query import NumericQuery, parse_numeric_query
+
+
+def test_lower_bounds():
+    assert parse_numeric_query("Who earns over £150,000/week?", CLUBS) == NumericQuery(
+        'weekly_wage', low=150000, include_low=False)
+    assert parse_numeric_query("15万ポンド以上の週給", CLUBS) == NumericQuery('weekly_wage', low=150000)
+
+
+def test_between_range_on_fee_scale():
+    assert parse_numeric_query("transfer fee between 40 and 70 million", CLUBS) == NumericQuery(
+        'fee', low=40, high=70)
+    # Euro amounts are compared in GBP millions
+    assert parse_numeric_query("€50 million transfer fee or more", CLUBS).low == 50 * 0.85
+
+
+def test_rankings():
+    assert parse_numeric_query("top 3 goals at Chelsea", CLUBS) == NumericQuery(
+        'goals', top_n=3, club='Chelsea')
+    assert parse_numeric_query("最低の週給", CLUBS) == NumericQuery('weekly_wage', top_n=5, largest=False)
+
+
+def test_non_numeric_questions():
+    assert parse_numeric_query("Mohamed Salah Jr.の契約条件は？", CLUBS) is None
+    # A year is not a bound
+    assert parse_numeric_query("Arsenal contract 2040", CLUBS) is None
+    # Keywords only count as whole words: no "top" in Christopher or Stop, no "most" in Almost
+    assert parse_numeric_query("Christopher Nkunku transfer", CLUBS) is None
+    assert parse_numeric_query("Stop transfer rumours", CLUBS) is None
+    assert parse_numeric_query("Almost 50 goals", CLUBS) is None
+
+
+def load_store() -> EmailStore:
+    store = EmailStore(parse_workers=1)
+    store.sync(find_email_files(EMAILS_DIRECTORY, CLUBS))
+    return store
+
+
+def wages(store: EmailStore):
+    return [(doc_id, extract_facts(email).weekly_wage) for doc_id, email in enumerate(store.documents)
+            if email is not None and extract_facts(email).weekly_wage is not None]
+
+
+def test_range_query_matches_a_scan():
+    store = load_store()
+    expected = sorted((wage, doc_id) for doc_id, wage in wages(store) if 100000 < wage <= 220000)
+    found = store.facts.range_query('weekly_wage', low=100000, high=220000, include_low=False)
+    assert [(value, doc_id) for doc_id, value in found] == expected
+
+
+def test_top_n_by_club():
+    store = load_store()
+    chelsea = [(wage, doc_id) for doc_id, wage in wages(store) if store.documents[doc_id]['club'] == 'Chelsea']
+    found = store.facts.top_n('weekly_wage', 2, club='Chelsea')
+    assert [value for _, value in found] == [wage for wage, _ in sorted(chelsea, reverse=True)[:2]]
+    lowest = store.facts.top_n('weekly_wage', 1, largest=False)
+    assert lowest[0][1] == min(wage for _, wage in wages(store))
@@ -0,0 +1,33 @@
+"""
+Tests for the version-checked LRU of query results
+"""
+from query_cache import CachedResult, QueryCache
+
+RESULT = CachedResult([(3, 2.0), (7, 1.0)], ("answer", "sources"))
+
+
+def test_equivalent_queries_share_an_entry():
+    cache = QueryCache()
+    cache.put(QueryCache.key("Arsenal  salary ", 3, 'count'), 1, RESULT)
+    assert cache.get(QueryCache.key("　Arsenal salary", 3, 'count'), 1) == RESULT
+    assert cache.get(QueryCache.key("Arsenal salary", 3, 'bm25'), 1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_new_corpus_version_empties_the_cache():
+    cache = QueryCache()
+    key = QueryCache.key("Arsenal salary", 3, 'count')
+    cache.put(key, 1, RESULT)
+    assert cache.get(key, 2) is None
+    assert cache.entries == {}
+    # An entry stored under the old version never comes back
+    assert cache.get(key, 1) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    for query in ("a", "b"):
+        cache.put(QueryCache.key(query, 3, 'count'), 1, RESULT)
+    cache.get(QueryCache.key("a", 3, 'count'), 1)
+    cache.put(QueryCache.key("c", 3, 'count'), 1, RESULT)
+    assert [key[0] for key in cache.entries] == ["a", "c"]
@@ -0,0 +1,86 @@
+"""
+Tests for the shared search engine: concurrent syncs and index backends
+"""
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+import email_corpus
+from conftest import CLUBS
+from search_engine import SearchEngine
+
+
+def test_concurrent_syncs_add_a_new_file_once(mailbox, monkeypatch):
+    engine = SearchEngine(mailbox, CLUBS, parse_workers=1)
+    count = len(engine.emails_data)
+    shutil.copy(os.path.join(mailbox, 'Arsenal', 'email_001.msg'), os.path.join(mailbox, 'Arsenal', 'email_999.msg'))
+
+    # Slow parsing down so that both syncs would diff before either applies
+    parse_emails = email_corpus.parse_emails
+
+    def slow_parse_emails(*args, **kwargs):
+        time.sleep(0.2)
+        return parse_emails(*args, **kwargs)
+
+    monkeypatch.setattr(email_corpus, 'parse_emails', slow_parse_emails)
+    threads = [threading.Thread(target=engine.sync) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(engine.emails_data) == count + 1
+    assert sum(email['filename'] == 'email_999.msg' for email in engine.emails_data) == 1
+    assert engine.keyword_index.words.live_count == count + 1
+
+
+def test_searches_run_while_a_sync_parses(mailbox, monkeypatch):
+    engine = SearchEngine(mailbox, CLUBS, parse_workers=1)
+    shutil.copy(os.path.join(mailbox, 'Arsenal', 'email_001.msg'), os.path.join(mailbox, 'Arsenal', 'email_999.msg'))
+    parsing = threading.Event()
+    release = threading.Event()
+    parse_emails = email_corpus.parse_emails
+
+    def blocked_parse_emails(*args, **kwargs):
+        parsing.set()
+        release.wait(5)
+        return parse_emails(*args, **kwargs)
+
+    monkeypatch.setattr(email_corpus, 'parse_emails', blocked_parse_emails)
+    sync = threading.Thread(target=engine.sync)
+    sync.start()
+    assert parsing.wait(5)
+    # The sync holds sync_lock but not the write lock while it parses
+    assert engine.search_emails('Salah', 1)
+    release.set()
+    sync.join()
+
+
+def test_backends_agree_on_the_best_match(mailbox):
+    keyword = SearchEngine(mailbox, CLUBS, parse_workers=1)
+    scan = SearchEngine(mailbox, CLUBS, backend='scan', parse_workers=1)
+    assert keyword.search_emails('Havertz', 1)[0]['filename'] == scan.search_emails('havertz', 1)[0]['filename']
+    with pytest.raises(ValueError):
+        SearchEngine(mailbox, CLUBS, backend='missing')
+
+
+def test_snapshot_from_another_backend_is_reindexed(mailbox, tmp_path):
+    snapshot_path = str(tmp_path / 'engine.snapshot')
+    SearchEngine(mailbox, CLUBS, snapshot_path=snapshot_path, parse_workers=1)
+    scan = SearchEngine(mailbox, CLUBS, snapshot_path=snapshot_path, backend='scan', parse_workers=1)
+    assert type(scan.keyword_index).__name__ == 'ScanIndex'
+    assert scan.keyword_index.doc_count == len(scan.store.documents)
+    assert scan.search_emails('salah', 1)
+
+
+def test_failed_snapshot_write_is_reported_by_the_build(mailbox, tmp_path):
+    blocker = tmp_path / 'not_a_directory'
+    blocker.write_text('')
+    snapshot_path = str(blocker / 'engine.snapshot')
+    engine = SearchEngine(mailbox, CLUBS, snapshot_path=snapshot_path, background=True, parse_workers=1)
+    assert engine.build.wait(10)
+    assert engine.build.ready
+    assert isinstance(engine.build.errors[snapshot_path], OSError)
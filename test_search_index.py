@@ -0,0 +1,92 @@
+"""
+Tests for the keyword index: count and BM25 scores against a direct scan of the sample mailbox
+"""
+import glob
+import math
+import os
+
+import pytest
+
+from conftest import CLUBS, EMAILS_DIRECTORY
+from search_index import BM25_B, BM25_K1, KeywordIndex, tokenize, tokenize_ngrams
+
+SAMPLE_QUERIES = [
+    "Mohamed Salah Jr.の契約条件は？",
+    "Gabriel Fernandez 移籍金",
+    "Arsenal contract salary",
+    "Kai Havertz Jr. transfer",
+    "怪我をしている選手は誰？",
+]
+
+
+@pytest.fixture(scope='module')
+def emails():
+    emails = []
+    for club in CLUBS:
+        for file_path in sorted(glob.glob(os.path.join(EMAILS_DIRECTORY, club, '*.msg'))):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                emails.append({'content': f.read()})
+    return emails
+
+
+def scan_scores(texts, query, mode):
+    """Scores computed straight from each document's tokens, one tokenizer at a time"""
+    scores = {}
+    for tokenizer in (tokenize, tokenize_ngrams):
+        documents = [tokenizer(text) for text in texts]
+        average_length = sum(len(tokens) for tokens in documents) / len(documents)
+        for term in tokenizer(query):
+            containing = sum(term in tokens for tokens in documents)
+            idf = math.log(1 + (len(documents) - containing + 0.5) / (containing + 0.5))
+            for doc_id, tokens in enumerate(documents):
+                freq = tokens.count(term)
+                if not freq:
+                    continue
+                if mode == 'bm25':
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / average_length)
+                    weight = idf * freq * (BM25_K1 + 1) / (freq + norm)
+                else:
+                    weight = freq
+                scores[doc_id] = scores.get(doc_id, 0) + weight
+    return scores
+
+
+@pytest.mark.parametrize('mode', ['count', 'bm25'])
+@pytest.mark.parametrize('query', SAMPLE_QUERIES)
+def test_scores_match_a_scan(emails, query, mode):
+    texts = [email['content'] for email in emails]
+    expected = scan_scores(texts, query, mode)
+    found = dict(KeywordIndex(emails).search(query, top_k=len(texts), mode=mode))
+    assert found.keys() == expected.keys()
+    for doc_id, score in expected.items():
+        assert found[doc_id] == pytest.approx(score)
+
+
+def test_sample_questions_find_their_player(emails):
+    index = KeywordIndex(emails)
+    for query, name in [("Mohamed Salah Jr.の契約条件は？", "Salah"), ("Kai Havertz Jr. transfer", "Havertz")]:
+        for mode in ('count', 'bm25'):
+            doc_id, _ = index.search(query, top_k=1, mode=mode)[0]
+            assert name in emails[doc_id]['content']
+
+
+def test_unknown_mode_is_rejected(emails):
+    with pytest.raises(ValueError):
+        KeywordIndex(emails).search("Arsenal", mode='tfidf')
+
+
+def test_removed_documents_match_a_fresh_index(emails):
+    index = KeywordIndex(emails)
+    for doc_id in (0, 5, 17):
+        index.remove_document(doc_id)
+    index.refresh_statistics()
+    kept = [email for doc_id, email in enumerate(emails) if doc_id not in (0, 5, 17)]
+    fresh = KeywordIndex(kept)
+    # Removed ids stay reserved, so map the fresh index's ids back to the originals
+    original_ids = [doc_id for doc_id in range(len(emails)) if doc_id not in (0, 5, 17)]
+    for query in SAMPLE_QUERIES:
+        found = dict(index.search(query, top_k=len(emails), mode='bm25'))
+        expected = {original_ids[doc_id]: score for doc_id, score in fresh.search(query, len(kept), mode='bm25')}
+        assert found.keys() == expected.keys()
+        for doc_id, score in expected.items():
+            assert found[doc_id] == pytest.approx(score)
@@ -0,0 +1,30 @@
+"""
+Tests that the page's query tokenizer matches search_index's tokenizers
+"""
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from search_index import tokenize, tokenize_ngrams
+from static_search import SEARCH_SCRIPT
+
+QUERIES = [
+    "Mohamed Salah Jr.の契約条件は？",
+    "Gabriel Fernandez 移籍金",
+    "Arsenal contract salary",
+    "Kai Havertz Jr. transfer",
+    "怪我をしている選手は誰？",
+    "週給15万ポンド以上",
+    "ｱｰｾﾅﾙ の Ödegaard, £200,000/week",
+    "移",
+]
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+def test_page_tokenizer_matches_python():
+    script = SEARCH_SCRIPT + f"\nconsole.log(JSON.stringify({json.dumps(QUERIES)}.map(tokenizeQuery)));\n"
+    output = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout
+    for query, tokens in zip(QUERIES, json.loads(output)):
+        assert tokens == tokenize(query) + tokenize_ngrams(query), query
@@ -0,0 +1,41 @@
+"""
+Tests for the FAISS index backends: removing and re-adding documents by id
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+
+from vector_index import build_vector_index, set_search_params, supports_removal
+
+DIMENSION = 16
+
+
+def random_vectors(count: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize('backend', ['flat', 'ivf'])
+def test_removed_ids_stay_gone_and_new_ids_are_found(backend):
+    vectors = random_vectors(400, seed=0)
+    doc_ids = np.arange(100, 500, dtype='int64')
+    index = build_vector_index(vectors, doc_ids, backend=backend, nlist=4)
+    # Probe every list so IVF results are exact
+    set_search_params(index, nprobe=4)
+    assert supports_removal(index)
+
+    removed = doc_ids[::3]
+    index.remove_ids(removed)
+    kept = np.setdiff1d(np.arange(len(doc_ids)), np.arange(0, len(doc_ids), 3))
+    _, found = index.search(vectors[kept], 1)
+    np.testing.assert_array_equal(found[:, 0], doc_ids[kept])
+
+    added = random_vectors(20, seed=1)
+    added_ids = np.arange(1000, 1020, dtype='int64')
+    index.add_with_ids(added, added_ids)
+    _, found = index.search(added, 1)
+    np.testing.assert_array_equal(found[:, 0], added_ids)
+
+    _, found = index.search(vectors, 10)
+    assert not np.isin(found, removed).any()
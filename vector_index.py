@@ -0,0 +1,214 @@
+"""
+FAISS index construction for the semantic search path (CPU only)
+"""
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+# Vector index backends accepted by build_vector_index
+INDEX_BACKENDS = ('flat', 'ivf', 'hnsw', 'sq8', 'pq')
+
+# Backends that store compressed codes and benefit from a float rerank
+QUANTIZED_BACKENDS = ('sq8', 'pq')
+
+# FAISS wants roughly this many training points per IVF list
+TRAIN_POINTS_PER_LIST = 39
+MAX_TRAIN_SAMPLE = 100000
+
+DEFAULT_NPROBE = 8
+DEFAULT_HNSW_M = 32
+DEFAULT_EF_SEARCH = 64
+
+# Dimensions per PQ sub-quantizer (384-d MiniLM -> 48 one-byte codes per vector)
+PQ_DIMS_PER_CODE = 8
+PQ_NBITS = 8
+
+# Quantized search fetches this many times top_k candidates for the float rerank
+DEFAULT_RERANK_FACTOR = 4
+
+
+def default_nlist(num_vectors: int) -> int:
+    """IVF list count: ~4*sqrt(n), capped so every list gets enough training points"""
+    nlist = max(1, int(4 * math.sqrt(num_vectors)))
+    return max(1, min(nlist, num_vectors // TRAIN_POINTS_PER_LIST))
+
+
+def default_pq_m(dimension: int) -> int:
+    """Number of PQ sub-quantizers: the largest divisor of dimension near dimension / PQ_DIMS_PER_CODE"""
+    m = max(1, dimension // PQ_DIMS_PER_CODE)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def pq_nbits(num_vectors: int) -> int:
+    """Bits per PQ code, reduced for corpora too small to train 256 centroids per sub-quantizer"""
+    return max(1, min(PQ_NBITS, int(math.log2(max(num_vectors, 2)))))
+
+
+def build_vector_index(embeddings: np.ndarray, doc_ids: np.ndarray, backend: str = 'flat',
+                       nlist: Optional[int] = None, hnsw_m: int = DEFAULT_HNSW_M,
+                       nprobe: int = DEFAULT_NPROBE, ef_search: int = DEFAULT_EF_SEARCH,
+                       pq_m: Optional[int] = None, seed: int = 0) -> faiss.Index:
+    """Build an inner-product index over L2-normalized embeddings, addressed by doc id
+
+    'flat' is an exact scan, 'ivf' clusters vectors into nlist inverted lists
+    (trained on a random sample) and probes nprobe of them per query, 'hnsw'
+    walks a navigable small-world graph. 'sq8' stores one byte per dimension
+    (4x smaller) and 'pq' splits each vector into pq_m sub-vectors stored as
+    one code each (32x smaller for MiniLM); pair them with rerank().
+    """
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend: {backend}")
+
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+
+    if backend == 'flat':
+        inner = faiss.IndexFlatIP(dimension)
+    elif backend == 'ivf':
+        nlist = nlist or default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatIP(dimension)
+        inner = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        inner.train(training_sample(embeddings, nlist, seed))
+    elif backend == 'hnsw':
+        inner = faiss.IndexHNSWFlat(dimension, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    elif backend == 'sq8':
+        inner = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit,
+                                           faiss.METRIC_INNER_PRODUCT)
+        inner.train(training_sample(embeddings, 1, seed))
+    else:
+        inner = faiss.IndexPQ(dimension, pq_m or default_pq_m(dimension), pq_nbits(num_vectors),
+                              faiss.METRIC_INNER_PRODUCT)
+        inner.train(training_sample(embeddings, 2 ** inner.pq.nbits, seed))
+
+    if backend == 'ivf':
+        # Inverted lists store the doc ids themselves, and removal keeps them in place.
+        # IndexIDMap2 assumes removal renumbers the remaining vectors, as only flat codes do.
+        index = inner
+    else:
+        index = faiss.IndexIDMap2(inner)
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    index.add_with_ids(embeddings, np.asarray(doc_ids, dtype='int64'))
+    return index
+
+
+def training_sample(embeddings: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Random subset of embeddings large enough to train nlist IVF centroids"""
+    sample_size = min(len(embeddings), max(nlist * TRAIN_POINTS_PER_LIST * 4, 10000), MAX_TRAIN_SAMPLE)
+    if sample_size >= len(embeddings):
+        return embeddings
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=sample_size, replace=False)
+    return embeddings[np.sort(rows)]
+
+
+def unwrap_index(index: faiss.Index) -> faiss.Index:
+    """The backend index behind an IndexIDMap wrapper (IVF indexes are not wrapped)"""
+    return faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Tune IVF probes or HNSW search breadth; ignored by backends without them"""
+    inner = unwrap_index(index)
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = nprobe
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+
+def is_quantized(index: faiss.Index) -> bool:
+    """True for scalar- and product-quantized indexes, whose scores are approximate"""
+    return isinstance(unwrap_index(index), (faiss.IndexScalarQuantizer, faiss.IndexPQ))
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """Size of the index's serialized form, a close proxy for its resident memory"""
+    return int(faiss.serialize_index(index).size)
+
+
+def rerank(query_embedding: np.ndarray, candidate_ids: Sequence[int], vectors: np.ndarray,
+           top_k: int) -> List[Tuple[int, float]]:
+    """Re-score candidates by exact inner product with their float vectors
+
+    vectors[i] is the normalized float32 vector of candidate_ids[i]; only
+    this small candidate set is ever held in float form.
+    """
+    if not len(candidate_ids):
+        return []
+    scores = np.asarray(vectors, dtype='float32') @ np.asarray(query_embedding, dtype='float32').reshape(-1)
+    order = np.argsort(-scores)[:top_k]
+    return [(int(candidate_ids[i]), float(scores[i])) for i in order]
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    """HNSW graphs cannot delete vectors; flat, quantized and IVF indexes can"""
+    return not isinstance(unwrap_index(index), faiss.IndexHNSW)
+
+
+def benchmark_backends(embeddings: np.ndarray, query_embeddings: np.ndarray,
+                       configs: List[Dict], top_k: int = 10) -> List[Dict]:
+    """Measure recall@k, per-query latency and index memory of each config against the flat index
+
+    Each config holds build_vector_index keyword arguments, e.g.
+    {'backend': 'ivf', 'nprobe': 4}, plus an optional 'rerank' factor that
+    re-scores rerank * top_k candidates against the float embeddings.
+    """
+    doc_ids = np.arange(len(embeddings), dtype='int64')
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    queries = np.ascontiguousarray(query_embeddings, dtype='float32')
+    top_k = min(top_k, len(embeddings))
+
+    exact = build_vector_index(embeddings, doc_ids, backend='flat')
+    _, truth = exact.search(queries, top_k)
+
+    report = []
+    for config in [{'backend': 'flat'}] + list(configs):
+        build_args = {key: value for key, value in config.items() if key != 'rerank'}
+        rerank_factor = config.get('rerank')
+
+        start = time.perf_counter()
+        index = build_vector_index(embeddings, doc_ids, **build_args)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if rerank_factor:
+            _, candidates = index.search(queries, min(top_k * rerank_factor, len(embeddings)))
+            found = []
+            for query, row in zip(queries, candidates):
+                row = row[row >= 0]
+                found.append([doc_id for doc_id, _ in rerank(query, row, embeddings[row], top_k)])
+        else:
+            _, found = index.search(queries, top_k)
+        search_seconds = time.perf_counter() - start
+
+        hits = sum(len(set(found[i]) & set(truth[i])) for i in range(len(queries)))
+        report.append({
+            'config': config,
+            'recall': hits / (len(queries) * top_k) if len(queries) else 0.0,
+            'latency_ms': 1000 * search_seconds / max(len(queries), 1),
+            'build_seconds': build_seconds,
+            'memory_bytes': index_memory_bytes(index),
+        })
+    return report
+
+
+def format_benchmark(report: List[Dict]) -> str:
+    """Render a benchmark report as a Markdown table, with memory relative to the flat index"""
+    baseline = report[0]['memory_bytes'] if report else 1
+    lines = [
+        "| index | recall@k | latency (ms/query) | build (s) | memory (MB) | vs flat |",
+        "|---|---|---|---|---|---|",
+    ]
+    for row in report:
+        label = ", ".join(f"{key}={value}" for key, value in row['config'].items())
+        memory_mb = row['memory_bytes'] / 2 ** 20
+        ratio = row['memory_bytes'] / baseline if baseline else 0.0
+        lines.append(
+            f"| {label} | {row['recall']:.3f} | {row['latency_ms']:.3f} | {row['build_seconds']:.2f} "
+            f"| {memory_mb:.2f} | {ratio:.0%} |"
+        )
+    return "\n".join(lines)
@@ -1,85 +1,31 @@
 import streamlit as st
-import os
-import glob
-import re
 from typing import List, Dict
 
-class EmailSearchApp:
-    def __init__(self, emails_directory: str):
-        self.emails_directory = emails_directory
-        self.emails_data = []
-        self.load_emails()
-    
-    def load_emails(self):
-        """Load all email files and extract content"""
-        email_files = glob.glob(os.path.join(self.emails_directory, "**/*.msg"), recursive=True)
-        
-        for file_path in email_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                email_data = self.parse_email(content, file_path)
-                self.emails_data.append(email_data)
-            except Exception as e:
-                st.error(f"Error loading {file_path}: {e}")
-    
-    def parse_email(self, content: str, file_path: str) -> Dict:
-        """Parse email content and extract metadata"""
-        lines = content.split('\n')
-        
-        email_data = {
-            'file_path': file_path,
-            'club': os.path.basename(os.path.dirname(file_path)),
-            'filename': os.path.basename(file_path),
-            'content': content,
-            'from': '',
-            'to': '',
-            'subject': '',
-            'date': '',
-            'body': ''
-        }
-        
-        # Extract header information
-        body_start = 0
-        for i, line in enumerate(lines):
-            if line.startswith('From:'):
-                email_data['from'] = line[5:].strip()
-            elif line.startswith('To:'):
-                email_data['to'] = line[3:].strip()
-            elif line.startswith('Subject:'):
-                email_data['subject'] = line[8:].strip()
-            elif line.startswith('Date:'):
-                email_data['date'] = line[5:].strip()
-            elif line.strip() == '' and i > 3:
-                body_start = i + 1
-                break
-        
-        email_data['body'] = '\n'.join(lines[body_start:])
-        return email_data
-    
-    def search_emails(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Simple keyword-based search"""
-        query_words = query.lower().split()
-        results = []
-        
-        for email in self.emails_data:
-            content_lower = email['content'].lower()
-            score = 0
-            
-            # Simple scoring based on keyword matches
-            for word in query_words:
-                if word in content_lower:
-                    score += content_lower.count(word)
-            
-            if score > 0:
-                email_copy = email.copy()
-                email_copy['score'] = score
-                results.append(email_copy)
-        
-        # Sort by score and return top results
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
+from corpus_snapshot import default_snapshot_path
+from engine_runtime import process_memory, show_build_status
+from fact_aggregates import FactAggregates
+from fact_table import Fact, format_money
+from search_engine import SearchEngine
+
+# Names this app's snapshot in the app-owned snapshot directory (corpus_snapshot)
+SNAPSHOT_NAME = "web_app"
+
+class EmailSearchApp(SearchEngine):
+    def __init__(self, emails_directory: str, snapshot_path: str = None, background: bool = False):
+        # Start from the last snapshot; loading then only indexes what changed since
+        super().__init__(emails_directory,
+                         snapshot_path=snapshot_path or default_snapshot_path(emails_directory, SNAPSHOT_NAME),
+                         background=background)
+    
+    def restore(self, snapshot):
+        """Adopt the snapshot and aggregate over its fact table"""
+        super().restore(snapshot)
+        self.aggregates = FactAggregates(self.store)
+    
+    def report_errors(self, errors):
+        """Show files that failed to load on the page"""
+        for file_path, e in errors.items():
+            st.error(f"Error loading {file_path}: {e}")
     
     def generate_answer(self, query: str, search_results: List[Dict]) -> str:
         """Generate answer based on search results"""
@@ -95,11 +41,11 @@ class EmailSearchApp:
             
             # Extract relevant information based on query
             if any(word in query.lower() for word in ['契約', '年俸', 'salary', 'contract']):
-                contract_info = self.extract_contract_info(result['body'])
+                contract_info = self.extract_contract_info(self.facts_for(result))
                 if contract_info:
                     answer += contract_info
             elif any(word in query.lower() for word in ['移籍', 'transfer']):
-                transfer_info = self.extract_transfer_info(result['body'])
+                transfer_info = self.extract_transfer_info(self.facts_for(result))
                 if transfer_info:
                     answer += transfer_info
             else:
@@ -114,72 +60,43 @@ class EmailSearchApp:
         
         return answer
     
-    def extract_contract_info(self, body: str) -> str:
-        """Extract contract-related information"""
+    def extract_contract_info(self, facts: Fact) -> str:
+        """Format the contract-related facts of an email"""
         info = "💼 契約情報:\n"
         found_info = False
         
-        # Extract salary information
-        salary_patterns = [
-            r'£([\d,]+)/week',
-            r'Weekly Wage: £([\d,]+)',
-            r'Base Salary: £([\d,]+) per week'
-        ]
-        
-        for pattern in salary_patterns:
-            match = re.search(pattern, body)
-            if match:
-                info += f"  💰 週給: £{match.group(1)}\n"
-                found_info = True
-                break
+        if facts.weekly_wage is not None:
+            info += f"  💰 週給: £{format_money(facts.weekly_wage)}\n"
+            found_info = True
         
-        # Extract contract duration
-        duration_match = re.search(r'Duration: (\d+) years', body)
-        if duration_match:
-            info += f"  📆 契約期間: {duration_match.group(1)}年\n"
+        if facts.duration is not None:
+            info += f"  📆 契約期間: {facts.duration}年\n"
             found_info = True
         
-        # Extract appearances
-        appearances_match = re.search(r'(\d+) appearances', body)
-        if appearances_match:
-            info += f"  ⚽ 出場試合数: {appearances_match.group(1)}試合\n"
+        if facts.appearances is not None:
+            info += f"  ⚽ 出場試合数: {facts.appearances}試合\n"
             found_info = True
         
-        # Extract goals
-        goals_match = re.search(r'(\d+) goals', body)
-        if goals_match:
-            info += f"  🥅 ゴール数: {goals_match.group(1)}ゴール\n"
+        if facts.goals is not None:
+            info += f"  🥅 ゴール数: {facts.goals}ゴール\n"
             found_info = True
         
-        # Extract assists
-        assists_match = re.search(r'(\d+) assists', body)
-        if assists_match:
-            info += f"  🎯 アシスト数: {assists_match.group(1)}アシスト\n"
+        if facts.assists is not None:
+            info += f"  🎯 アシスト数: {facts.assists}アシスト\n"
             found_info = True
         
         return info if found_info else ""
     
-    def extract_transfer_info(self, body: str) -> str:
-        """Extract transfer-related information"""
-        info = "🔄 移籍情報:\n"
-        found_info = False
-        
-        # Extract transfer fee
-        fee_patterns = [
-            r'Transfer Fee: £([\d,]+) million',
-            r'Fee: £([\d,]+) million',
-            r'€([\d,]+) million'
-        ]
-        
-        for pattern in fee_patterns:
-            match = re.search(pattern, body)
-            if match:
-                currency = "£" if "£" in pattern else "€"
-                info += f"  💵 移籍金: {currency}{match.group(1)} million\n"
-                found_info = True
-                break
-        
-        return info if found_info else ""
+    def extract_transfer_info(self, facts: Fact) -> str:
+        """Format the transfer-related facts of an email"""
+        if facts.fee is None:
+            return ""
+        return f"🔄 移籍情報:\n  💵 移籍金: {facts.currency}{format_money(facts.fee)} million\n"
+
+@st.cache_resource
+def get_email_search_app(emails_directory: str) -> EmailSearchApp:
+    """Create the EmailSearchApp once per process and share it across sessions"""
+    return EmailSearchApp(emails_directory, background=True)
 
 def main():
     st.set_page_config(
@@ -193,27 +110,28 @@ def main():
     st.title("⚽ プレミアリーグ メール検索システム")
     st.markdown("### 2040年のプレミアリーグクラブのメールから選手情報を検索")
     
-    # Initialize the app
-    if 'search_app' not in st.session_state:
-        with st.spinner("📧 メールデータを読み込み中..."):
-            emails_dir = "/root/Desktop/premier_league_emails_2040"
-            st.session_state.search_app = EmailSearchApp(emails_dir)
-        st.success(f"✅ {len(st.session_state.search_app.emails_data)}通のメールを読み込みました")
+    # Initialize the app (shared by every session in this process); emails load in the background
+    search_app = get_email_search_app("/root/Desktop/premier_league_emails_2040")
+    show_build_status(search_app.build, len(search_app.emails_data))
     
     # Sidebar with information
     with st.sidebar:
         st.header("📊 システム情報")
-        if 'search_app' in st.session_state:
-            total_emails = len(st.session_state.search_app.emails_data)
-            clubs = list(set([email['club'] for email in st.session_state.search_app.emails_data]))
-            
-            st.metric("📧 総メール数", total_emails)
-            st.metric("🏟️ 対象クラブ数", len(clubs))
-            
-            st.subheader("🏆 対象クラブ")
-            for club in sorted(clubs):
-                club_emails = len([e for e in st.session_state.search_app.emails_data if e['club'] == club])
-                st.write(f"🔸 **{club}**: {club_emails}通")
+        # The background build may be swapping in a club's emails
+        with search_app.rw_lock.read():
+            total_emails = len(search_app.emails_data)
+            club_counts = search_app.aggregates.aggregate('club')
+        
+        st.metric("📧 総メール数", total_emails)
+        st.metric("🏟️ 対象クラブ数", len(club_counts))
+        
+        st.subheader("🏆 対象クラブ")
+        for club, club_emails in club_counts.items():
+            st.write(f"🔸 **{club}**: {club_emails:g}通")
+        
+        memory = process_memory()
+        st.caption(f"🧠 PID {memory['pid']}: RSS {memory['rss_bytes'] / 2**20:.1f} MB "
+                   f"(ピーク {memory['peak_rss_bytes'] / 2**20:.1f} MB)")
         
         st.markdown("---")
         st.subheader("💡 使い方のヒント")
@@ -265,13 +183,13 @@ def main():
     # Perform search
     if search_clicked and query:
         with st.spinner("🔍 検索中..."):
-            results = st.session_state.search_app.search_emails(query, top_k=3)
+            results = search_app.search_emails(query, top_k=3)
             
             if results:
                 st.success(f"✅ {len(results)}件の関連メールが見つかりました")
                 
                 # Generate and display answer
-                answer = st.session_state.search_app.generate_answer(query, results)
+                answer = search_app.generate_answer(query, results)
                 
                 st.markdown("---")
                 st.subheader("📋 検索結果")